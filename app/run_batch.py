@@ -0,0 +1,194 @@
+# app/run_batch.py
+"""
+批量研究：从 JSONL 读取问题，并发跑同一个已编译的图，结果逐条追加写入 JSONL。
+
+输入每行：{"id": "...", "question": "..."}（也接受 "q" / "input"；缺 id 时用问题文本的哈希）
+输出每行：{"id", "question", "output", "notes", "iterations", "elapsed", "error"}
+
+- 图只编译一次，所有问题共享（节点无状态，LLM / HTTP 客户端进程级复用）
+- --concurrency 控制同时在跑的问题数；LLM 与搜索按全局令牌桶限速（configs/ratelimit.py）
+- 批量运行以 "batch" 优先级取令牌：同进程里的交互式运行排队时，批量请求让行
+- --llm-tpm：LLM 每分钟 token 预算（与 --llm-rps 一起，对应服务商的 RPM/TPM 限额）
+- 可续跑：输出文件里已有成功结果的 id 直接跳过；失败的会重跑（读取时以最后一条为准）
+- --checkpoint：每个问题以 id 为 thread_id 记录检查点，中断的问题从最后完成的节点续跑
+- --trace-dir：每个问题写一份 JSON 轨迹（<id>.json）；--metrics：结束时写出汇总的 Prometheus 指标
+
+用法：
+    python -m app.run_batch --input questions.jsonl --out results.jsonl --concurrency 8 --llm-rps 5 --search-rps 1
+"""
+
+import sys
+import json
+import time
+import hashlib
+import argparse
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional, Set
+
+from chains.research_graph import build_graph, run_config, sqlite_checkpointer
+from chains.instrumentation import RunTracer, prometheus_text
+from configs import ratelimit
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def load_questions(path: str) -> List[Dict[str, str]]:
+    """读取问题 JSONL；跳过空行、无法解析的行和重复的 id（同一 id 共用一个检查点线程，不能并发跑）"""
+    questions: List[Dict[str, str]] = []
+    seen: Set[str] = set()
+    with open(path, "r", encoding="utf-8") as f:
+        for lineno, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                logger.warning(f"Skipping line {lineno}: {e}")
+                continue
+            question = (row.get("question") or row.get("q") or row.get("input") or "").strip()
+            if not question:
+                logger.warning(f"Skipping line {lineno}: no question")
+                continue
+            qid = str(row.get("id") or hashlib.sha1(question.encode("utf-8")).hexdigest()[:12])
+            if qid in seen:
+                logger.warning(f"Skipping line {lineno}: duplicate id {qid}")
+                continue
+            seen.add(qid)
+            questions.append({"id": qid, "question": question})
+    return questions
+
+def completed_ids(path: str) -> Set[str]:
+    """输出文件中已有成功结果的 id（以每个 id 的最后一条记录为准）"""
+    status: Dict[str, bool] = {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    continue  # 上次中断时写了一半的行
+                if "id" in row:
+                    status[str(row["id"])] = not row.get("error")
+    except FileNotFoundError:
+        pass
+    return {qid for qid, ok in status.items() if ok}
+
+def run_one(app, item: Dict[str, str], checkpoint: bool, trace_dir: Optional[str] = None) -> Dict[str, Any]:
+    """跑一个问题（带运行级观测）；trace_dir 给出时写出该问题的 JSON 轨迹"""
+    tracer = RunTracer(item["id"])
+    with tracer, ratelimit.priority("batch"):
+        row = _run_one(app, item, checkpoint)
+        if row["error"]:
+            tracer.status = "error"
+    if trace_dir:
+        tracer.write_json(os.path.join(trace_dir, f"{item['id']}.json"))
+    return row
+
+def _run_one(app, item: Dict[str, str], checkpoint: bool) -> Dict[str, Any]:
+    """跑一个问题；异常被捕获写进结果，不影响其它问题"""
+    t0 = time.perf_counter()
+    config = run_config(item["id"])
+    try:
+        state: Any = {"input": item["question"]}
+        snapshot = app.get_state(config) if checkpoint else None
+        if snapshot is not None and snapshot.values and not snapshot.next:
+            # 该线程已经跑完（例如输出行丢失或换了 --out）：直接用保存的结果，
+            # 重新 invoke 会继承 iter / seen_urls / notes 等旧状态而提前结束
+            logger.info(f"[{item['id']}] already finished; using the checkpointed result")
+            result = snapshot.values
+        else:
+            if snapshot is not None and snapshot.values:
+                logger.info(f"[{item['id']}] resuming at {list(snapshot.next)}")
+                state = None
+            result = app.invoke(state, config=config)
+        return {
+            "id": item["id"],
+            "question": item["question"],
+            "output": result.get("output"),
+            "notes": result.get("notes"),
+            "iterations": result.get("iter"),
+            "elapsed": round(time.perf_counter() - t0, 2),
+            "error": None,
+        }
+    except Exception as e:
+        logger.error(f"[{item['id']}] failed: {e}")
+        return {
+            "id": item["id"],
+            "question": item["question"],
+            "output": None,
+            "notes": None,
+            "iterations": None,
+            "elapsed": round(time.perf_counter() - t0, 2),
+            "error": f"{type(e).__name__}: {e}",
+        }
+
+def run_batch(
+    input_path: str,
+    out_path: str,
+    concurrency: int = 4,
+    checkpoint: bool = False,
+    trace_dir: Optional[str] = None,
+) -> Dict[str, int]:
+    questions = load_questions(input_path)
+    done = completed_ids(out_path)
+    todo = [q for q in questions if q["id"] not in done]
+    logger.info(f"{len(questions)} questions, {len(questions) - len(todo)} already done, {len(todo)} to run")
+    if not todo:
+        return {"total": len(questions), "ran": 0, "failed": 0}
+
+    # 只编译一次，所有并发调用共享
+    app = build_graph(checkpointer=sqlite_checkpointer() if checkpoint else None)
+    write_lock = threading.Lock()
+    failed = 0
+    if trace_dir:
+        os.makedirs(trace_dir, exist_ok=True)
+
+    with open(out_path, "a", encoding="utf-8") as out, \
+            ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="batch") as pool:
+        futures = [pool.submit(run_one, app, item, checkpoint, trace_dir) for item in todo]
+        for n, fut in enumerate(as_completed(futures), 1):
+            row = fut.result()
+            failed += bool(row["error"])
+            with write_lock:
+                out.write(json.dumps(row, ensure_ascii=False) + "\n")
+                out.flush()  # 逐条落盘：中断后已完成的问题不会丢
+            logger.info(f"[{n}/{len(todo)}] {row['id']} {'FAILED' if row['error'] else 'ok'} ({row['elapsed']}s)")
+
+    return {"total": len(questions), "ran": len(todo), "failed": failed}
+
+def main():
+    parser = argparse.ArgumentParser(description="Run many research questions through the graph concurrently.")
+    parser.add_argument("--input", required=True, help="questions JSONL ({id, question} per line)")
+    parser.add_argument("--out", required=True, help="results JSONL (appended; existing successful ids are skipped)")
+    parser.add_argument("--concurrency", type=int, default=4, help="questions in flight at once")
+    parser.add_argument("--llm-rps", type=float, default=None, help="shared LLM requests/second (default: LLM_RATE_LIMIT)")
+    parser.add_argument("--llm-tpm", type=float, default=None, help="shared LLM tokens/minute (default: LLM_TOKENS_RATE_LIMIT * 60)")
+    parser.add_argument("--search-rps", type=float, default=None, help="shared search requests/second (default: SEARCH_RATE_LIMIT)")
+    parser.add_argument("--checkpoint", action="store_true", help="checkpoint each question so interrupted ones resume mid-run")
+    parser.add_argument("--trace-dir", help="write a JSON trace per question (<id>.json) into this directory")
+    parser.add_argument("--metrics", metavar="PATH", help="write Prometheus-format counters/histograms for the batch")
+    args = parser.parse_args()
+
+    if args.llm_rps is not None:
+        ratelimit.configure("llm", args.llm_rps)
+    if args.llm_tpm is not None:
+        ratelimit.configure("llm_tokens", args.llm_tpm / 60, burst=args.llm_tpm / 6 or None)
+    if args.search_rps is not None:
+        ratelimit.configure("search", args.search_rps)
+
+    stats = run_batch(
+        args.input, args.out, concurrency=args.concurrency, checkpoint=args.checkpoint, trace_dir=args.trace_dir
+    )
+    if args.metrics:
+        with open(args.metrics, "w", encoding="utf-8") as f:
+            f.write(prometheus_text())
+    print(json.dumps(stats))
+    if stats["failed"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,175 @@
 # app/run_graph.py
+import sys
+import json
+import time
+import uuid
 import argparse
 import logging
-from chains.research_graph import build_graph
+from typing import Any, Dict, Iterator, Optional
+
+from chains.research_graph import build_graph, render_sections, run_config, sqlite_checkpointer
+from chains.instrumentation import RunTracer, prometheus_text
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--q", required=True, help="research question")
-    args = parser.parse_args()
+def _node_counts(update: Dict[str, Any]) -> Dict[str, Any]:
+    """从节点写入的状态里提取便于展示的计数"""
+    counts: Dict[str, Any] = {}
+    for key in ("queries", "search_results", "selected_urls", "chunks"):
+        if isinstance(update.get(key), list):
+            counts[key] = len(update[key])
+    if isinstance(update.get("notes"), dict):
+        counts["claims"] = len(update["notes"].get("claims") or [])
+    if "need_more_evidence" in update:
+        counts["need_more_evidence"] = bool(update["need_more_evidence"])
+    if "iter" in update:
+        counts["iter"] = update["iter"]
+    return counts
+
+def stream_events(app, state: Optional[Dict[str, Any]], config: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """
+    以事件流的形式执行图（LangGraph stream_mode="debug"：每个节点开始/结束各一条）；
+    state 为 None 时从检查点续跑。事件：
+    - node_start / node_end（含耗时与计数）
+    - partial：每次 synthesize 之后的草稿 Markdown（最早可用的结果）
+    - markdown：write 节点产出的报告，按章节逐段发送
+    - done（含完整 output）或 error
+    """
+    t0 = time.perf_counter()
+    started: Dict[str, float] = {}
+    final: Dict[str, Any] = dict(state) if state is not None else dict(app.get_state(config).values or {})
 
-    app = build_graph()
-    # 初始状态
-    state = {"input": args.q}
+    def _t() -> float:
+        return round(time.perf_counter() - t0, 3)
+
+    try:
+        for ev in app.stream(state, config=config, stream_mode="debug"):
+            payload = ev.get("payload") or {}
+            node = payload.get("name")
+            if ev.get("type") == "task":
+                started[payload.get("id")] = time.perf_counter()
+                yield {"event": "node_start", "node": node, "step": ev.get("step"), "t": _t()}
+                continue
+            if ev.get("type") != "task_result":
+                continue
+
+            # 只保留写入状态字段的部分（过滤条件边等内部通道）
+            update = {k: v for k, v in (payload.get("result") or []) if ":" not in k}
+            final.update(update)
+            start = started.pop(payload.get("id"), time.perf_counter())
+            yield {
+                "event": "node_end",
+                "node": node,
+                "step": ev.get("step"),
+                "t": _t(),
+                "duration": round(time.perf_counter() - start, 3),
+                "counts": _node_counts(update),
+            }
+            if node == "synthesize" and isinstance(update.get("notes"), dict):
+                yield {"event": "partial", "t": _t(), "markdown": "\n".join(render_sections(update["notes"]))}
+            if node == "write":
+                for section in render_sections(final.get("notes") or {}):
+                    yield {"event": "markdown", "t": _t(), "text": section}
+    except Exception as e:
+        logger.error(f"Graph execution failed: {e}")
+        yield {"event": "error", "t": _t(), "error": str(e)}
+        return
+
+    yield {"event": "done", "t": _t(), "output": final.get("output")}
+
+def _print_event(ev: Dict[str, Any]) -> None:
+    """人类可读模式：进度写 stderr，报告写 stdout"""
+    kind = ev["event"]
+    if kind == "node_start":
+        print(f"[{ev['t']:7.2f}s] > {ev['node']}", file=sys.stderr, flush=True)
+    elif kind == "node_end":
+        counts = " ".join(f"{k}={v}" for k, v in ev["counts"].items())
+        print(f"[{ev['t']:7.2f}s] < {ev['node']} ({ev['duration']:.2f}s) {counts}", file=sys.stderr, flush=True)
+    elif kind == "partial":
+        print(f"[{ev['t']:7.2f}s] draft:\n{ev['markdown']}", file=sys.stderr, flush=True)
+    elif kind == "markdown":
+        print(ev["text"], flush=True)
+    elif kind == "error":
+        print(f"Error: {ev['error']}", flush=True)
+
+def _run(app, state: Optional[Dict[str, Any]], config: Dict[str, Any], args, run_id: str) -> bool:
+    """执行一次运行并输出结果；失败返回 False"""
+    if args.stream:
+        ok = True
+        for ev in stream_events(app, state, config):
+            ok = ok and ev["event"] != "error"
+            if args.jsonl:
+                print(json.dumps(ev, ensure_ascii=False), flush=True)
+            else:
+                _print_event(ev)
+        return ok
 
     try:
         # 增加递归限制并提供更详细的配置
-        result = app.invoke(state, config={"recursion_limit": 20})  # 增加递归限制
+        result = app.invoke(state, config=config)
         print(result.get("output") or result)
+        return True
     except Exception as e:
         logger.error(f"Graph execution failed: {e}")
         # 输出当前状态以便调试
         print(f"Error: {e}")
         print("Current state:", state)
+        if not args.no_checkpoint:
+            print(f"Resume with: --resume {run_id}")
+        return False
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--q", help="research question")
+    parser.add_argument("--stream", action="store_true", help="stream per-node progress and the report as it is produced")
+    parser.add_argument("--jsonl", action="store_true", help="with --stream: print events as JSON lines on stdout")
+    parser.add_argument("--run-id", help="id for a new run (default: random); used to resume it later")
+    parser.add_argument("--resume", metavar="RUN_ID", help="resume an interrupted run from its last completed node")
+    parser.add_argument("--no-checkpoint", action="store_true", help="do not record checkpoints for this run")
+    parser.add_argument("--trace", metavar="PATH", help="write a JSON trace (per-node timings, LLM tokens, fetch/cache stats)")
+    parser.add_argument("--metrics", metavar="PATH", help="write Prometheus-format counters/histograms for the run")
+    args = parser.parse_args()
+    if not args.q and not args.resume:
+        parser.error("--q is required unless --resume is given")
+    if args.resume and args.no_checkpoint:
+        parser.error("--resume needs checkpoints")
+
+    app = build_graph(checkpointer=None if args.no_checkpoint else sqlite_checkpointer())
+    run_id = args.resume or args.run_id or uuid.uuid4().hex[:12]
+    config = run_config(run_id)  # 增加递归限制；thread_id 区分各次运行
+
+    # 初始状态；续跑时传 None，LangGraph 从该 run 的最后一个检查点继续
+    state: Optional[Dict[str, Any]] = {"input": args.q}
+    if args.resume:
+        snapshot = app.get_state(config)
+        if not snapshot.values:
+            parser.error(f"no checkpoint found for run {run_id}")
+        if not snapshot.next:
+            # 已经跑完：直接输出保存的结果
+            print(snapshot.values.get("output") or snapshot.values)
+            return
+        logger.info(f"Resuming run {run_id} at {list(snapshot.next)}")
+        state = None
+    elif not args.no_checkpoint:
+        # 已有检查点的 run id 不能直接复用：新问题会继承旧的 iter / notes / evidence
+        if args.run_id and app.get_state(config).values:
+            parser.error(f"run {run_id} already has checkpoints; use --resume {run_id} or pick another --run-id")
+        print(f"run id: {run_id} (resume with --resume {run_id})", file=sys.stderr, flush=True)
+
+    tracer = RunTracer(run_id)
+    with tracer:
+        if not _run(app, state, config, args, run_id):
+            tracer.status = "error"
+
+    if args.trace:
+        tracer.write_json(args.trace)
+        totals = " ".join(f"{k}={v['seconds']:.2f}s" for k, v in tracer.trace()["node_totals"].items())
+        print(f"trace: {args.trace} ({totals})", file=sys.stderr, flush=True)
+    if args.metrics:
+        with open(args.metrics, "w", encoding="utf-8") as f:
+            f.write(prometheus_text())
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,337 @@
+# chains/instrumentation.py
+"""
+研究图的运行级观测（LangChain 回调 + configs/telemetry 底层事件）
+- RunTracer：回调处理器；`with tracer:` 期间，该上下文里的所有 LangChain 运行自动挂上它
+  （register_configure_hook，无需改 config），抓取 / 缓存事件经 configs.telemetry 汇入
+- 记录：每个节点每轮的耗时、各调用点（plan / synthesize / summarize_docs）的 LLM 调用次数、
+  prompt / completion token 与费用、抓取字节数、缓存命中 / 未命中、工具错误
+- 导出：tracer.trace() 为单次运行的 JSON 轨迹；运行结束时汇总进进程级 METRICS，
+  prometheus_text() 输出 Prometheus 文本格式（counter + histogram）
+
+用法：
+    tracer = RunTracer(run_id)
+    with tracer:
+        app.invoke(state, config=run_config(run_id))   # 异步图：await app.ainvoke(...)
+    tracer.write_json("trace.json")
+    print(prometheus_text())
+"""
+
+from __future__ import annotations
+
+import os
+import json
+import time
+import bisect
+import threading
+import contextvars
+from contextlib import ExitStack
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from langchain_core.tracers.context import register_configure_hook
+
+from configs.telemetry import bind
+
+# 每 1K token 的价格（美元），用于估算费用；默认 0 = 不计费
+LLM_PRICE_PROMPT_PER_1K = float(os.getenv("LLM_PRICE_PROMPT_PER_1K", "0"))
+LLM_PRICE_COMPLETION_PER_1K = float(os.getenv("LLM_PRICE_COMPLETION_PER_1K", "0"))
+
+_SITE_ALIASES = {"plan_node": "plan"}  # 节点名 -> 调用点名
+
+# 当前上下文的 tracer；注册后 LangChain 会把它加进该上下文里每次运行的回调
+_ACTIVE_TRACER: contextvars.ContextVar[Optional["RunTracer"]] = contextvars.ContextVar(
+    "rc_run_tracer", default=None
+)
+register_configure_hook(_ACTIVE_TRACER, inheritable=True)
+
+
+# -------------------- 进程级指标（Prometheus 文本格式） --------------------
+_DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_HELP = {
+    "rc_runs_total": ("counter", "Graph runs by final status."),
+    "rc_node_duration_seconds": ("histogram", "Wall time per graph node execution."),
+    "rc_llm_calls_total": ("counter", "LLM calls by call site (cached = served from the LLM cache)."),
+    "rc_llm_tokens_total": ("counter", "LLM tokens by call site and kind (prompt / completion)."),
+    "rc_llm_cost_usd_total": ("counter", "Estimated LLM cost by call site."),
+    "rc_llm_duration_seconds": ("histogram", "LLM call latency by call site."),
+    "rc_fetch_bytes_total": ("counter", "Response bytes fetched."),
+    "rc_cache_events_total": ("counter", "Cache lookups by cache and result (hit / miss)."),
+    "rc_tool_errors_total": ("counter", "Tool failures by tool."),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class MetricsRegistry:
+    """线程安全的 counter / histogram 集合（不依赖 prometheus_client）。"""
+
+    def __init__(self, buckets: Sequence[float] = _DURATION_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, List[float]]] = {}  # 各桶计数 + [+Inf, sum]
+
+    def inc(self, name: str, value: float = 1.0, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            counts = series.setdefault(key, [0.0] * (len(self.buckets) + 2))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+    def render(self) -> str:
+        """Prometheus 文本格式（exposition format 0.0.4）"""
+        with self._lock:
+            counters = {k: dict(v) for k, v in self._counters.items()}
+            histograms = {k: {lk: list(c) for lk, c in v.items()} for k, v in self._histograms.items()}
+
+        lines: List[str] = []
+        for name in sorted(set(counters) | set(histograms)):
+            kind, text = _HELP.get(name, ("histogram" if name in histograms else "counter", ""))
+            lines += [f"# HELP {name} {text}", f"# TYPE {name} {kind}"]
+            for labels, value in sorted(counters.get(name, {}).items()):
+                lines.append(f"{name}{_fmt_labels(labels)} {_fmt_value(value)}")
+            for labels, counts in sorted(histograms.get(name, {}).items()):
+                cumulative = 0.0
+                for le, n in zip([*self.buckets, "+Inf"], counts[:-1]):
+                    cumulative += n
+                    lines.append(f"{name}_bucket{_fmt_labels(labels + (('le', str(le)),))} {_fmt_value(cumulative)}")
+                lines.append(f"{name}_sum{_fmt_labels(labels)} {_fmt_value(counts[-1])}")
+                lines.append(f"{name}_count{_fmt_labels(labels)} {_fmt_value(cumulative)}")
+        return "\n".join(lines) + "\n"
+
+    def record_run(self, trace: Dict[str, Any]) -> None:
+        """把一次运行的轨迹累加进各指标"""
+        self.inc("rc_runs_total", status=trace["status"])
+        for n in trace["nodes"]:
+            self.observe("rc_node_duration_seconds", n["duration"], node=n["node"])
+        for site, s in trace["llm"].items():
+            self.inc("rc_llm_calls_total", s["calls"] - s["cached"], site=site, cached="false")
+            self.inc("rc_llm_calls_total", s["cached"], site=site, cached="true")
+            self.inc("rc_llm_tokens_total", s["prompt_tokens"], site=site, kind="prompt")
+            self.inc("rc_llm_tokens_total", s["completion_tokens"], site=site, kind="completion")
+            self.inc("rc_llm_cost_usd_total", s["cost_usd"], site=site)
+            for d in s["durations"]:
+                self.observe("rc_llm_duration_seconds", d, site=site)
+        self.inc("rc_fetch_bytes_total", trace["fetch"]["bytes"])
+        for cache, s in trace["cache"].items():
+            self.inc("rc_cache_events_total", s["hits"], cache=cache, result="hit")
+            self.inc("rc_cache_events_total", s["misses"], cache=cache, result="miss")
+        for tool, n in trace["errors"].items():
+            self.inc("rc_tool_errors_total", n, tool=tool)
+
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels) + "}"
+
+
+def _fmt_value(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+
+METRICS = MetricsRegistry()
+
+
+def prometheus_text() -> str:
+    """进程内所有已结束运行的汇总指标"""
+    return METRICS.render()
+
+
+# -------------------- 单次运行的轨迹 --------------------
+def _usage(response: LLMResult) -> Tuple[int, int]:
+    """(prompt_tokens, completion_tokens)：优先 message.usage_metadata，其次 llm_output.token_usage"""
+    prompt = completion = 0
+    for gens in response.generations:
+        for g in gens:
+            usage = getattr(getattr(g, "message", None), "usage_metadata", None) or {}
+            prompt += usage.get("input_tokens", 0) or 0
+            completion += usage.get("output_tokens", 0) or 0
+    if not (prompt or completion):
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        prompt = usage.get("prompt_tokens", 0) or 0
+        completion = usage.get("completion_tokens", 0) or 0
+    return prompt, completion
+
+
+def _is_cached(response: LLMResult, run_id: UUID) -> bool:
+    """缓存命中的结果带着原始运行的 message id（新请求的 id 以 "run-<本次 run_id>" 开头）"""
+    ids = [getattr(getattr(g, "message", None), "id", None) for gens in response.generations for g in gens]
+    return bool(ids) and all(i and not i.startswith(f"run-{run_id}") for i in ids)
+
+
+class RunTracer(BaseCallbackHandler):
+    """
+    记录一次图运行的耗时、token、抓取与缓存情况。
+
+    Args:
+        run_id: 运行标识（写进轨迹，通常与 thread_id 相同）
+        registry: 运行结束时汇总到的指标集合，默认进程级 METRICS；传 None 以外的对象可隔离统计
+    """
+
+    run_inline = True  # 记录很轻，直接在触发处执行（异步运行也不必切到线程池）
+
+    def __init__(self, run_id: str = "", registry: Optional[MetricsRegistry] = None):
+        self.run_id = run_id
+        self.registry = registry if registry is not None else METRICS
+        self.status = "pending"
+        self.started_at: Optional[float] = None
+        self.elapsed: Optional[float] = None
+        self._t0 = 0.0
+        self._lock = threading.Lock()
+        self._stack: Optional[ExitStack] = None
+        self._open_nodes: Dict[UUID, Tuple[str, int, int, float]] = {}
+        self._open_llm: Dict[UUID, Tuple[str, float]] = {}
+        self.nodes: List[Dict[str, Any]] = []
+        self.llm: Dict[str, Dict[str, Any]] = {}
+        self.fetch = {"responses": 0, "bytes": 0}
+        self.cache: Dict[str, Dict[str, int]] = {}
+        self.errors: Dict[str, int] = {}
+
+    # ---------- 绑定到当前上下文 ----------
+    def __enter__(self) -> "RunTracer":
+        self._t0 = time.perf_counter()
+        self.started_at = time.time()
+        self.status = "running"
+        self._stack = ExitStack()
+        self._stack.enter_context(bind(self._on_event))
+        token = _ACTIVE_TRACER.set(self)
+        self._stack.callback(_ACTIVE_TRACER.reset, token)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if self._stack is not None:
+            self._stack.close()
+            self._stack = None
+        self.elapsed = time.perf_counter() - self._t0
+        if exc_type is not None:
+            self.status = "error"
+        elif self.status == "running":
+            self.status = "ok"  # 调用方自行捕获的失败可在退出前把 status 设为 "error"
+        self.registry.record_run(self.trace())
+
+    # ---------- configs.telemetry 事件 ----------
+    def _on_event(self, kind: str, name: str, value: float) -> None:
+        with self._lock:
+            if kind == "fetch_bytes":
+                self.fetch["responses"] += 1
+                self.fetch["bytes"] += int(value)
+            elif kind in ("cache_hit", "cache_miss"):
+                s = self.cache.setdefault(name, {"hits": 0, "misses": 0})
+                s["hits" if kind == "cache_hit" else "misses"] += int(value)
+            elif kind == "tool_error":
+                self.errors[name] = self.errors.get(name, 0) + int(value)
+
+    # ---------- 节点 ----------
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, tags=None, metadata=None, **kwargs):
+        node = (metadata or {}).get("langgraph_node")
+        # 节点级运行：名字等于节点名且带 graph:step 标签（节点内部的子链不计）
+        if not node or node.startswith("__") or kwargs.get("name") != node:
+            return
+        if not any(t.startswith("graph:step:") for t in tags or []):
+            return
+        iteration = inputs.get("iter", 0) if isinstance(inputs, dict) else 0
+        step = (metadata or {}).get("langgraph_step", 0)
+        with self._lock:
+            self._open_nodes[run_id] = (node, iteration or 0, step, time.perf_counter())
+
+    def _close_node(self, run_id: UUID, error: Optional[BaseException] = None) -> None:
+        with self._lock:
+            opened = self._open_nodes.pop(run_id, None)
+            if opened is None:
+                return
+            node, iteration, step, start = opened
+            self.nodes.append({
+                "node": node,
+                "iter": iteration,
+                "step": step,
+                "start": round(start - self._t0, 4),
+                "duration": round(time.perf_counter() - start, 4),
+                "error": f"{type(error).__name__}: {error}" if error else None,
+            })
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._close_node(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._close_node(run_id, error)
+
+    # ---------- LLM ----------
+    def _site(self, metadata: Optional[Dict[str, Any]]) -> str:
+        md = metadata or {}
+        site = md.get("call_site") or md.get("langgraph_node") or "other"
+        return _SITE_ALIASES.get(site, site)
+
+    def _llm_stats(self, site: str) -> Dict[str, Any]:
+        return self.llm.setdefault(site, {
+            "calls": 0, "cached": 0, "errors": 0,
+            "prompt_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0, "durations": [],
+        })
+
+    def on_llm_start(self, serialized, prompts, *, run_id, metadata=None, **kwargs):
+        with self._lock:
+            self._open_llm[run_id] = (self._site(metadata), time.perf_counter())
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        self.on_llm_start(serialized, [], run_id=run_id, metadata=metadata, **kwargs)
+
+    def on_llm_end(self, response: LLMResult, *, run_id, **kwargs):
+        with self._lock:
+            site, start = self._open_llm.pop(run_id, ("other", time.perf_counter()))
+            s = self._llm_stats(site)
+            s["calls"] += 1
+            s["durations"].append(round(time.perf_counter() - start, 4))
+            if _is_cached(response, run_id):
+                s["cached"] += 1  # 缓存命中不产生 token 费用
+                return
+            prompt, completion = _usage(response)
+            s["prompt_tokens"] += prompt
+            s["completion_tokens"] += completion
+            s["cost_usd"] += (prompt * LLM_PRICE_PROMPT_PER_1K + completion * LLM_PRICE_COMPLETION_PER_1K) / 1000
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            site, _ = self._open_llm.pop(run_id, ("other", 0.0))
+            self._llm_stats(site)["errors"] += 1
+            self.errors[f"llm:{site}"] = self.errors.get(f"llm:{site}", 0) + 1
+
+    # ---------- 导出 ----------
+    def trace(self) -> Dict[str, Any]:
+        """单次运行的 JSON 轨迹（含按节点汇总的总耗时，便于看出瓶颈节点）"""
+        with self._lock:
+            nodes = sorted(self.nodes, key=lambda n: n["start"])
+            by_node: Dict[str, Dict[str, float]] = {}
+            for n in nodes:
+                agg = by_node.setdefault(n["node"], {"count": 0, "seconds": 0.0})
+                agg["count"] += 1
+                agg["seconds"] = round(agg["seconds"] + n["duration"], 4)
+            return {
+                "run_id": self.run_id,
+                "status": self.status,
+                "started_at": self.started_at,
+                "elapsed": round(self.elapsed if self.elapsed is not None else time.perf_counter() - self._t0, 4),
+                "nodes": nodes,
+                "node_totals": by_node,
+                "llm": {site: {**s, "durations": list(s["durations"])} for site, s in self.llm.items()},
+                "fetch": dict(self.fetch),
+                "cache": {k: dict(v) for k, v in self.cache.items()},
+                "errors": dict(self.errors),
+            }
+
+    def write_json(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.trace(), f, ensure_ascii=False, indent=2)
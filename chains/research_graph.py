@@ -1,8 +1,16 @@
 # chains/research_graph.py
 from __future__ import annotations
 import os
+import re
 import json
-from typing import TypedDict, List, Dict, Any
+import math
+import asyncio
+import hashlib
+import functools
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed, wait
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from typing import TypedDict, List, Dict, Any, Tuple
 from urllib.parse import urlparse
 import logging
 
@@ -10,12 +18,19 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from langgraph.graph import StateGraph, END
+from langgraph.checkpoint.sqlite import SqliteSaver
 from langchain_openai import ChatOpenAI
 
 # 复用你已有工具
 from tools.web import web_search       # Tool
-from tools.docsum import read_html     # 函数，返回 Document[]
-from tools.synth import synth_notes_tool  # Tool
+from tools.docsum import aread_html, aread_html_many, read_html, read_html_many  # 并发抓取，返回 Document[] 列表
+from tools.fetch import FETCH_DEADLINE, FetchError
+from tools.synth import asynthesize_notes, notes_to_json, synth_notes_tool  # Tool
+from tools.context_pack import pack_context
+from tools.local_rag import local_hits
+from configs.llm import get_chat_model
+from configs.telemetry import emit
+from tools.cache import cache_path, connect
 
 # 配置日志
 logger = logging.getLogger(__name__)
@@ -24,6 +39,12 @@ logger = logging.getLogger(__name__)
 使用已实现的工具：web_search、read_html、synth_notes_tool；
 DeepSeek 作为 LLM；
 含 decide 回环规则（条件边严格返回 path key）
+build_graph() 为同步图；build_async_graph() 为同一拓扑的异步图（ainvoke / astream），
+一个事件循环即可同时承载大量运行，适合部署在 API 服务后面
+pipelined=True（或 GRAPH_PIPELINED=1）时 search/select/read 合并为流水线 gather 节点：
+搜索结果边到边选，新域名的首选 URL 推测性预取，网络阶段互相重叠
+hybrid=True（或 GRAPH_HYBRID=1）时先查本地语料（tools/local_rag）：覆盖度足够就不走网页，
+否则本地片段与网页 chunks 合并，引用为 file:// 链接
 """
 
 # -------------------- 状态定义 --------------------
@@ -34,6 +55,7 @@ class ResearchState(TypedDict, total=False):
     search_results: List[Dict[str, Any]]  # 搜索结果（title/url/snippet）
     selected_urls: List[str]         # 选中的若干 URL
     chunks: List[str]                # 读取到的文本分块（字符串）
+    chunk_sources: List[str]         # 与 chunks 对齐的来源 URL（用于上下文打包的来源多样性）
     sources: List[str]               # 用于引用的 URL 列表
     notes_json: str                  # 结构化 JSON（字符串）
     notes: Dict[str, Any]            # 结构化 JSON（对象）
@@ -43,26 +65,39 @@ class ResearchState(TypedDict, total=False):
     seen_urls: List[str]             # 已见过的证据 URL（用于"有无进展"判断）
     debug_decide: Dict[str, Any]     # 调试信息
     no_progress_count: int           # 连续无进展计数
+    evidence: Dict[str, Any]         # 本次运行的证据库：urls{url: [chunk_hash]}、chunks{hash: text}、synthesized[hash]
+    local_urls: List[str]            # 本轮相关的本地命中（file:// 引用），read 时与网页 chunks 合并
+    local_sufficient: bool           # 本地证据已足够，本轮跳过 select/read
 
-def _llm() -> ChatOpenAI:
-    return ChatOpenAI(
-        model="deepseek-chat",
-        api_key=os.getenv("DEEPSEEK_API_KEY"),
-        base_url="https://api.deepseek.com",
-        temperature=0.2,
-        max_tokens=300
-    )
+def _llm(cache: bool = True) -> ChatOpenAI:
+    # 进程级复用的客户端（共享连接池）；相同 prompt + 参数直接命中缓存，cache=False 关闭
+    return get_chat_model("deepseek", temperature=0.2, max_tokens=300, cache=cache)
 
 # -------------------- decide iteration control --------------------
 MAX_ITERS = 5  # 兜底的最大回环次数
 MAX_NO_PROGRESS = 2  # 连续无进展的最大次数
 
+# -------------------- search fan-out --------------------
+MAX_QUERIES = 3  # 每轮最多执行的查询数
+SEARCH_CONCURRENCY = int(os.getenv("SEARCH_CONCURRENCY", "3"))  # 并发上限；1 = 串行（旧行为）
+SEARCH_QUERY_TIMEOUT = float(os.getenv("SEARCH_QUERY_TIMEOUT", "15"))  # 单条查询超时（秒）
+GRAPH_PIPELINED = os.getenv("GRAPH_PIPELINED", "0") == "1"  # =1 时启用流水线 gather 节点，代替 search/select/read
+PIPELINE_PREFETCH_MAX = int(os.getenv("PIPELINE_PREFETCH_MAX", "4"))  # 流水线模式每轮最多推测抓取的 URL 数
+GRAPH_HYBRID = os.getenv("GRAPH_HYBRID", "0") == "1"  # =1 时启用本地优先的混合检索分支
+LOCAL_TOP_K = int(os.getenv("LOCAL_TOP_K", "4"))  # 问题与每条查询各取的本地命中数
+LOCAL_MIN_HITS = int(os.getenv("LOCAL_MIN_HITS", "3"))  # 跳过 Web 至少需要的相关本地片段数
+LOCAL_MIN_COVERAGE = float(os.getenv("LOCAL_MIN_COVERAGE", "0.7"))  # 跳过 Web 需要的问题词覆盖率
+
 def _safe_int(x, default=0):
     return x if isinstance(x, int) and x >= 0 else default
 
 def _extract_domains(urls: List[str]) -> set[str]:
     doms: List[str] = []
     for u in urls:
+        if u.startswith("file://"):
+            # 本地文档没有域名：每个文件算一个来源（local:<文件名>），参与来源多样性判断
+            doms.append("local:" + os.path.basename(urlparse(u).path).lower())
+            continue
         try:
             netloc = urlparse(u).netloc.lower()
             if netloc.startswith("www."):
@@ -73,12 +108,23 @@ def _extract_domains(urls: List[str]) -> set[str]:
             continue
     return set(doms)
 
+# -------------------- 证据库（跨轮复用已读内容） --------------------
+def _chunk_hash(text: str) -> str:
+    return hashlib.sha256(" ".join(text.split()).encode("utf-8")).hexdigest()[:16]
+
+def _evidence(state: ResearchState) -> Dict[str, Any]:
+    """取出证据库的副本（节点返回新对象，不原地修改 state）。"""
+    ev = state.get("evidence") or {}
+    return {
+        "urls": dict(ev.get("urls") or {}),          # 已读过的 URL -> chunk 哈希（读取失败为空列表）
+        "chunks": dict(ev.get("chunks") or {}),      # chunk 哈希 -> 文本
+        "synthesized": list(ev.get("synthesized") or []),  # 已送入综合的 chunk 哈希
+    }
+
 # -------------------- 各节点 --------------------
-def plan(state: ResearchState) -> ResearchState:
-    """生成简单计划 + 搜索词"""
+def _plan_prompt(state: ResearchState) -> str:
     q = (state.get("input") or "").strip()
-    llm = _llm()
-    
+
     # 根据迭代次数调整搜索策略
     iteration = _safe_int(state.get("iter"), 0)
     if iteration == 0:
@@ -97,8 +143,11 @@ def plan(state: ResearchState) -> ResearchState:
             f"User question: {q}\n"
             "Return only one search query per line, without any explanation."
         )
-    
-    resp_lines = llm.invoke(prompt).content.strip().splitlines()
+    return prompt
+
+def _plan_update(state: ResearchState, content: str) -> ResearchState:
+    q = (state.get("input") or "").strip()
+    resp_lines = content.strip().splitlines()
     # 基础兜底
     queries = [s.strip(" -•\t") for s in resp_lines if s.strip()] or [q, f"{q} official", f"{q} tutorial"]
 
@@ -121,38 +170,81 @@ def plan(state: ResearchState) -> ResearchState:
         "no_progress_count": state.get("no_progress_count") or 0
     }
 
+def plan(state: ResearchState) -> ResearchState:
+    """生成简单计划 + 搜索词"""
+    return _plan_update(state, _llm().invoke(_plan_prompt(state)).content)
+
+def _search_one(qi: str) -> List[Dict[str, Any]]:
+    """执行单条查询，统一把返回值规整为 list"""
+    out = web_search.invoke({"query": qi, "k": 5})  # 返回 JSON 字符串或对象（取决于你实现）
+    if isinstance(out, str):
+        try:
+            out = json.loads(out)
+        except Exception:
+            out = []
+    return out if isinstance(out, list) else []
+
+def _fan_out_search(queries: List[str]) -> List[List[Dict[str, Any]]]:
+    """
+    线程池并发执行查询：
+    - 并发上限 SEARCH_CONCURRENCY
+    - 每条查询 SEARCH_QUERY_TIMEOUT 秒；排队的查询按“批次”顺延截止时间
+    - 超时未完成的查询被取消/丢弃（线程无法强杀，结果直接忽略）
+    返回值与 queries 一一对应，失败或超时的位置为空列表
+    """
+    workers = max(1, min(SEARCH_CONCURRENCY, len(queries)))
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="search")
+    try:
+        return _collect_searches(_submit_searches(pool, queries), queries, workers)
+    finally:
+        # 不等待掉队线程，避免一个慢查询拖住整轮迭代
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def _submit_searches(pool: ThreadPoolExecutor, queries: List[str]) -> Dict[Future, int]:
+    return {pool.submit(contextvars.copy_context().run, _search_one, qi): i for i, qi in enumerate(queries)}
+
+def _collect_searches(futures: Dict[Future, int], queries: List[str], workers: int) -> List[List[Dict[str, Any]]]:
+    """等待 _submit_searches 提交的查询（截止时间按批次顺延），失败或超时的位置为空列表"""
+    per_query: List[List[Dict[str, Any]]] = [[] for _ in queries]
+    done, not_done = wait(futures, timeout=SEARCH_QUERY_TIMEOUT * math.ceil(len(queries) / workers))
+    for f in not_done:
+        f.cancel()
+        emit("tool_error", "web_search")
+        logger.warning(f"Search timed out for query '{queries[futures[f]]}'")
+    for f in done:
+        i = futures[f]
+        try:
+            per_query[i] = f.result()
+        except Exception as e:
+            emit("tool_error", "web_search")
+            logger.error(f"Search failed for query '{queries[i]}': {e}")
+    return per_query
+
 def search(state: ResearchState) -> ResearchState:
-    """调用 web_search 工具"""
+    """调用 web_search 工具（多条查询并发扇出，结果按查询顺序合并）"""
     results: List[Dict[str, Any]] = []
-    queries = state.get("queries") or []
+    queries = (state.get("queries") or [])[:MAX_QUERIES]
     
     logger.info(f"Searching with queries: {queries}")
     
-    for qi in queries[:3]:
-        try:
-            out = web_search.invoke({"query": qi, "k": 5})  # 返回 JSON 字符串或对象（取决于你实现）
-            if isinstance(out, str):
-                try:
-                    out = json.loads(out)
-                except Exception:
-                    out = []
-            if isinstance(out, list):
-                results.extend(out)
-        except Exception as e:
-            logger.error(f"Search failed for query '{qi}': {e}")
-            continue
+    if SEARCH_CONCURRENCY <= 1:
+        for qi in queries:
+            try:
+                results.extend(_search_one(qi))
+            except Exception as e:
+                emit("tool_error", "web_search")
+                logger.error(f"Search failed for query '{qi}': {e}")
+                continue
+    else:
+        for out in _fan_out_search(queries):
+            results.extend(out)
     
     logger.info(f"Found {len(results)} search results")
     return {"search_results": results}
 
-def select(state: ResearchState) -> ResearchState:
-    """去重域名，选 2-3 个链接"""
-    results = state.get("search_results") or []
-    seen_domains = set()
-    picked: List[str] = []
-    
-    logger.info(f"Raw search results: {json.dumps(results[:2], indent=2)}")  # 添加调试信息
-    
+def _candidates(results: List[Dict[str, Any]]) -> List[tuple[str, str]]:
+    """搜索结果 -> [(url, 域名)]，丢弃没有 URL 或非 HTTP(S) 的结果"""
+    candidates: List[tuple[str, str]] = []
     for r in results:
         # 尝试多种可能的URL字段名称
         url = (
@@ -179,67 +271,417 @@ def select(state: ResearchState) -> ResearchState:
             logger.error(f"URL parsing failed for {url}: {e}")
             continue
             
-        if dom and (dom not in seen_domains):
-            seen_domains.add(dom)
-            picked.append(url)
-            logger.info(f"Added URL: {url} (domain: {dom})")
-        else:
-            logger.info(f"Skipped URL (duplicate domain): {url}")
-            
-        if len(picked) >= 3:
-            break
+        if dom:
+            candidates.append((url, dom))
+    return candidates
+
+def _pick(candidates: List[tuple[str, str]], read_before: set[str]) -> List[str]:
+    """
+    每个域名取排名最前的一个，最多 3 个。
+    两遍：先挑未读过的 URL，不足 3 个再用读过的补齐（read 会直接复用其 chunks，不再抓取）
+    """
+    seen_domains = set()
+    picked: List[str] = []
+    for prefer_unseen in (True, False):
+        for url, dom in candidates:
+            if len(picked) >= 3:
+                break
+            if (url in read_before) == prefer_unseen or url in picked:
+                continue
+            if dom not in seen_domains:
+                seen_domains.add(dom)
+                picked.append(url)
+                logger.info(f"Added URL: {url} (domain: {dom}{', read before' if url in read_before else ''})")
+            else:
+                logger.info(f"Skipped URL (duplicate domain): {url}")
+    return picked
+
+def select(state: ResearchState) -> ResearchState:
+    """去重域名，选 2-3 个链接；优先本次运行还没读过的 URL"""
+    results = state.get("search_results") or []
+    read_before = set((state.get("evidence") or {}).get("urls") or {})
     
+    logger.info(f"Raw search results: {json.dumps(results[:2], indent=2)}")  # 添加调试信息
+    
+    picked = _pick(_candidates(results), read_before)
     logger.info(f"Selected URLs: {picked}")
     # sources 与 selected_urls 对齐
     return {"selected_urls": picked, "sources": picked}
 
-def read(state: ResearchState) -> ResearchState:
-    """抓取所选 URL 的内容并切分为 chunks"""
+def _read_targets(state: ResearchState) -> Tuple[List[str], Dict[str, Any], List[str]]:
+    """返回 (所选 URL + 本轮本地命中, 证据库副本, 需要新抓取的 URL)；本地命中已在证据库里，不需要抓取"""
     urls = (state.get("selected_urls") or [])[:3]
+    urls += [u for u in state.get("local_urls") or [] if u not in urls]
+    ev = _evidence(state)
+    to_fetch = [u for u in urls if u not in ev["urls"]]
+    logger.info(f"Reading URLs: {to_fetch} (reusing {len(urls) - len(to_fetch)} already read)")
+    return urls, ev, to_fetch
+
+def _collect_chunks(urls: List[str], ev: Dict[str, Any], fetched: Dict[str, Any]) -> ResearchState:
+    """合并新抓取结果与证据库中已有的 chunks，并把新结果记入证据库"""
     chunks: List[str] = []
-    
-    logger.info(f"Reading URLs: {urls}")
-    
+    chunk_sources: List[str] = []
     for u in urls:
-        try:
-            docs = read_html(u)  # List[Document]
-            chunks.extend([d.page_content for d in docs[:4]])  # 每站取前 4 段，防过长
+        if u in fetched:
+            docs = fetched[u]
+            if isinstance(docs, Exception):
+                emit("tool_error", "read_html")
+                logger.error(f"Failed to read {u}: {docs}")
+                ev["urls"][u] = []  # 记为已读，本次运行不再重试
+                continue
+            texts = [d.page_content for d in docs[:4]]  # 每站取前 4 段，防过长
+            hashes = [_chunk_hash(t) for t in texts]
+            ev["urls"][u] = hashes
+            ev["chunks"].update(zip(hashes, texts))
             logger.info(f"Read {len(docs)} documents from {u}")
-        except Exception as e:
-            logger.error(f"Failed to read {u}: {e}")
-            continue
+        else:
+            texts = [ev["chunks"][h] for h in ev["urls"][u] if h in ev["chunks"]]
+            logger.info(f"Reused {len(texts)} chunks for {u}")
+        chunks.extend(texts)
+        chunk_sources.extend([u] * len(texts))
     
     logger.info(f"Extracted {len(chunks)} chunks")
-    return {"chunks": chunks}
+    return {"chunks": chunks, "chunk_sources": chunk_sources, "evidence": ev}
 
-def synthesize(state: ResearchState) -> ResearchState:
-    """用 Pydantic 结构化输出综合结果"""
-    chunks = (state.get("chunks") or [])[:12]
+def read(state: ResearchState) -> ResearchState:
+    """并发抓取所选 URL 的内容并切分为 chunks（慢站点超时放弃，不拖住整轮）；读过的 URL 直接复用证据库"""
+    urls, ev, to_fetch = _read_targets(state)
+    fetched = dict(zip(to_fetch, read_html_many(to_fetch))) if to_fetch else {}
+    return {"sources": urls, **_collect_chunks(urls, ev, fetched)}
+
+# -------------------- 流水线模式：search -> select -> read 合并为 gather 节点 --------------------
+class _GatherPlan:
+    """
+    gather 的选择状态：查询结果按到达顺序喂入，返回此刻应启动 / 取消的抓取。
+    - 推测：每条查询的结果一到，其中每个新域名排名最前的未读 URL 先抓（至多 PIPELINE_PREFETCH_MAX 个）
+    - 确认：已按查询顺序连续返回的前缀里，select 第一遍（未读优先）选出的域名就是最终入选域名的前缀，
+      后到的结果不会改变它们；该域名已有推测抓取时直接沿用，没有则立即抓取
+    - 确认满 3 个域名后，其余域名的推测抓取全部取消
+    与 select 的差别只在域名内部：同一入选域名优先用已在抓的 URL（它也是该域名在某条查询里的首位结果）
+    """
+
+    def __init__(self, n_queries: int, read_before: set[str]):
+        self.per_query: List[List[Dict[str, Any]] | None] = [None] * n_queries
+        self.read_before = read_before
+        self.confirmed: Dict[str, str] = {}    # 域名 -> 确认的 URL
+        self.speculative: Dict[str, str] = {}  # 域名 -> 推测的 URL
+        self.speculated = 0
+        self.cancelled = 0
+
+    def add(self, i: int, results: List[Dict[str, Any]]) -> Tuple[List[str], List[str]]:
+        self.per_query[i] = results
+        start: List[str] = []
+        cancel: List[str] = []
+
+        prefix: List[Dict[str, Any]] = []
+        for out in self.per_query:
+            if out is None:
+                break
+            prefix.extend(out)
+        for url, dom in _candidates(prefix):
+            if len(self.confirmed) >= 3:
+                break
+            if url in self.read_before or dom in self.confirmed:
+                continue
+            guess = self.speculative.pop(dom, None)
+            self.confirmed[dom] = guess or url
+            if not guess:
+                start.append(url)
+
+        if len(self.confirmed) >= 3:
+            cancel.extend(self.speculative.values())  # 最终选择已定
+            self.speculative.clear()
+            self.cancelled += len(cancel)
+            return start, cancel
+        for url, dom in _candidates(results):
+            if self.speculated >= PIPELINE_PREFETCH_MAX:
+                break
+            if url in self.read_before or dom in self.confirmed or dom in self.speculative:
+                continue
+            self.speculative[dom] = url
+            self.speculated += 1
+            start.append(url)
+        self.cancelled += len(cancel)
+        return start, cancel
+
+    def results(self) -> List[Dict[str, Any]]:
+        return [r for out in self.per_query for r in out or []]
+
+    def finalize(self, picked: List[str]) -> List[str]:
+        """select 的最终选择 -> 同域名下换成已在抓的 URL（读过的 URL 不换）"""
+        final: List[str] = []
+        for u in picked:
+            dom = urlparse(u).netloc
+            if u not in self.read_before:
+                u = self.confirmed.get(dom) or self.speculative.get(dom) or u
+            final.append(u)
+        return final
+
+def _gather_update(
+    results: List[Dict[str, Any]], picked: List[str], ev: Dict[str, Any], fetched: Dict[str, Any]
+) -> ResearchState:
+    """gather 的返回值：与 search/select/read 三个节点写入的字段相同"""
+    logger.info(f"Found {len(results)} search results; selected URLs: {picked}")
+    return {"search_results": results, "selected_urls": picked, "sources": picked, **_collect_chunks(picked, ev, fetched)}
+
+def _log_prefetch(plan: _GatherPlan, picked: List[str]) -> None:
+    wasted = plan.cancelled + sum(1 for u in plan.speculative.values() if u not in picked)
+    logger.info(
+        f"Prefetch: {len(plan.confirmed)} confirmed early, {plan.speculated} speculative "
+        f"({wasted} cancelled or discarded)"
+    )
+
+def gather(state: ResearchState) -> ResearchState:
+    """
+    流水线模式的 search -> select -> read（build_graph(pipelined=True)）：
+    - 查询并发执行，每条查询一返回就参与选择，不等其他查询
+    - 新域名的首选 URL 推测性预取，能确定入选的域名立即抓取（见 _GatherPlan）
+    - 全部查询结束后按 select 的规则选域名：已在抓的直接复用，没抓的补抓，
+      落选的推测抓取取消（排队中的直接取消；已在跑的线程无法中断，结果丢弃，页面照常进缓存）
+    搜索与抓取的网络等待因此重叠；入选域名与串行三节点一致
+    """
+    queries = (state.get("queries") or [])[:MAX_QUERIES]
+    ev = _evidence(state)
+    read_before = set(ev["urls"])
+    logger.info(f"Searching (pipelined) with queries: {queries}")
+
+    plan = _GatherPlan(len(queries), read_before)
+    reads: Dict[str, Future] = {}
+    workers = max(1, min(SEARCH_CONCURRENCY, len(queries)))
+    search_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="search")
+    read_pool = ThreadPoolExecutor(max_workers=PIPELINE_PREFETCH_MAX + 3, thread_name_prefix="read")
+
+    def _apply(start: List[str], cancel: List[str]) -> None:
+        for u in cancel:
+            reads.pop(u).cancel()
+        for u in start:
+            reads[u] = read_pool.submit(contextvars.copy_context().run, read_html, u)
+
+    try:
+        futures = {search_pool.submit(contextvars.copy_context().run, _search_one, qi): i for i, qi in enumerate(queries)}
+        try:
+            for f in as_completed(futures, timeout=SEARCH_QUERY_TIMEOUT * math.ceil(len(queries) / workers)):
+                i = futures[f]
+                try:
+                    out = f.result()
+                except Exception as e:
+                    emit("tool_error", "web_search")
+                    logger.error(f"Search failed for query '{queries[i]}': {e}")
+                    out = []
+                _apply(*plan.add(i, out))
+        except FuturesTimeoutError:
+            for f, i in futures.items():
+                if not f.done():
+                    f.cancel()
+                    emit("tool_error", "web_search")
+                    logger.warning(f"Search timed out for query '{queries[i]}'")
+
+        results = plan.results()
+        picked = plan.finalize(_pick(_candidates(results), read_before))
+        _log_prefetch(plan, picked)
+        needed = [u for u in picked if u not in ev["urls"]]
+        _apply([u for u in needed if u not in reads], [u for u in list(reads) if u not in needed])
+
+        fetched: Dict[str, Any] = {}
+        done, _ = wait(list(reads.values()), timeout=FETCH_DEADLINE * 2)
+        for u, f in reads.items():
+            if f not in done:
+                f.cancel()
+                fetched[u] = FetchError(f"deadline exceeded: {u}")
+                continue
+            try:
+                fetched[u] = f.result()
+            except Exception as e:
+                fetched[u] = e
+    finally:
+        # 不等待掉队线程（慢查询 / 落选的推测抓取），避免拖住整轮迭代
+        search_pool.shutdown(wait=False, cancel_futures=True)
+        read_pool.shutdown(wait=False, cancel_futures=True)
+    return _gather_update(results, picked, ev, fetched)
+
+# -------------------- 本地优先的混合检索：hybrid_search 代替 search --------------------
+_STOPWORDS = {
+    "the", "and", "for", "with", "from", "that", "this", "what", "how", "does", "are", "its",
+    "into", "about", "which", "why", "when", "who", "can", "use", "used", "using", "between",
+}
+_TERM_RE = re.compile(r"[a-z0-9]{3,}|[\u4e00-\u9fff]+")
+
+def _terms(text: str) -> set[str]:
+    """
+    覆盖度用的词项：中文取相邻二字组；英文/数字取 3 字符以上的词（去停用词），
+    截取前 5 个字符做粗略词干（manage / manages / managed 视为同一词项）
+    """
+    terms: set[str] = set()
+    for tok in _TERM_RE.findall(text.lower()):
+        if "\u4e00" <= tok[0] <= "\u9fff":
+            terms.update(tok[i:i + 2] for i in range(max(1, len(tok) - 1)))
+        elif tok not in _STOPWORDS:
+            terms.add(tok[:5])
+    return terms
+
+def _local_evidence(state: ResearchState, ev: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    用问题和本轮查询检索本地语料，把相关片段记入证据库 ev，并评估是否足以跳过 Web：
+    - 相关片段：至少覆盖问题词项的 1/3
+    - 覆盖度：相关片段合起来覆盖的问题词项比例
+    - 足够：相关片段 >= LOCAL_MIN_HITS、覆盖度 >= LOCAL_MIN_COVERAGE，且有还没综合过的新片段
+    """
+    question = state.get("input", "")
+    q_terms = _terms(question)
+    seen: set[str] = set()
+    relevant: List[Tuple[str, str, str]] = []  # (source, hash, text)
+    covered: set[str] = set()
+    for q in [question] + (state.get("queries") or [])[:MAX_QUERIES]:
+        for hit in local_hits(q, k=LOCAL_TOP_K):
+            h = _chunk_hash(hit["text"])
+            if h in seen:
+                continue
+            seen.add(h)
+            overlap = _terms(hit["text"]) & q_terms
+            if q_terms and len(overlap) * 3 >= len(q_terms):
+                relevant.append((hit["source"], h, hit["text"]))
+                covered |= overlap
+
+    urls: List[str] = []
+    for source, h, text in relevant:
+        hashes = ev["urls"].setdefault(source, [])
+        if h not in hashes:
+            hashes.append(h)
+        ev["chunks"][h] = text
+        if source not in urls:
+            urls.append(source)
+    coverage = len(covered) / len(q_terms) if q_terms else 0.0
+    fresh = sum(1 for _, h, _ in relevant if h not in set(ev["synthesized"]))
+    enough = len(relevant) >= LOCAL_MIN_HITS and coverage >= LOCAL_MIN_COVERAGE and fresh > 0
+    logger.info(
+        f"Local retrieval: {len(relevant)} relevant chunks from {len(urls)} sources, "
+        f"coverage {coverage:.2f}, {fresh} new -> {'skip web' if enough else 'use web'}"
+    )
+    return {"urls": urls, "enough": enough}
+
+def _local_only(local: Dict[str, Any], ev: Dict[str, Any]) -> ResearchState:
+    """本地证据足够：本轮不选不读网页，直接以本地片段进入 synthesize"""
+    urls = local["urls"]
+    return {
+        "search_results": [],
+        "selected_urls": [],
+        "local_urls": urls,
+        "local_sufficient": True,
+        "sources": urls,
+        **_collect_chunks(urls, ev, {}),
+    }
+
+def hybrid_search(state: ResearchState) -> ResearchState:
+    """
+    本地优先的混合检索（build_graph(hybrid=True)）：
+    - Web 查询先在后台发出，同时检索本地语料（tools/local_rag，毫秒级）
+    - 本地证据足够（见 _local_evidence）时取消还在排队的 Web 查询，跳过 select/read 直接综合
+    - 否则等 Web 结果照常 select -> read，read 时把本地片段与网页 chunks 合并，引用为 file:// 链接
+    """
+    queries = (state.get("queries") or [])[:MAX_QUERIES]
+    logger.info(f"Searching (local-first) with queries: {queries}")
+    ev = _evidence(state)
+    workers = max(1, min(SEARCH_CONCURRENCY, len(queries)))
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="search")
+    try:
+        futures = _submit_searches(pool, queries)
+        local = _local_evidence(state, ev)
+        if local["enough"]:
+            for f in futures:
+                f.cancel()
+            return _local_only(local, ev)
+        per_query = _collect_searches(futures, queries, workers)
+    finally:
+        # 已在跑的查询不等待（结果照常进搜索缓存）
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    results = [r for out in per_query for r in out]
+    logger.info(f"Found {len(results)} search results")
+    return {"search_results": results, "local_urls": local["urls"], "local_sufficient": False, "evidence": ev}
+
+def _previous_notes(state: ResearchState) -> Dict[str, Any] | None:
+    """上一轮有效的 notes（有 claims 或 key_points）；首轮或上一轮综合失败时为 None。"""
+    notes = state.get("notes")
+    if isinstance(notes, dict) and (notes.get("claims") or notes.get("key_points")):
+        return notes
+    return None
+
+def _prepare_synthesis(state: ResearchState) -> Tuple[ResearchState | None, Dict[str, Any]]:
+    """
+    同步/异步 synthesize 共用的准备步骤，返回 (直接返回的状态更新, 上下文)：
+    没有新材料时第一项为沿用上一轮 notes 的更新；否则为 None，上下文里带工具参数。
+    """
+    ev = _evidence(state)
+    done = set(ev["synthesized"])
+    all_chunks = state.get("chunks") or []
+    chunk_sources = list(state.get("chunk_sources") or [])
+    chunk_sources += [None] * (len(all_chunks) - len(chunk_sources))
+    fresh = [(c, src) for c, src in zip(all_chunks, chunk_sources) if _chunk_hash(c) not in done]
+    previous = _previous_notes(state)
+    if previous and not fresh:
+        logger.info("No new evidence since last synthesis; keeping previous notes")
+        return {"notes": previous}, {}
+
+    packed = pack_context(
+        [c for c, _ in fresh],
+        query=state.get("input", ""),
+        sources=[src for _, src in fresh],
+    )
+    chunks = packed.chunks
     sources = state.get("sources") or []
     
-    logger.info(f"Synthesizing {len(chunks)} chunks from {len(sources)} sources")
-    
+    logger.info(
+        f"Synthesizing {len(chunks)} chunks (~{packed.tokens} tokens) from {len(sources)} sources"
+        + (" (incremental)" if previous else "")
+    )
+    args = {
+        "chunks": chunks,
+        "sources": sources,
+        "topic": state.get("input", ""),
+        "target_words": 200,
+        "previous_notes": previous,
+        "pack": False,  # 上面已按来源打包；工具内再打包会只按 BM25 重排并重复计算
+    }
+    # 作为（近）重复被丢弃的 chunk 已由选中的 chunk 代表：综合成功后一并记为已综合，
+    # 否则它们永远是“新材料”，下一轮会作为新证据再次送给模型
+    return None, {"ev": ev, "previous": previous, "args": args, "duplicates": packed.duplicate_chunks}
+
+def _synthesis_done(ctx: Dict[str, Any], notes_json: str) -> ResearchState:
+    notes = json.loads(notes_json)
+    logger.info(f"Synthesis successful: {len(notes.get('claims', []))} claims")
+    ev = ctx["ev"]
+    ev["synthesized"].extend(_chunk_hash(c) for c in ctx["args"]["chunks"] + ctx["duplicates"])
+    return {"notes_json": notes_json, "notes": notes, "evidence": ev}
+
+def _synthesis_failed(ctx: Dict[str, Any], e: Exception) -> ResearchState:
+    emit("tool_error", "synth_notes")
+    logger.error(f"Synthesis failed: {e}")
+    previous = ctx["previous"]
+    if previous:
+        # 增量失败：保留已有笔记，不把累积的证据冲掉
+        return {"notes_json": json.dumps(previous, ensure_ascii=False), "notes": previous, "evidence": ctx["ev"]}
+    notes_json = json.dumps({
+        "summary": "Failed to synthesize notes", 
+        "key_points": [], 
+        "claims": [], 
+        "open_questions": []
+    }, ensure_ascii=False)
+    return {"notes_json": notes_json, "notes": json.loads(notes_json), "evidence": ctx["ev"]}
+
+def synthesize(state: ResearchState) -> ResearchState:
+    """
+    用 Pydantic 结构化输出综合结果（分块按相关性/去重/来源多样性装入 token 预算）。
+    回环时走增量模式：上一轮 notes + 本轮新读到的 chunks -> 增量合并，证据跨轮累积。
+    已经综合过的 chunk（按哈希）不再送入模型；没有新材料时直接沿用上一轮 notes。
+    """
+    early, ctx = _prepare_synthesis(state)
+    if early is not None:
+        return early
     # tool 内部已做健壮解析，不满足格式会抛错；这里尽量兜底
     try:
-        notes_json = synth_notes_tool.invoke({
-            "chunks": chunks,
-            "sources": sources,
-            "topic": state.get("input", ""),
-            "target_words": 200
-        })
-        notes = json.loads(notes_json)
-        logger.info(f"Synthesis successful: {len(notes.get('claims', []))} claims")
+        return _synthesis_done(ctx, synth_notes_tool.invoke(ctx["args"]))
     except Exception as e:
-        logger.error(f"Synthesis failed: {e}")
-        notes_json = json.dumps({
-            "summary": "Failed to synthesize notes", 
-            "key_points": [], 
-            "claims": [], 
-            "open_questions": []
-        }, ensure_ascii=False)
-        notes = json.loads(notes_json)
-
-    return {"notes_json": notes_json, "notes": notes}
+        return _synthesis_failed(ctx, e)
 
 def decide(state: ResearchState) -> ResearchState:
     """
@@ -328,44 +770,195 @@ def decide(state: ResearchState) -> ResearchState:
     }
 
 
-def write(state: ResearchState) -> ResearchState:
-    """将 notes 渲染为 Markdown"""
-    n = state.get("notes", {}) or {}
-    lines = ["# Research Copilot Report\n"]
+# -------------------- 异步节点（build_async_graph 使用） --------------------
+async def aplan(state: ResearchState) -> ResearchState:
+    """plan 的异步版本"""
+    resp = await _llm().ainvoke(_plan_prompt(state))
+    return _plan_update(state, resp.content)
+
+async def _asearch_one(sem: asyncio.Semaphore, qi: str) -> List[Dict[str, Any]]:
+    """单条查询（线程池执行 + 超时）；失败或超时返回空列表"""
+    async with sem:
+        try:
+            return await asyncio.wait_for(asyncio.to_thread(_search_one, qi), timeout=SEARCH_QUERY_TIMEOUT)
+        except asyncio.TimeoutError:
+            emit("tool_error", "web_search")
+            logger.warning(f"Search timed out for query '{qi}'")
+        except Exception as e:
+            emit("tool_error", "web_search")
+            logger.error(f"Search failed for query '{qi}': {e}")
+        return []
+
+async def asearch(state: ResearchState) -> ResearchState:
+    """
+    search 的异步版本。duckduckgo_search 没有异步接口，单条查询放到默认线程池执行
+    （线程数有上限，且只在搜索期间占用）；并发与超时由事件循环控制，超时的查询直接放弃。
+    """
+    queries = (state.get("queries") or [])[:MAX_QUERIES]
+    logger.info(f"Searching with queries: {queries}")
+    sem = asyncio.Semaphore(max(1, SEARCH_CONCURRENCY))
+    results: List[Dict[str, Any]] = []
+    for out in await asyncio.gather(*(_asearch_one(sem, qi) for qi in queries)):
+        results.extend(out)
+    logger.info(f"Found {len(results)} search results")
+    return {"search_results": results}
+
+async def aread(state: ResearchState) -> ResearchState:
+    """read 的异步版本（httpx.AsyncClient 并发抓取，不占线程）"""
+    urls, ev, to_fetch = _read_targets(state)
+    fetched = dict(zip(to_fetch, await aread_html_many(to_fetch))) if to_fetch else {}
+    return {"sources": urls, **_collect_chunks(urls, ev, fetched)}
+
+async def _aread_settled(url: str) -> Any:
+    """aread_html，异常作为返回值（与 aread_html_many 的约定一致）"""
+    try:
+        return await aread_html(url)
+    except Exception as e:
+        return e
+
+async def agather(state: ResearchState) -> ResearchState:
+    """
+    gather 的异步版本。抓取是事件循环里的任务，落选时 cancel() 会真正中断下载。
+    """
+    queries = (state.get("queries") or [])[:MAX_QUERIES]
+    ev = _evidence(state)
+    read_before = set(ev["urls"])
+    logger.info(f"Searching (pipelined) with queries: {queries}")
+    sem = asyncio.Semaphore(max(1, SEARCH_CONCURRENCY))
+
+    async def _indexed(i: int, qi: str) -> Tuple[int, List[Dict[str, Any]]]:
+        return i, await _asearch_one(sem, qi)
+
+    plan = _GatherPlan(len(queries), read_before)
+    reads: Dict[str, asyncio.Task] = {}
+
+    def _apply(start: List[str], cancel: List[str]) -> None:
+        for u in cancel:
+            reads.pop(u).cancel()
+        for u in start:
+            reads[u] = asyncio.create_task(_aread_settled(u))
+
+    try:
+        for next_done in asyncio.as_completed([_indexed(i, qi) for i, qi in enumerate(queries)]):
+            _apply(*plan.add(*await next_done))
+
+        results = plan.results()
+        picked = plan.finalize(_pick(_candidates(results), read_before))
+        _log_prefetch(plan, picked)
+        needed = [u for u in picked if u not in ev["urls"]]
+        _apply([u for u in needed if u not in reads], [u for u in list(reads) if u not in needed])
+        fetched = dict(zip(reads, await asyncio.gather(*reads.values())))
+    finally:
+        # 节点被取消（或出错）时不留下后台抓取
+        for task in reads.values():
+            task.cancel()
+    return _gather_update(results, picked, ev, fetched)
+
+async def ahybrid_search(state: ResearchState) -> ResearchState:
+    """hybrid_search 的异步版本：本地检索放到线程里（冷启动可能要建索引），本地足够时取消 Web 查询任务"""
+    queries = (state.get("queries") or [])[:MAX_QUERIES]
+    logger.info(f"Searching (local-first) with queries: {queries}")
+    ev = _evidence(state)
+    sem = asyncio.Semaphore(max(1, SEARCH_CONCURRENCY))
+    web = [asyncio.create_task(_asearch_one(sem, qi)) for qi in queries]
+    try:
+        local = await asyncio.to_thread(_local_evidence, state, ev)
+        if local["enough"]:
+            return _local_only(local, ev)
+        per_query = await asyncio.gather(*web)
+    finally:
+        for task in web:
+            task.cancel()  # 本地已足够（或节点被取消）时不再等 Web 查询；已完成的任务不受影响
+
+    results = [r for out in per_query for r in out]
+    logger.info(f"Found {len(results)} search results")
+    return {"search_results": results, "local_urls": local["urls"], "local_sufficient": False, "evidence": ev}
+
+async def asynthesize(state: ResearchState) -> ResearchState:
+    """synthesize 的异步版本（chain.ainvoke）"""
+    early, ctx = _prepare_synthesis(state)
+    if early is not None:
+        return early
+    try:
+        return _synthesis_done(ctx, notes_to_json(await asynthesize_notes(**ctx["args"])))
+    except Exception as e:
+        return _synthesis_failed(ctx, e)
+
+def _async_node(fn):
+    """纯计算节点的协程包装：直接在事件循环里执行，省去 LangGraph 对同步节点的线程池调度"""
+    @functools.wraps(fn)
+    async def node(state: ResearchState) -> ResearchState:
+        return fn(state)
+    return node
+
+aselect = _async_node(select)
+adecide = _async_node(decide)
+
+
+def render_sections(notes: Dict[str, Any]) -> List[str]:
+    """将 notes 按章节渲染为 Markdown 片段（流式输出时逐段发送；拼接即为完整报告）"""
+    n = notes or {}
+    sections = ["# Research Copilot Report\n"]
     if n.get("summary"):
-        lines += ["## Summary", n["summary"], ""]
+        sections.append("\n".join(["## Summary", n["summary"], ""]))
     if n.get("key_points"):
-        lines += ["## Key Points"] + [f"- {p}" for p in n["key_points"]] + [""]
+        sections.append("\n".join(["## Key Points"] + [f"- {p}" for p in n["key_points"]] + [""]))
     if n.get("claims"):
-        lines += ["## Claims & Evidence"]
+        lines = ["## Claims & Evidence"]
         for c in n["claims"]:
             evs = c.get("evidence_urls", []) or []
             ev_join = ", ".join(evs)
             lines.append(f"- {c.get('text','')}  \n  evidence: {ev_join}")
         lines.append("")
+        sections.append("\n".join(lines))
     if n.get("open_questions"):
-        lines += ["## Open Questions"] + [f"- {q}" for q in n["open_questions"]] + [""]
-    return {"output": "\n".join(lines)}
+        sections.append("\n".join(["## Open Questions"] + [f"- {q}" for q in n["open_questions"]] + [""]))
+    return sections
+
+def write(state: ResearchState) -> ResearchState:
+    """将 notes 渲染为 Markdown"""
+    return {"output": "\n".join(render_sections(state.get("notes", {}) or {}))}
+
+awrite = _async_node(write)
+
+# --- 检查点（中断后可从最后完成的节点续跑） ---
+CHECKPOINT_DB = os.getenv("RC_CHECKPOINT_DB") or cache_path("checkpoints.sqlite")
+
+def sqlite_checkpointer(path: str | None = None) -> SqliteSaver:
+    """本地 SQLite 检查点；每个 run 以 config["configurable"]["thread_id"] 区分"""
+    return SqliteSaver(connect(path or CHECKPOINT_DB))
+
+def run_config(run_id: str, recursion_limit: int = 20) -> Dict[str, Any]:
+    return {"recursion_limit": recursion_limit, "configurable": {"thread_id": run_id}}
 
 # --- 装配图 ---
-def build_graph():
+def _assemble(nodes: Dict[str, Any], checkpointer=None):
+    """同步图与异步图共用同一拓扑，只是节点实现不同"""
     g = StateGraph(ResearchState)
 
     # 避免与 state key 冲突：节点名使用 plan_node
-    g.add_node("plan_node", plan)
-    g.add_node("search", search)
-    g.add_node("select", select)
-    g.add_node("read", read)
-    g.add_node("synthesize", synthesize)
-    g.add_node("decide", decide)
-    g.add_node("write", write)
+    for name, fn in nodes.items():
+        g.add_node(name, fn)
 
     g.set_entry_point("plan_node")
 
-    g.add_edge("plan_node", "search")
-    g.add_edge("search", "select")
-    g.add_edge("select", "read")
-    g.add_edge("read", "synthesize")
+    # 流水线模式：gather 一个节点完成 search -> select -> read
+    # 混合模式：hybrid_search 代替 search，本地证据足够时直接跳到 synthesize
+    loop_entry = next((n for n in ("gather", "hybrid_search") if n in nodes), "search")
+    g.add_edge("plan_node", loop_entry)
+    if loop_entry == "gather":
+        g.add_edge("gather", "synthesize")
+    else:
+        if loop_entry == "hybrid_search":
+            g.add_conditional_edges(
+                "hybrid_search",
+                lambda state: "local" if state.get("local_sufficient") else "web",
+                {"local": "synthesize", "web": "select"},
+            )
+        else:
+            g.add_edge("search", "select")
+        g.add_edge("select", "read")
+        g.add_edge("read", "synthesize")
     g.add_edge("synthesize", "decide")
 
     # 关键：让 decide 返回 path key -> 决定走向
@@ -379,10 +972,60 @@ def build_graph():
         "decide",
         after_decide,
         {
-            "need_more": "search",
+            "need_more": loop_entry,
             "done": "write",
         },
     )
 
     g.add_edge("write", END)
-    return g.compile()
\ No newline at end of file
+    return g.compile(checkpointer=checkpointer)
+
+def _fetch_nodes(pipelined: bool, hybrid: bool, sync: bool) -> Dict[str, Any]:
+    """检索阶段的节点：三节点 / 流水线 gather / 本地优先 hybrid_search + select + read"""
+    if pipelined and hybrid:
+        raise ValueError("pipelined and hybrid modes are mutually exclusive")
+    if pipelined:
+        return {"gather": gather if sync else agather}
+    if hybrid:
+        first = {"hybrid_search": hybrid_search if sync else ahybrid_search}
+    else:
+        first = {"search": search if sync else asearch}
+    return {**first, "select": select if sync else aselect, "read": read if sync else aread}
+
+def build_graph(checkpointer=None, pipelined: bool = GRAPH_PIPELINED, hybrid: bool = GRAPH_HYBRID):
+    """
+    checkpointer: 可选的 LangGraph 检查点（如 sqlite_checkpointer()）；给出时每个节点完成后落盘，
+    同一 thread_id 用 app.invoke(None, run_config(run_id)) 即可从中断处续跑
+    pipelined: 用 gather 节点（搜索结果边到边选、推测预取）代替 search/select/read 三个节点；
+    默认取环境变量 GRAPH_PIPELINED；节点名不同，续跑检查点时须与中断前的模式一致
+    hybrid: 本地优先的混合检索（hybrid_search 代替 search，本地语料足够时跳过网页）；默认取 GRAPH_HYBRID，
+    不能与 pipelined 同时使用
+    """
+    return _assemble(
+        {
+            "plan_node": plan,
+            **_fetch_nodes(pipelined, hybrid, sync=True),
+            "synthesize": synthesize,
+            "decide": decide,
+            "write": write,
+        },
+        checkpointer,
+    )
+
+def build_async_graph(checkpointer=None, pipelined: bool = GRAPH_PIPELINED, hybrid: bool = GRAPH_HYBRID):
+    """
+    异步图：用 await app.ainvoke(state, config) / app.astream(...) 执行。
+    LLM 走共享的 httpx.AsyncClient（ainvoke），网页抓取走 afetch，一个事件循环可并发承载大量运行。
+    checkpointer 须支持异步接口（如 MemorySaver、AsyncSqliteSaver）；sqlite_checkpointer() 只支持同步图。
+    pipelined / hybrid: 同 build_graph
+    """
+    return _assemble(
+        {
+            "plan_node": aplan,
+            **_fetch_nodes(pipelined, hybrid, sync=False),
+            "synthesize": asynthesize,
+            "decide": adecide,
+            "write": awrite,
+        },
+        checkpointer,
+    )
\ No newline at end of file
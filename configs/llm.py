@@ -1,12 +1,231 @@
 import os
+import json
+import time
+import asyncio
+import logging
+import weakref
+import threading
+from typing import Dict, Optional, Tuple
 from dotenv import load_dotenv
+import httpx
 from langchain_openai import ChatOpenAI
+from configs.llm_cache import get_llm_cache
+from configs.ratelimit import RATE_RETRY_ATTEMPTS, aacquire, acquire, charge, parse_retry_after, penalize, retry_delay
 load_dotenv()
 
 '''
 load LLMs
 '''
 
+# Provider defaults. Base URLs can be overridden (e.g. to point at a local stand-in).
+_PROVIDERS: Dict[str, Dict[str, Optional[str]]] = {
+    "deepseek": {
+        "model": "deepseek-chat",
+        "api_key_env": "DEEPSEEK_API_KEY",
+        "base_url": os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com"),
+    },
+    "openai": {
+        "model": "gpt-4o-mini",
+        "api_key_env": "OPENAI_API_KEY",
+        "base_url": os.getenv("OPENAI_BASE_URL"),
+    },
+}
+
+LLM_POOL_MAX_CONNECTIONS = int(os.getenv("LLM_POOL_MAX_CONNECTIONS", "20"))
+LLM_POOL_MAX_KEEPALIVE = int(os.getenv("LLM_POOL_MAX_KEEPALIVE", "10"))
+LLM_RETRY_ATTEMPTS = int(os.getenv("LLM_RETRY_ATTEMPTS", str(RATE_RETRY_ATTEMPTS)))
+
+logger = logging.getLogger(__name__)
+
+_HTTP_CLIENT: Optional[httpx.Client] = None
+# Async pools belong to the event loop that opened their connections, so async
+# clients (and the chat models holding them) are kept per running loop.
+_ASYNC_HTTP_CLIENTS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = (
+    weakref.WeakKeyDictionary()
+)
+_REGISTRY: Dict[Tuple, ChatOpenAI] = {}
+_LOOP_REGISTRIES: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple, ChatOpenAI]]" = (
+    weakref.WeakKeyDictionary()
+)
+_LOCK = threading.RLock()  # get_chat_model holds it while create_chat_model builds the shared client
+
+
+def _http2_available() -> bool:
+    """HTTP/2 needs the optional `h2` package (`pip install httpx[http2]`)."""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+_RETRY_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+def _estimate_tokens(request: httpx.Request) -> int:
+    """Rough prompt size (~4 bytes per token) plus the completion cap, for the token budget."""
+    try:
+        body = request.content
+    except httpx.RequestNotRead:
+        return 0
+    try:
+        max_tokens = int(json.loads(body).get("max_tokens") or 0)
+    except (ValueError, AttributeError, TypeError):
+        max_tokens = 0
+    return len(body) // 4 + max_tokens
+
+
+def _usage_tokens(response: httpx.Response) -> Optional[int]:
+    """total_tokens from a (read) JSON completion; None for streams and errors."""
+    try:
+        return int(response.json()["usage"]["total_tokens"])
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def _is_json(response: httpx.Response) -> bool:
+    return response.status_code == 200 and "json" in response.headers.get("content-type", "")
+
+
+def _backoff(request: httpx.Request, attempt: int, response: Optional[httpx.Response], error: Optional[Exception]) -> float:
+    """Delay before the next attempt; a 429 also pauses the shared "llm" bucket for every caller."""
+    retry_after = parse_retry_after(response.headers.get("retry-after")) if response is not None else None
+    delay = retry_delay(attempt, retry_after)
+    if response is not None and response.status_code == 429:
+        penalize("llm", delay)
+    reason = f"HTTP {response.status_code}" if response is not None else type(error).__name__
+    logger.warning(f"LLM request to {request.url.host} failed ({reason}); retry {attempt + 1}/{LLM_RETRY_ATTEMPTS} in {delay:.1f}s")
+    return delay
+
+
+class _LimitedTransport(httpx.BaseTransport):
+    """
+    Wraps the pooled transport: every attempt takes the shared "llm" request and
+    token budgets (configs/ratelimit.py, at the caller's priority); 429 / 5xx and
+    transport errors are retried with jittered backoff honouring Retry-After.
+    """
+
+    def __init__(self, inner: httpx.BaseTransport):
+        self._inner = inner
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        estimate = _estimate_tokens(request)
+        for attempt in range(LLM_RETRY_ATTEMPTS + 1):
+            acquire("llm", tokens=estimate)
+            try:
+                response = self._inner.handle_request(request)
+            except httpx.TransportError as e:
+                if attempt >= LLM_RETRY_ATTEMPTS:
+                    raise
+                time.sleep(_backoff(request, attempt, None, e))
+                continue
+            if response.status_code in _RETRY_STATUS and attempt < LLM_RETRY_ATTEMPTS:
+                response.close()
+                time.sleep(_backoff(request, attempt, response, None))
+                continue
+            if _is_json(response):
+                response.read()
+                used = _usage_tokens(response)
+                if used is not None:
+                    charge("llm", used - estimate)
+            return response
+        raise AssertionError("unreachable")
+
+    def close(self) -> None:
+        self._inner.close()
+
+
+class _AsyncLimitedTransport(httpx.AsyncBaseTransport):
+    """Async counterpart of `_LimitedTransport`."""
+
+    def __init__(self, inner: httpx.AsyncBaseTransport):
+        self._inner = inner
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        estimate = _estimate_tokens(request)
+        for attempt in range(LLM_RETRY_ATTEMPTS + 1):
+            await aacquire("llm", tokens=estimate)
+            try:
+                response = await self._inner.handle_async_request(request)
+            except httpx.TransportError as e:
+                if attempt >= LLM_RETRY_ATTEMPTS:
+                    raise
+                await asyncio.sleep(_backoff(request, attempt, None, e))
+                continue
+            if response.status_code in _RETRY_STATUS and attempt < LLM_RETRY_ATTEMPTS:
+                await response.aclose()
+                await asyncio.sleep(_backoff(request, attempt, response, None))
+                continue
+            if _is_json(response):
+                await response.aread()
+                used = _usage_tokens(response)
+                if used is not None:
+                    charge("llm", used - estimate)
+            return response
+        raise AssertionError("unreachable")
+
+    async def aclose(self) -> None:
+        await self._inner.aclose()
+
+
+def _pool_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=LLM_POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_POOL_MAX_KEEPALIVE,
+        keepalive_expiry=60,
+    )
+
+
+def get_http_client() -> httpx.Client:
+    """
+    Return the process-wide httpx client shared by every LLM client.
+
+    One connection pool (keep-alive, HTTP/2 when available) means TLS handshakes
+    to the provider are paid once per connection rather than once per node call.
+    Requests pass through the process-wide "llm" rate limit (configs/ratelimit.py)
+    and are retried on 429 / 5xx by the client's transport, so the SDK's own
+    retries are switched off (see `create_chat_model`).
+    """
+    global _HTTP_CLIENT
+    if _HTTP_CLIENT is None:
+        with _LOCK:
+            if _HTTP_CLIENT is None:
+                _HTTP_CLIENT = httpx.Client(
+                    transport=_LimitedTransport(httpx.HTTPTransport(http2=_http2_available(), limits=_pool_limits())),
+                    timeout=httpx.Timeout(120, connect=10),
+                )
+    return _HTTP_CLIENT
+
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """
+    Async counterpart of `get_http_client`, used by `ainvoke` / `astream` calls.
+
+    Pooled connections belong to the event loop that opened them, so there is one
+    client per running loop: successive `asyncio.run` calls (or a background loop
+    such as the one in tools/docsum.py) each get their own pool. Must be called
+    from a coroutine.
+    """
+    loop = asyncio.get_running_loop()
+    client = _ASYNC_HTTP_CLIENTS.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            transport=_AsyncLimitedTransport(
+                httpx.AsyncHTTPTransport(http2=_http2_available(), limits=_pool_limits())
+            ),
+            timeout=httpx.Timeout(120, connect=10),
+        )
+        _ASYNC_HTTP_CLIENTS[loop] = client
+    return client
+
+
 def create_llm_client(provider="deepseek"):
     """
     Create and return a Large Language Model (LLM) client based on the given provider.
@@ -30,17 +249,18 @@ def create_llm_client(provider="deepseek"):
     
     # create openai client
     if provider == "openai":
-        return ChatOpenAI(
-            model="gpt-4o-mini",
-            api_key=os.getenv("OPENAI_API_KEY")
-        )
+        # keep ChatOpenAI's stock temperature and no response cache, as before
+        return create_chat_model("openai", temperature=0.7, cache=False)
     
     # create deepseek client
     elif provider == "deepseek":
         from openai import OpenAI
+        cfg = _PROVIDERS["deepseek"]
         return OpenAI(
-            api_key=os.getenv("DEEPSEEK_API_KEY"),
-            base_url="https://api.deepseek.com"
+            api_key=os.getenv(cfg["api_key_env"]),
+            base_url=cfg["base_url"],
+            http_client=get_http_client(),
+            max_retries=0,  # retried (with the shared backoff) by the client's transport
         )
     
     # error
@@ -48,6 +268,84 @@ def create_llm_client(provider="deepseek"):
         raise ValueError(f"Unsupported provider: {provider}")
 
 
+def create_chat_model(
+    provider: str = "deepseek",
+    model: Optional[str] = None,
+    temperature: float = 0.2,
+    max_tokens: Optional[int] = None,
+    cache: bool = True,
+) -> ChatOpenAI:
+    """
+    Build a LangChain chat model for the given provider on the shared HTTP pool.
+
+    Called from a coroutine, the model's async calls use that loop's pool (see
+    `get_async_http_client`); otherwise only the sync pool is attached.
+
+    Args:
+        provider (str): "deepseek" or "openai".
+        model (str, optional): Model name; defaults to the provider's default.
+        temperature (float): Sampling temperature.
+        max_tokens (int, optional): Completion token cap.
+        cache (bool): Whether to use the shared LLM response cache.
+
+    Returns:
+        ChatOpenAI: A new chat model instance.
+
+    Raises:
+        ValueError: If the given provider is not supported.
+    """
+    if provider not in _PROVIDERS:
+        raise ValueError(f"Unsupported provider: {provider}")
+    cfg = _PROVIDERS[provider]
+    kwargs = {}
+    if cfg["base_url"]:
+        kwargs["base_url"] = cfg["base_url"]
+    if _running_loop() is not None:
+        kwargs["http_async_client"] = get_async_http_client()
+    return ChatOpenAI(
+        model=model or cfg["model"],
+        api_key=os.getenv(cfg["api_key_env"]),
+        temperature=temperature,
+        max_tokens=max_tokens,
+        cache=get_llm_cache(cache),
+        http_client=get_http_client(),
+        max_retries=0,  # retried (with the shared backoff) by the client's transport
+        **kwargs,
+    )
+
+
+def get_chat_model(
+    provider: str = "deepseek",
+    model: Optional[str] = None,
+    temperature: float = 0.2,
+    max_tokens: Optional[int] = None,
+    cache: bool = True,
+) -> ChatOpenAI:
+    """
+    Process-wide registry around `create_chat_model`.
+
+    Returns one reused client per (provider, model, temperature, max_tokens, cache),
+    so graph nodes can call this on every invocation without rebuilding clients.
+    Chat models are thread-safe and can be shared across concurrent runs.
+
+    Inside a coroutine the registry is per running loop, so the returned model's
+    `ainvoke` / `astream` use that loop's connection pool; async code should fetch
+    the model in the coroutine that awaits it.
+    """
+    key = (provider, model or (_PROVIDERS.get(provider) or {}).get("model"), temperature, max_tokens, cache)
+    loop = _running_loop()
+    with _LOCK:
+        registry = _REGISTRY if loop is None else _LOOP_REGISTRIES.setdefault(loop, {})
+    client = registry.get(key)
+    if client is None:
+        with _LOCK:
+            client = registry.get(key)
+            if client is None:
+                client = create_chat_model(provider, model, temperature, max_tokens, cache)
+                registry[key] = client
+    return client
+
+
 
 
 from typing_extensions import Literal
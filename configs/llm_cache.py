@@ -0,0 +1,152 @@
+"""
+Shared LLM response cache.
+
+Implements LangChain's ``BaseCache`` interface so it can be attached to any
+chat model via ``ChatOpenAI(cache=...)``. LangChain already keys lookups on the
+serialized message list (``prompt``) and the model parameters (``llm_string``,
+which includes model name, temperature, max_tokens, ...), so identical calls
+with identical settings hit the cache.
+
+Two tiers:
+- in-memory LRU (per process, ``LLM_CACHE_MAXSIZE`` entries)
+- persistent SQLite tier (``.cache/llm.sqlite``, ``LLM_CACHE_TTL`` seconds)
+
+Set ``LLM_CACHE=0`` to disable caching globally, or pass ``cache=False`` to a
+single ``_llm()`` factory to opt out at that call site.
+
+LangChain stores a generation before any output parser sees it, so callers that
+validate the text (tools/synth.py) use ``evict_response`` to drop a response
+that failed to parse instead of replaying it for the whole TTL.
+"""
+
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Optional, Sequence
+
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+from langchain_core.outputs import Generation
+
+from configs.telemetry import emit
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE", "1") not in ("0", "false", "False")
+LLM_CACHE_MAXSIZE = int(os.getenv("LLM_CACHE_MAXSIZE", "1024"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(30 * 24 * 3600)))
+
+
+def _cache_key(prompt: str, llm_string: str) -> str:
+    return hashlib.sha256(f"{llm_string}\x00{prompt}".encode("utf-8")).hexdigest()
+
+
+class TieredLLMCache(BaseCache):
+    """
+    In-memory LRU in front of an optional persistent SQLite tier.
+
+    Args:
+        maxsize (int): Number of entries kept in the in-memory LRU.
+        persistent (bool): Whether to read/write the SQLite tier.
+        ttl (float): Lifetime of persistent entries, in seconds.
+    """
+
+    def __init__(self, maxsize: int = LLM_CACHE_MAXSIZE, persistent: bool = True, ttl: float = LLM_CACHE_TTL):
+        self._maxsize = maxsize
+        self._memory: "OrderedDict[str, Sequence[Generation]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._persistent = persistent
+        self._ttl = ttl
+        self._store = None
+
+    def _disk(self):
+        # Imported lazily: tools/ imports configs/ at module load time.
+        if self._persistent and self._store is None:
+            from tools.cache import TTLCache
+            self._store = TTLCache("llm", ttl=self._ttl)
+        return self._store
+
+    def _remember(self, key: str, value: Sequence[Generation]) -> None:
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self._maxsize:
+                self._memory.popitem(last=False)
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[Sequence[Generation]]:
+        key = _cache_key(prompt, llm_string)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                emit("cache_hit", "llm")
+                return self._memory[key]
+
+        # The SQLite tier counts its own hits/misses (TTLCache stats, also named "llm").
+        store = self._disk()
+        if store is None:
+            emit("cache_miss", "llm")
+            return None
+        raw = store.get(key)
+        if raw is None:
+            return None
+        try:
+            generations = [loads(g) for g in raw]
+        except Exception:
+            return None
+        self._remember(key, generations)
+        return generations
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Generation]) -> None:
+        key = _cache_key(prompt, llm_string)
+        self._remember(key, return_val)
+        store = self._disk()
+        if store is not None:
+            store.set(key, [dumps(g) for g in return_val])
+
+    def evict(self, prompt: str, llm_string: str) -> None:
+        """Drop one entry from both tiers."""
+        key = _cache_key(prompt, llm_string)
+        with self._lock:
+            self._memory.pop(key, None)
+        store = self._disk()
+        if store is not None:
+            store.delete(key)
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock:
+            self._memory.clear()
+        store = self._disk()
+        if store is not None:
+            store.clear()
+
+
+_LLM_CACHE: Optional[TieredLLMCache] = None
+_LLM_CACHE_LOCK = threading.Lock()
+
+
+def get_llm_cache(enabled: bool = True):
+    """
+    Return the process-wide cache, or ``False`` when caching is disabled.
+
+    The return value is meant to be passed straight to ``ChatOpenAI(cache=...)``:
+    ``False`` explicitly bypasses any global LangChain cache as well.
+    """
+    global _LLM_CACHE
+    if not (enabled and LLM_CACHE_ENABLED):
+        return False
+    if _LLM_CACHE is None:
+        with _LLM_CACHE_LOCK:
+            if _LLM_CACHE is None:
+                _LLM_CACHE = TieredLLMCache()
+    return _LLM_CACHE
+
+
+def evict_response(model: Any, messages: Sequence[Any]) -> None:
+    """
+    Remove the cached response of ``model`` for ``messages`` (no-op if the model is uncached).
+
+    Uses the same key as ``BaseChatModel._generate_with_cache``: the serialized
+    message list and the model's ``llm_string``.
+    """
+    cache = getattr(model, "cache", None)
+    if isinstance(cache, TieredLLMCache):
+        cache.evict(dumps(list(messages)), model._get_llm_string(stop=None))
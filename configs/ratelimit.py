@@ -0,0 +1,286 @@
+"""
+Process-wide rate limits shared by every concurrent graph run.
+
+Each provider gets a named token bucket (``llm``, ``search``). Callers block in
+``acquire(name)`` (or await ``aacquire(name)``) until a token is available, so
+many threads or coroutines running research questions at once still respect one
+global request rate per provider.
+
+Rates come from the environment (requests per second, ``0`` = unlimited):
+- ``LLM_RATE_LIMIT`` / ``LLM_RATE_BURST``
+- ``SEARCH_RATE_LIMIT`` / ``SEARCH_RATE_BURST``
+- ``LLM_TOKENS_RATE_LIMIT`` / ``LLM_TOKENS_RATE_BURST``: token budget (tokens per
+  second, i.e. the provider's TPM / 60). ``acquire("llm", tokens=estimate)`` takes
+  the estimate up front; ``charge("llm", actual - estimate)`` settles afterwards,
+  so a large completion puts the bucket in debt and slows the next callers down.
+
+and can be changed at runtime with ``configure(name, rate, burst)`` (the batch
+runner does this from its command line). An unlimited provider still gets a
+pause-only bucket: it hands out requests without counting them, but honours
+``penalize`` pauses and lets interactive waiters go before batch ones, so a 429
+slows every concurrent caller down even when no rate is configured.
+
+Priorities: waiters are served by priority, not arrival. Code running inside
+``with priority("batch"):`` (the batch runner) only gets a token when no
+``"interactive"`` caller (the default) is waiting for the same bucket. The level
+lives in a ``ContextVar``, so it follows a run into its worker threads and tasks.
+
+Backoff: ``retry_delay(attempt, retry_after)`` is full-jitter exponential backoff
+(``RATE_BACKOFF_BASE`` * 2**attempt, capped at ``RATE_BACKOFF_MAX``) that never
+undercuts the server's ``Retry-After``. ``penalize(name, seconds)`` pauses the
+whole bucket after a 429, so every concurrent run backs off, not just the one
+that was refused. ``call_with_retry`` combines the pieces for plain callables.
+
+Hooks:
+- LLM: the shared httpx clients in ``configs/llm.py`` go through a retrying
+  transport that takes ``"llm"`` request/token budgets on every attempt and
+  retries 429 / 5xx / transport errors with the backoff above.
+- Search: ``tools/web.py`` calls the search backend (DuckDuckGo by default) through
+  ``call_with_retry("search", ...)``; cache hits are not limited.
+"""
+
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple, Type, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+RATE_RETRY_ATTEMPTS = int(os.getenv("RATE_RETRY_ATTEMPTS", "4"))    # retries after the first attempt
+RATE_BACKOFF_BASE = float(os.getenv("RATE_BACKOFF_BASE", "0.5"))     # seconds
+RATE_BACKOFF_MAX = float(os.getenv("RATE_BACKOFF_MAX", "30"))        # seconds
+
+INTERACTIVE = 0
+BATCH = 1
+_PRIORITY_LEVELS = {"interactive": INTERACTIVE, "batch": BATCH}
+_PRIORITY: contextvars.ContextVar[int] = contextvars.ContextVar("rc_rate_priority", default=INTERACTIVE)
+_PRIORITY_POLL = 0.05  # seconds a lower-priority caller re-checks an unlimited bucket
+
+
+@contextmanager
+def priority(level: str) -> Iterator[None]:
+    """Run the block (and threads/tasks started from it) at ``"interactive"`` or ``"batch"`` priority."""
+    token = _PRIORITY.set(_PRIORITY_LEVELS[level])
+    try:
+        yield
+    finally:
+        _PRIORITY.reset(token)
+
+
+def current_priority() -> int:
+    return _PRIORITY.get()
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket with priority-ordered waiters.
+
+    Args:
+        rate (float): Tokens added per second; ``<= 0`` means unlimited (the bucket
+            then only enforces ``pause`` and priority order).
+        burst (float, optional): Bucket capacity; defaults to ``max(1, rate)``.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = float(rate)
+        self.capacity = float(burst) if burst else max(1.0, self.rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._waiting = [0] * len(_PRIORITY_LEVELS)  # blocked callers per priority level
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _reserve(self, n: float, prio: int = INTERACTIVE) -> float:
+        """Take ``n`` tokens if available; otherwise return the seconds to wait before retrying."""
+        n = min(n, self.capacity)  # a request larger than the burst still gets through, at the full-bucket rate
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return self._paused_until - now
+            if self.rate <= 0:
+                return _PRIORITY_POLL if any(self._waiting[:prio]) else 0.0
+            self._refill(now)
+            if any(self._waiting[:prio]):
+                # a higher-priority caller is queued: let it have the next token
+                return max(n - self._tokens, 1.0) / self.rate
+            if self._tokens >= n:
+                self._tokens -= n
+                return 0.0
+            return (n - self._tokens) / self.rate
+
+    def _queue(self, prio: int, delta: int) -> None:
+        with self._lock:
+            self._waiting[prio] += delta
+
+    def acquire(self, n: float = 1.0) -> float:
+        """Block until ``n`` tokens are taken; returns the total time spent waiting."""
+        prio = current_priority()
+        delay = self._reserve(n, prio)
+        if delay <= 0:
+            return 0.0
+        waited = 0.0
+        self._queue(prio, 1)
+        try:
+            while delay > 0:
+                time.sleep(delay)
+                waited += delay
+                delay = self._reserve(n, prio)
+        finally:
+            self._queue(prio, -1)
+        return waited
+
+    async def aacquire(self, n: float = 1.0) -> float:
+        """Async ``acquire``: waits with ``asyncio.sleep`` so the event loop keeps running."""
+        prio = current_priority()
+        delay = self._reserve(n, prio)
+        if delay <= 0:
+            return 0.0
+        waited = 0.0
+        self._queue(prio, 1)
+        try:
+            while delay > 0:
+                await asyncio.sleep(delay)
+                waited += delay
+                delay = self._reserve(n, prio)
+        finally:
+            self._queue(prio, -1)
+        return waited
+
+    def charge(self, n: float) -> None:
+        """Take (or with ``n < 0`` refund) tokens without waiting; the balance may go negative."""
+        if self.rate <= 0:
+            return
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self.capacity, self._tokens - n)
+
+    def pause(self, seconds: float) -> None:
+        """Hand out no tokens for ``seconds`` (e.g. after the provider answered 429)."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+def _env_float(name: str, default: str = "0") -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return 0.0
+
+
+_LIMITERS: Dict[str, TokenBucket] = {}
+_LOCK = threading.Lock()
+
+
+def configure(name: str, rate: float, burst: Optional[float] = None) -> None:
+    """Set the limit for ``name``; ``rate <= 0`` makes it unlimited (pause-only)."""
+    with _LOCK:
+        _LIMITERS[name] = TokenBucket(max(0.0, rate), burst)
+
+
+def get_limiter(name: str) -> TokenBucket:
+    """Return the bucket for ``name``, created from the environment on first use (pause-only if unlimited)."""
+    if name not in _LIMITERS:
+        with _LOCK:
+            if name not in _LIMITERS:
+                prefix = name.upper()
+                rate = _env_float(f"{prefix}_RATE_LIMIT")
+                burst = _env_float(f"{prefix}_RATE_BURST") or None
+                _LIMITERS[name] = TokenBucket(max(0.0, rate), burst)
+    return _LIMITERS[name]
+
+
+def acquire(name: str, n: float = 1.0, tokens: float = 0.0) -> float:
+    """
+    Wait for ``n`` requests from ``name`` and, if ``tokens`` is given, for that many
+    from its ``<name>_tokens`` budget (unlimited buckets only wait out pauses); returns seconds waited.
+    """
+    waited = get_limiter(name).acquire(n)
+    if tokens > 0:
+        waited += get_limiter(f"{name}_tokens").acquire(tokens)
+    return waited
+
+
+async def aacquire(name: str, n: float = 1.0, tokens: float = 0.0) -> float:
+    """Async ``acquire`` for code running on an event loop."""
+    waited = await get_limiter(name).aacquire(n)
+    if tokens > 0:
+        waited += await get_limiter(f"{name}_tokens").aacquire(tokens)
+    return waited
+
+
+def charge(name: str, tokens: float) -> None:
+    """Settle ``name``'s token budget once the real usage is known (negative = refund)."""
+    if tokens:
+        get_limiter(f"{name}_tokens").charge(tokens)
+
+
+def penalize(name: str, seconds: float) -> None:
+    """Pause ``name``'s request bucket for everyone (also when its rate is unlimited)."""
+    if seconds > 0:
+        get_limiter(name).pause(seconds)
+
+
+# -------------------- backoff --------------------
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """``Retry-After`` header (seconds or HTTP date) -> seconds, or ``None``."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """Full-jitter exponential backoff for retry ``attempt`` (0-based), at least ``retry_after``."""
+    delay = random.uniform(0, min(RATE_BACKOFF_MAX, RATE_BACKOFF_BASE * (2 ** attempt)))
+    if retry_after is not None:
+        delay = max(delay, min(retry_after, RATE_BACKOFF_MAX * 4))
+    return delay
+
+
+def call_with_retry(
+    name: str,
+    fn: Callable[..., T],
+    *args: Any,
+    retry_on: Tuple[Type[BaseException], ...] = (TimeoutError, ConnectionError),
+    rate_limited: Tuple[Type[BaseException], ...] = (),
+    attempts: int = RATE_RETRY_ATTEMPTS,
+    **kwargs: Any,
+) -> T:
+    """
+    ``fn(*args, **kwargs)`` under ``name``'s rate limit, retried with backoff.
+
+    Every attempt waits for a token. Exceptions in ``retry_on`` are retried up to
+    ``attempts`` times; those in ``rate_limited`` also pause the shared bucket.
+    The last error is re-raised.
+    """
+    for attempt in range(attempts + 1):
+        acquire(name)
+        try:
+            return fn(*args, **kwargs)
+        except retry_on + rate_limited as e:
+            if attempt >= attempts:
+                raise
+            delay = retry_delay(attempt)
+            if isinstance(e, rate_limited):
+                penalize(name, delay)
+            logger.warning(f"{name}: {type(e).__name__} ({e}); retry {attempt + 1}/{attempts} in {delay:.1f}s")
+            time.sleep(delay)
+    raise AssertionError("unreachable")
@@ -0,0 +1,41 @@
+"""
+Run-scoped telemetry hook.
+
+Low-level code (fetching, caches) reports what it did with
+``emit(kind, name, value)`` without knowing who is listening. A run binds a
+sink with ``bind(sink)``; the binding lives in a ``ContextVar``, so it follows
+the run into asyncio tasks and context-copying thread pools, and concurrent
+runs never see each other's events. With no sink bound, ``emit`` is a no-op.
+
+Event kinds in use:
+- ``fetch_bytes`` (value = response bytes read), name = host
+- ``cache_hit`` / ``cache_miss`` (value = count), name = cache name
+- ``tool_error``, name = tool / call site
+
+The consumer is ``chains/instrumentation.py`` (``RunTracer``).
+"""
+
+import contextvars
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+Sink = Callable[[str, str, float], None]
+
+_SINK: contextvars.ContextVar[Optional[Sink]] = contextvars.ContextVar("rc_telemetry_sink", default=None)
+
+
+def emit(kind: str, name: str = "", value: float = 1.0) -> None:
+    """Report one event to the sink bound in the current context, if any."""
+    sink = _SINK.get()
+    if sink is not None:
+        sink(kind, name, value)
+
+
+@contextmanager
+def bind(sink: Sink) -> Iterator[None]:
+    """Route ``emit`` calls made in this context (and contexts copied from it) to ``sink``."""
+    token = _SINK.set(sink)
+    try:
+        yield
+    finally:
+        _SINK.reset(token)
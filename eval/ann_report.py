@@ -0,0 +1,137 @@
+# eval/ann_report.py
+"""
+Recall-vs-latency report for the local RAG index types (tools/local_rag.py).
+
+Builds every requested index type over the current data/ corpus (vectors come
+from the embedding cache, so no embedding work after the first build), sweeps
+nprobe / efSearch, and compares each configuration against exact (flat) search.
+
+Run from the repo root:
+    python -m eval.ann_report --types flat,ivf_flat,hnsw,ivf_pq --k 10 --queries 200
+    python -m eval.ann_report --out eval/ann_report.json
+
+Columns: build time, index size, recall@k vs. exact search, p50/p95 latency per query.
+Pick the cheapest row that meets your recall target, then set RAG_INDEX_TYPE /
+RAG_NPROBE / RAG_EF_SEARCH accordingly.
+"""
+
+import argparse
+import json
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+from tools import local_rag
+
+
+def _corpus_vectors() -> np.ndarray:
+    """Embeddings of every chunk in the current index, via the embedding cache."""
+    index = local_rag._build_index()
+    ids = [cid for _, cid in sorted(index.index_to_docstore_id.items())]
+    texts = [index.docstore.search(cid).page_content for cid in ids]
+    return np.asarray(local_rag._get_embeddings().embed_documents(texts), dtype=np.float32)
+
+
+def _queries(vectors: np.ndarray, n: int, seed: int = 0) -> np.ndarray:
+    """Sample corpus vectors and perturb them slightly, so queries are realistic but not exact hits."""
+    rng = np.random.default_rng(seed)
+    picked = vectors[rng.choice(len(vectors), size=min(n, len(vectors)), replace=False)]
+    noise = rng.normal(scale=0.01 * float(np.std(vectors)), size=picked.shape).astype(np.float32)
+    return picked + noise
+
+
+def _measure(raw_index, queries: np.ndarray, truth: np.ndarray, k: int) -> Dict[str, float]:
+    latencies: List[float] = []
+    hits = 0
+    for i, q in enumerate(queries):
+        t0 = time.perf_counter()
+        _, found = raw_index.search(q[None, :], k)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        hits += len(set(found[0].tolist()) & set(truth[i].tolist()))
+    return {
+        "recall": hits / (k * len(queries)),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+    }
+
+
+def run_report(types: List[str], k: int, n_queries: int, nprobes: List[int], efs: List[int]) -> List[Dict[str, Any]]:
+    import faiss
+
+    vectors = _corpus_vectors()
+    queries = _queries(vectors, n_queries)
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, truth = exact.search(queries, k)
+
+    rows: List[Dict[str, Any]] = []
+    for index_type in types:
+        t0 = time.perf_counter()
+        raw_index = local_rag._make_ann_index(vectors, index_type)
+        build_s = time.perf_counter() - t0
+        size_mb = len(faiss.serialize_index(raw_index)) / 1e6
+
+        name = type(raw_index).__name__
+        if "IVF" in name:
+            sweep = [{"nprobe": v} for v in nprobes]
+        elif "HNSW" in name:
+            sweep = [{"efSearch": v} for v in efs]
+        else:
+            sweep = [{}]
+
+        for params in sweep:
+            local_rag._apply_search_params(
+                raw_index,
+                nprobe=params.get("nprobe", local_rag.RAG_NPROBE),
+                ef_search=params.get("efSearch", local_rag.RAG_EF_SEARCH),
+            )
+            rows.append({
+                "type": index_type,
+                "faiss_index": name,
+                "params": params,
+                "vectors": int(len(vectors)),
+                "build_s": round(build_s, 3),
+                "size_mb": round(size_mb, 2),
+                **{key: round(val, 4) for key, val in _measure(raw_index, queries, truth, k).items()},
+            })
+    return rows
+
+
+def _ints(text: str) -> List[int]:
+    return [int(x) for x in text.split(",") if x.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall-vs-latency report for local RAG index types.")
+    parser.add_argument("--types", default="flat,ivf_flat,hnsw,ivf_pq,hnsw_pq", help="comma-separated index types")
+    parser.add_argument("--k", type=int, default=10, help="neighbours per query")
+    parser.add_argument("--queries", type=int, default=200, help="number of sampled queries")
+    parser.add_argument("--nprobe", default="1,4,16,64", help="IVF nprobe values to sweep")
+    parser.add_argument("--ef", default="16,64,256", help="HNSW efSearch values to sweep")
+    parser.add_argument("--out", default=None, help="optional JSON output path")
+    args = parser.parse_args()
+
+    rows = run_report(
+        [t.strip() for t in args.types.split(",") if t.strip()],
+        k=args.k,
+        n_queries=args.queries,
+        nprobes=_ints(args.nprobe),
+        efs=_ints(args.ef),
+    )
+
+    print(f"{'type':<10}{'faiss_index':<14}{'params':<18}{'build_s':>9}{'size_mb':>9}{'recall':>8}{'p50_ms':>9}{'p95_ms':>9}")
+    for r in rows:
+        params = ",".join(f"{key}={val}" for key, val in r["params"].items()) or "-"
+        print(
+            f"{r['type']:<10}{r['faiss_index']:<14}{params:<18}{r['build_s']:>9}{r['size_mb']:>9}"
+            f"{r['recall']:>8}{r['p50_ms']:>9}{r['p95_ms']:>9}"
+        )
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# eval/bench_html_extract.py
+"""
+Benchmark for HTML main-content extraction (tools/html_extract.py).
+
+Compares the density-based extractor used by docsum._html_to_text against the
+old regex tag stripper on saved pages in eval/fixtures/html/: extraction time,
+output size, estimated tokens, and the number of chunks the text splitter
+produces (i.e. what downstream summarization/synthesis pays for).
+
+Run from the repo root:
+    python -m eval.bench_html_extract
+    python -m eval.bench_html_extract --fixtures path/to/pages --repeat 50 --out eval/html_extract.json
+
+Drop any saved .html page into the fixtures directory to include it.
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+import time
+from typing import Any, Callable, Dict, List
+
+from tools.docsum import _TEXT_SPLITTER
+from tools.html_extract import extract_main_text
+
+_FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "html")
+_TAG_RE = re.compile(r"<[^>]+>")
+
+
+def _regex_strip(html: str) -> str:
+    """The previous _html_to_text: strip tags, collapse whitespace."""
+    return re.sub(r"\s+", " ", _TAG_RE.sub(" ", html)).strip()
+
+
+def _token_counter() -> Callable[[str], int]:
+    try:
+        import tiktoken
+
+        enc = tiktoken.get_encoding("cl100k_base")
+        return lambda text: len(enc.encode(text))
+    except Exception:
+        return lambda text: len(text) // 4
+
+
+def _time_ms(fn: Callable[[str], str], html: str, repeat: int) -> float:
+    fn(html)  # warm-up
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn(html)
+    return (time.perf_counter() - t0) * 1000 / repeat
+
+
+def run_bench(fixtures_dir: str, repeat: int) -> List[Dict[str, Any]]:
+    count_tokens = _token_counter()
+    extractors = {"regex": _regex_strip, "density": extract_main_text}
+    rows: List[Dict[str, Any]] = []
+    for path in sorted(glob.glob(os.path.join(fixtures_dir, "*.html"))):
+        with open(path, "r", encoding="utf-8") as f:
+            html = f.read()
+        for name, fn in extractors.items():
+            text = fn(html)
+            rows.append({
+                "page": os.path.basename(path),
+                "extractor": name,
+                "html_kb": round(len(html.encode("utf-8")) / 1024, 1),
+                "ms": round(_time_ms(fn, html, repeat), 3),
+                "chars": len(text),
+                "tokens": count_tokens(text),
+                "chunks": len(_TEXT_SPLITTER.split_text(text)),
+            })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark HTML main-content extraction on saved pages.")
+    parser.add_argument("--fixtures", default=_FIXTURES, help="directory of saved .html pages")
+    parser.add_argument("--repeat", type=int, default=20, help="timed runs per page and extractor")
+    parser.add_argument("--out", default=None, help="optional JSON output path")
+    args = parser.parse_args()
+
+    rows = run_bench(args.fixtures, args.repeat)
+    if not rows:
+        raise SystemExit(f"no .html fixtures found in {args.fixtures}")
+
+    print(f"{'page':<22}{'extractor':<10}{'html_kb':>9}{'ms':>9}{'chars':>8}{'tokens':>8}{'chunks':>8}")
+    for r in rows:
+        print(
+            f"{r['page']:<22}{r['extractor']:<10}{r['html_kb']:>9}{r['ms']:>9}"
+            f"{r['chars']:>8}{r['tokens']:>8}{r['chunks']:>8}"
+        )
+
+    totals = {
+        name: {key: sum(r[key] for r in rows if r["extractor"] == name) for key in ("ms", "tokens", "chunks")}
+        for name in ("regex", "density")
+    }
+    saved = 1 - totals["density"]["tokens"] / max(1, totals["regex"]["tokens"])
+    print(
+        f"\ntotal tokens: regex {totals['regex']['tokens']} -> density {totals['density']['tokens']} "
+        f"({saved:.0%} fewer); chunks {totals['regex']['chunks']} -> {totals['density']['chunks']}; "
+        f"time {totals['regex']['ms']:.2f} ms -> {totals['density']['ms']:.2f} ms"
+    )
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"rows": rows, "totals": totals}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+# eval/bench_offline.py
+"""
+Offline performance benchmark for the research pipeline, with a regression gate.
+
+Everything external is replaced by the local stand-ins in eval/fakes.py:
+- the LLM is a fake OpenAI-compatible server (``--llm-latency`` per call)
+- web search is ``eval.fakes:fake_search``
+- pages come from fixture servers on localhost
+- embeddings are deterministic fakes (``RAG_EMBEDDINGS=fake``)
+The run needs no network access and no API keys. LLM / search / page caches
+are disabled (or expire immediately), so every repeat does the real work.
+
+Measured (p50 / p95 / mean in ms):
+- tools: ``read_html`` (fetch + extract + split), ``_html_to_text``, the splitter
+- local RAG: ``_build_index`` cold and no-op, ``local_search``
+- graph: ``build_graph`` end-to-end and each node (via chains/instrumentation.py),
+  plus ``build_async_graph`` running all questions concurrently on one loop
+  (``--pipelined`` / ``--hybrid`` benchmark the pipelined and local-first variants)
+- counters per graph run: LLM calls, prompt/completion tokens, fetched bytes
+
+Run from the repo root:
+    python -m eval.bench_offline --out eval/bench_offline.json
+    python -m eval.bench_offline --baseline eval/bench_offline.json --tolerance 0.25
+
+With ``--baseline`` the process exits with status 1 when any timing p50 (or
+counter) is worse than the baseline by more than ``--tolerance``. Tiny timings
+are ignored below ``--min-delta-ms``. Baselines are machine-specific; record
+them on the box that runs the gate.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+from eval import fakes
+
+_QUESTIONS = [
+    "What is LangGraph and how does it manage state?",
+    "How do vector databases index embeddings?",
+    "Explain retrieval augmented generation",
+    "What limits the throughput of LLM agents?",
+]
+
+
+def _summary(samples_ms: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples_ms)
+    return {
+        "n": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered), 3),
+        "p50_ms": round(ordered[len(ordered) // 2], 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+        "min_ms": round(ordered[0], 3),
+    }
+
+
+def _time(fn: Callable[[], Any], repeat: int, warmup: int = 1) -> Dict[str, float]:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return _summary(samples)
+
+
+def _setup_env(args: argparse.Namespace, workdir: str) -> Dict[str, str]:
+    """Start the stand-ins and point the app at them (before any tools/ or configs/ import)."""
+    chat_url = fakes.start_chat_server(args.llm_latency, args.llm_per_token)
+    bases = fakes.start_fixture_servers(args.hosts, args.page_latency)
+    data_dir = os.path.join(workdir, "data")
+    os.makedirs(data_dir)
+    os.environ.update({
+        "RC_CACHE_DIR": os.path.join(workdir, "cache"),
+        "DEEPSEEK_BASE_URL": chat_url,
+        "DEEPSEEK_API_KEY": "offline",
+        "SEARCH_BACKEND": "eval.fakes:fake_search",
+        "RAG_EMBEDDINGS": "fake",
+        "RAG_DATA_DIR": data_dir,
+        "FAKE_SEARCH_LATENCY": str(args.search_latency),
+        "RAG_WATCH": "0",
+        # measure the work, not cache hits
+        "LLM_CACHE": "0",
+        "SEARCH_CACHE_TTL": "0",
+        "PAGE_CACHE_TTL": "0",
+    })
+    return {"chat": chat_url, "pages": ",".join(bases), "data_dir": data_dir}
+
+
+# -------------------- suites --------------------
+def bench_tools(repeat: int) -> Dict[str, Dict[str, float]]:
+    from tools import docsum
+
+    base = os.environ["FAKE_PAGE_BASES"].split(",")[0]
+    pages = fakes.fixture_pages()
+    htmls = []
+    for name in pages:
+        with open(os.path.join(fakes.FIXTURES_DIR, name), "r", encoding="utf-8") as f:
+            htmls.append(f.read())
+    texts = [docsum._html_to_text(h) for h in htmls]
+
+    return {
+        "tools.read_html": _time(lambda: [docsum.read_html(f"{base}/p/0/{p}", use_cache=False) for p in pages], repeat),
+        "tools.html_to_text": _time(lambda: [docsum._html_to_text(h) for h in htmls], repeat),
+        "tools.split_text": _time(lambda: [docsum._split_text("bench", t) for t in texts], repeat),
+    }
+
+
+def _write_corpus(data_dir: str, docs: int) -> None:
+    from tools import docsum
+
+    texts = []
+    for name in fakes.fixture_pages():
+        with open(os.path.join(fakes.FIXTURES_DIR, name), "r", encoding="utf-8") as f:
+            texts.append(docsum._html_to_text(f.read()))
+    for i in range(docs):
+        with open(os.path.join(data_dir, f"doc_{i:04d}.txt"), "w", encoding="utf-8") as f:
+            f.write(f"Document {i}.\n\n" + "\n\n".join(texts[(i + j) % len(texts)] for j in range(3)))
+
+
+def bench_rag(repeat: int) -> Dict[str, Dict[str, float]]:
+    from tools import local_rag
+
+    def cold_build():
+        for name in ("manifest.json", "index.faiss", "index.pkl"):
+            path = os.path.join(local_rag._INDEX_DIR, name)
+            if os.path.exists(path):
+                os.remove(path)
+        return local_rag._build_index()
+
+    results = {"rag.build_index_cold": _time(cold_build, repeat)}
+    index = local_rag._build_index()
+    results["rag.build_index_noop"] = _time(lambda: local_rag._build_index(index), repeat)
+    local_rag._swap_index(index)
+    results["rag.local_search"] = _time(
+        lambda: [local_rag.local_search.invoke({"query": q, "k": 4}) for q in _QUESTIONS], repeat
+    )
+    return results
+
+
+def bench_graph(repeat: int, pipelined: bool = False, hybrid: bool = False) -> Dict[str, Any]:
+    from chains.instrumentation import MetricsRegistry, RunTracer
+    from chains.research_graph import build_async_graph, build_graph, run_config
+
+    app = build_graph(pipelined=pipelined, hybrid=hybrid)
+    e2e: List[float] = []
+    per_node: Dict[str, List[float]] = {}
+    counters: Dict[str, List[float]] = {}
+    registry = MetricsRegistry()  # keep the bench out of the process-wide metrics
+
+    def traced_run(i: int, q: str) -> None:
+        tracer = RunTracer(f"bench-{i}", registry=registry)
+        t0 = time.perf_counter()
+        with tracer:
+            app.invoke({"input": q}, config=run_config(f"bench-{i}"))
+        e2e.append((time.perf_counter() - t0) * 1000)
+        trace = tracer.trace()
+        for n in trace["nodes"]:
+            per_node.setdefault(n["node"], []).append(n["duration"] * 1000)
+        llm = trace["llm"].values()
+        for key, value in (
+            ("llm_calls", sum(s["calls"] for s in llm)),
+            ("prompt_tokens", sum(s["prompt_tokens"] for s in llm)),
+            ("completion_tokens", sum(s["completion_tokens"] for s in llm)),
+            ("fetch_bytes", trace["fetch"]["bytes"]),
+            ("iterations", sum(1 for n in trace["nodes"] if n["node"] == "decide")),
+        ):
+            counters.setdefault(key, []).append(value)
+
+    app.invoke({"input": _QUESTIONS[0]}, config=run_config("bench-warmup"))
+    for r in range(repeat):
+        for i, q in enumerate(_QUESTIONS):
+            traced_run(r * len(_QUESTIONS) + i, q)
+
+    timings = {"graph.end_to_end": _summary(e2e)}
+    timings.update({f"graph.node.{name}": _summary(v) for name, v in sorted(per_node.items())})
+
+    # Async graph: all questions at once on one event loop, a fresh loop per round
+    async_app = build_async_graph(pipelined=pipelined, hybrid=hybrid)
+
+    async def concurrent_round(r: int) -> None:
+        await asyncio.gather(*(
+            async_app.ainvoke({"input": q}, config=run_config(f"abench-{r}-{i}")) for i, q in enumerate(_QUESTIONS)
+        ))
+
+    samples = []
+    for r in range(repeat + 1):
+        t0 = time.perf_counter()
+        asyncio.run(concurrent_round(r))
+        samples.append((time.perf_counter() - t0) * 1000)
+    timings["graph_async.concurrent_batch"] = _summary(samples[1:])  # first round is warm-up
+    return {
+        "timings": timings,
+        "counters": {f"graph.per_run.{k}": round(statistics.fmean(v), 2) for k, v in counters.items()},
+    }
+
+
+# -------------------- report / gate --------------------
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float, min_delta_ms: float) -> List[str]:
+    """Regressions of ``report`` against ``baseline`` (p50 timings and counters; higher is worse)."""
+    problems: List[str] = []
+    for name, cur in report["timings"].items():
+        base = (baseline.get("timings") or {}).get(name)
+        if not base:
+            continue
+        limit = base["p50_ms"] * (1 + tolerance)
+        if cur["p50_ms"] > limit and cur["p50_ms"] - base["p50_ms"] > min_delta_ms:
+            problems.append(f"{name}: p50 {cur['p50_ms']:.2f}ms > {limit:.2f}ms (baseline {base['p50_ms']:.2f}ms)")
+    for name, cur in report["counters"].items():
+        base = (baseline.get("counters") or {}).get(name)
+        if base is not None and cur > base * (1 + tolerance):
+            problems.append(f"{name}: {cur} > {base * (1 + tolerance):.2f} (baseline {base})")
+    return problems
+
+
+def _git_commit() -> str:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=10)
+        return out.stdout.strip()
+    except Exception:
+        return ""
+
+
+def _print_report(report: Dict[str, Any]) -> None:
+    print(f"{'benchmark':36} {'n':>4} {'p50 ms':>10} {'p95 ms':>10} {'mean ms':>10}")
+    for name, s in report["timings"].items():
+        print(f"{name:36} {s['n']:>4} {s['p50_ms']:>10.2f} {s['p95_ms']:>10.2f} {s['mean_ms']:>10.2f}")
+    for name, value in report["counters"].items():
+        print(f"{name:36} {value:>10}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline benchmark with local stand-ins for LLM, search and pages.")
+    parser.add_argument("--repeat", type=int, default=5, help="timed repetitions per benchmark")
+    parser.add_argument("--suites", default="tools,rag,graph", help="comma-separated: tools,rag,graph")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="fake LLM seconds per call")
+    parser.add_argument("--llm-per-token", type=float, default=0.0, help="fake LLM seconds per completion token")
+    parser.add_argument("--page-latency", type=float, default=0.0, help="fixture server seconds per page")
+    parser.add_argument("--search-latency", type=float, default=0.0, help="fake search seconds per query (0.5x-1.5x)")
+    parser.add_argument("--hosts", type=int, default=3, help="fixture hosts (each port is one domain)")
+    parser.add_argument("--pipelined", action="store_true", help="benchmark the pipelined gather graph")
+    parser.add_argument("--hybrid", action="store_true", help="benchmark the local-first hybrid graph (uses the RAG corpus)")
+    parser.add_argument("--rag-docs", type=int, default=40, help="text files in the generated RAG corpus")
+    parser.add_argument("--out", help="write the JSON report here")
+    parser.add_argument("--baseline", help="compare against this report; exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown vs. baseline (0.25 = +25%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=2.0, help="ignore regressions smaller than this")
+    parser.add_argument("--verbose", action="store_true", help="keep the pipeline's INFO logging")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="rc-bench-")
+    try:
+        env = _setup_env(args, workdir)
+        suites = {s.strip() for s in args.suites.split(",") if s.strip()}
+        # Importing the pipeline configures INFO logging; quiet it unless asked
+        import tools.local_rag  # noqa: F401
+        if not args.verbose:
+            logging.getLogger().setLevel(logging.WARNING)
+
+        report: Dict[str, Any] = {
+            "meta": {
+                "commit": _git_commit(),
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": sys.version.split()[0],
+                "platform": platform.platform(),
+                "args": {k: v for k, v in vars(args).items() if k not in ("out", "baseline", "verbose")},
+            },
+            "timings": {},
+            "counters": {},
+        }
+        if "tools" in suites:
+            report["timings"].update(bench_tools(args.repeat))
+        _write_corpus(env["data_dir"], args.rag_docs)
+        if "rag" in suites:
+            report["timings"].update(bench_rag(args.repeat))
+        if "graph" in suites:
+            graph = bench_graph(args.repeat, args.pipelined, args.hybrid)
+            report["timings"].update(graph["timings"])
+            report["counters"].update(graph["counters"])
+    finally:
+        fakes.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    _print_report(report)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        problems = compare(report, baseline, args.tolerance, args.min_delta_ms)
+        for p in problems:
+            print(f"REGRESSION {p}", file=sys.stderr)
+        if problems:
+            sys.exit(1)
+        print(f"no regressions vs {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+# eval/fakes.py
+"""
+Local stand-ins for the network dependencies, so the pipeline runs air-gapped.
+
+- Fake OpenAI-compatible chat server (``POST .../chat/completions``, plain and
+  streaming). Point the app at it with ``DEEPSEEK_BASE_URL``. Replies are canned
+  but shaped like the real thing: search queries for the plan prompt, a valid
+  ``Notes`` JSON citing the prompt's sources for synthesis, short text for
+  summaries. ``latency`` (seconds per call) and ``per_token`` (seconds per
+  completion token) simulate provider speed.
+- Fixture page servers: serve ``eval/fixtures/html/*.html`` at
+  ``/p/<n>/<name>.html`` on several ports. Every port counts as a separate
+  domain for ``select``, and ``<n>`` yields distinct URLs for the same page.
+- ``fake_search``: a ``SEARCH_BACKEND`` for tools/web.py. It returns fixture URLs
+  deterministically per query, spread over the fixture hosts. ``FAKE_SEARCH_LATENCY``
+  (seconds) delays each call by 0.5x-1.5x that value, varying per query.
+
+Standalone (e.g. to try ``app.run_graph`` offline):
+    python -m eval.fakes --latency 0.2
+    # then export the printed variables in another shell
+"""
+
+import os
+import json
+import time
+import zlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures", "html")
+
+_SERVERS: List[ThreadingHTTPServer] = []
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real endpoints
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+# -------------------- fake chat completions --------------------
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _section(prompt: str, marker: str) -> str:
+    """Text after ``marker`` up to the next blank line."""
+    start = prompt.find(marker)
+    if start < 0:
+        return ""
+    rest = prompt[start + len(marker):]
+    return rest.split("\n\n", 1)[0]
+
+
+def _fake_notes(prompt: str) -> str:
+    sources = [
+        line.strip() for line in _section(prompt, "【来源 - sources】").splitlines() if line.strip().startswith(("http", "file:"))
+    ]
+    topic = _section(prompt, "主题（可选）：").strip() or "the topic"
+    # Two claims per call, so the graph needs a second iteration to reach its "done" threshold
+    claims = [
+        {"text": f"{topic}: evidence from {urlparse(u).netloc}{urlparse(u).path}", "evidence_urls": [u]}
+        for u in sources[:2]
+    ]
+    return json.dumps({
+        "summary": f"Offline summary of {topic} from {len(sources)} sources.",
+        "key_points": [f"Point drawn from {u}" for u in sources[:3]] or ["No sources were provided."],
+        "claims": claims,
+        "open_questions": [f"What else is known about {topic}?"],
+    }, ensure_ascii=False)
+
+
+def fake_completion(prompt: str) -> str:
+    """Canned reply chosen by what the prompt asks for."""
+    if "JSON instance" in prompt:  # PydanticOutputParser format instructions (Notes / NotesDelta)
+        return _fake_notes(prompt)
+    if "search quer" in prompt:
+        question = (_section(prompt, "User question: ").splitlines() or [""])[0].strip() or "research question"
+        return "\n".join(f"{question} {suffix}" for suffix in ("overview", "documentation", "examples"))
+    return "离线摘要：" + " ".join(prompt.split())[:120]
+
+
+class FakeChatHandler(_Handler):
+    def do_POST(self) -> None:
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send(404, b'{"error": "not found"}', "application/json")
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        prompt = "\n".join(str(m.get("content") or "") for m in body.get("messages") or [])
+        text = fake_completion(prompt)
+        usage = {"prompt_tokens": _estimate_tokens(prompt), "completion_tokens": _estimate_tokens(text)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        time.sleep(self.server.latency + self.server.per_token * usage["completion_tokens"])
+
+        base = {"id": "chatcmpl-offline", "created": int(time.time()), "model": body.get("model", "fake")}
+        if body.get("stream"):
+            self._stream(base, text, usage)
+            return
+        reply = {
+            **base,
+            "object": "chat.completion",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": usage,
+        }
+        self._send(200, json.dumps(reply, ensure_ascii=False).encode("utf-8"), "application/json")
+
+    def _stream(self, base: Dict[str, Any], text: str, usage: Dict[str, int]) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        step = max(1, len(text) // 8)
+        deltas = [{"role": "assistant", "content": ""}] + [{"content": text[i:i + step]} for i in range(0, len(text), step)]
+        for i, delta in enumerate(deltas):
+            finish = "stop" if i == len(deltas) - 1 else None
+            chunk = {**base, "object": "chat.completion.chunk",
+                     "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]}
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+# -------------------- fixture pages --------------------
+class FixtureHandler(_Handler):
+    def do_GET(self) -> None:
+        parts = urlparse(self.path).path.strip("/").split("/")
+        name = parts[-1] if len(parts) == 3 and parts[0] == "p" else ""
+        path = os.path.join(self.server.fixtures_dir, os.path.basename(name))
+        if not name.endswith(".html") or not os.path.isfile(path):
+            self._send(404, b"not found", "text/plain")
+            return
+        time.sleep(self.server.latency)
+        with open(path, "rb") as f:
+            self._send(200, f.read(), "text/html; charset=utf-8")
+
+
+def _serve(handler: type, **attrs: Any) -> ThreadingHTTPServer:
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    srv.daemon_threads = True
+    for key, value in attrs.items():
+        setattr(srv, key, value)
+    threading.Thread(target=srv.serve_forever, name=f"fake-{handler.__name__}", daemon=True).start()
+    _SERVERS.append(srv)
+    return srv
+
+
+def start_chat_server(latency: float = 0.0, per_token: float = 0.0) -> str:
+    """Start the fake chat server; returns its base URL (use as ``DEEPSEEK_BASE_URL``)."""
+    srv = _serve(FakeChatHandler, latency=latency, per_token=per_token)
+    return f"http://127.0.0.1:{srv.server_port}/v1"
+
+
+def start_fixture_servers(hosts: int = 3, latency: float = 0.0, fixtures_dir: str = FIXTURES_DIR) -> List[str]:
+    """Serve the fixture pages on ``hosts`` ports; also exported as ``FAKE_PAGE_BASES`` for ``fake_search``."""
+    bases = [
+        f"http://127.0.0.1:{_serve(FixtureHandler, latency=latency, fixtures_dir=fixtures_dir).server_port}"
+        for _ in range(max(1, hosts))
+    ]
+    os.environ["FAKE_PAGE_BASES"] = ",".join(bases)
+    return bases
+
+
+def fixture_pages(fixtures_dir: str = FIXTURES_DIR) -> List[str]:
+    return sorted(f for f in os.listdir(fixtures_dir) if f.endswith(".html"))
+
+
+def shutdown() -> None:
+    while _SERVERS:
+        _SERVERS.pop().shutdown()
+
+
+# -------------------- fake search backend --------------------
+def fake_search(query: str, max_results: int = 5, bases: Optional[List[str]] = None) -> List[Dict[str, str]]:
+    """``SEARCH_BACKEND=eval.fakes:fake_search``: deterministic fixture URLs for ``query``."""
+    bases = bases or [b for b in os.getenv("FAKE_PAGE_BASES", "").split(",") if b]
+    pages = fixture_pages()
+    if not bases or not pages:
+        return []
+    seed = zlib.crc32(query.encode("utf-8"))
+    latency = float(os.getenv("FAKE_SEARCH_LATENCY", "0") or 0)
+    if latency > 0:
+        time.sleep(latency * (0.5 + (seed % 101) / 100))
+    results: List[Dict[str, str]] = []
+    for i in range(max_results):
+        n = seed + i
+        page = pages[n % len(pages)]
+        results.append({
+            "title": f"{page} ({query})",
+            "href": f"{bases[i % len(bases)]}/p/{n % 7}/{page}",
+            "snippet": f"Offline result {i + 1} for {query}",
+        })
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the offline stand-ins until interrupted.")
+    parser.add_argument("--latency", type=float, default=0.0, help="fake LLM seconds per call")
+    parser.add_argument("--per-token", type=float, default=0.0, help="fake LLM seconds per completion token")
+    parser.add_argument("--page-latency", type=float, default=0.0, help="fixture server seconds per page")
+    parser.add_argument("--hosts", type=int, default=3, help="number of fixture hosts (ports)")
+    args = parser.parse_args()
+
+    chat = start_chat_server(args.latency, args.per_token)
+    bases = start_fixture_servers(args.hosts, args.page_latency)
+    print(f"export DEEPSEEK_BASE_URL={chat} DEEPSEEK_API_KEY=offline")
+    print(f"export SEARCH_BACKEND=eval.fakes:fake_search FAKE_PAGE_BASES={','.join(bases)}")
+    print("export RAG_EMBEDDINGS=fake", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+# tools/cache.py
+"""
+本地缓存的公共设施：
+- CACHE_DIR: 缓存根目录（默认 <repo>/.cache，可用环境变量 RC_CACHE_DIR 覆盖）
+- cache_path(*parts): 返回缓存目录下的路径（自动创建父目录）
+- connect(path): 打开一个适合多线程共享的 SQLite 连接（WAL 模式）
+- CacheStats / cache_stats(): 命中/未命中计数（按缓存名汇总；同时上报给当前运行的观测，见 configs/telemetry.py）
+- TTLCache: 基于 SQLite 的持久化 KV（JSON 值 + 过期时间）；打开时及每 CACHE_PURGE_EVERY 次写入清理过期条目，
+  条目数超过 CACHE_MAX_ROWS 时淘汰最早过期的条目
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from typing import Any, Dict, Optional
+
+from configs.telemetry import emit
+
+CACHE_DIR = os.getenv("RC_CACHE_DIR") or os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache"
+)
+CACHE_MAX_ROWS = int(os.getenv("CACHE_MAX_ROWS", "100000"))     # 每个 TTLCache 的条目上限（0 = 不限）
+CACHE_PURGE_EVERY = int(os.getenv("CACHE_PURGE_EVERY", "1000"))  # 每多少次 set 清理一次过期条目
+
+
+def cache_path(*parts: str) -> str:
+    """拼接缓存路径，并确保父目录存在。"""
+    path = os.path.join(CACHE_DIR, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """SQLite 连接：允许跨线程使用（调用方自行加锁），WAL 提升并发读性能。"""
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+# -------------------- 命中统计 --------------------
+class CacheStats:
+    """线程安全的命中/未命中计数器。"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def hit(self, n: int = 1) -> None:
+        with self._lock:
+            self.hits += n
+        emit("cache_hit", self.name, n)
+
+    def miss(self, n: int = 1) -> None:
+        with self._lock:
+            self.misses += n
+        emit("cache_miss", self.name, n)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+            }
+
+
+_STATS: Dict[str, CacheStats] = {}
+_STATS_LOCK = threading.Lock()
+
+
+def get_stats(name: str) -> CacheStats:
+    """按名称获取（或创建）计数器，同名缓存共享一份统计。"""
+    with _STATS_LOCK:
+        if name not in _STATS:
+            _STATS[name] = CacheStats(name)
+        return _STATS[name]
+
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    """所有缓存的统计快照：{name: {hits, misses, hit_rate}}"""
+    with _STATS_LOCK:
+        items = list(_STATS.items())
+    return {name: s.snapshot() for name, s in items}
+
+
+# -------------------- 持久化 KV --------------------
+class TTLCache:
+    """
+    SQLite 持久化的 KV 缓存：值以 JSON 存储，按 ttl 过期（过期条目读取时视为未命中）。
+    每个实例对应 <CACHE_DIR>/<name>.sqlite；线程安全。
+    过期条目在打开时和每 CACHE_PURGE_EVERY 次 set 后删除；条目数超过 max_rows 时
+    按 expires_at 从早到晚淘汰，文件大小因此有上限。
+    """
+
+    def __init__(self, name: str, ttl: float, path: Optional[str] = None, max_rows: int = CACHE_MAX_ROWS):
+        self.name = name
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self.stats = get_stats(name)
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn = connect(path or cache_path(f"{name}.sqlite"))
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS kv_expires ON kv (expires_at)")
+        with self._lock:
+            self._compact_locked()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM kv WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] < time.time():
+            self.stats.miss()
+            return None
+        self.stats.hit()
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        payload = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)", (key, payload, expires_at)
+            )
+            self._writes += 1
+            if CACHE_PURGE_EVERY > 0 and self._writes % CACHE_PURGE_EVERY == 0:
+                self._compact_locked()
+            else:
+                self._conn.commit()
+
+    def _compact_locked(self) -> int:
+        """删除过期条目并把条目数压到 max_rows 以内（调用方持有锁），返回删除条数。"""
+        removed = self._conn.execute("DELETE FROM kv WHERE expires_at < ?", (time.time(),)).rowcount
+        if self.max_rows > 0:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM kv").fetchone()
+            if count > self.max_rows:
+                removed += self._conn.execute(
+                    "DELETE FROM kv WHERE key IN (SELECT key FROM kv ORDER BY expires_at LIMIT ?)",
+                    (count - self.max_rows,),
+                ).rowcount
+        self._conn.commit()
+        return removed
+
+    def purge_expired(self) -> int:
+        """删除已过期条目（并执行条目上限），返回删除条数。"""
+        with self._lock:
+            return self._compact_locked()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM kv")
+            self._conn.commit()
@@ -0,0 +1,188 @@
+# tools/context_pack.py
+"""
+上下文打包（供 synthesize / synthesize_notes 使用）
+- 计 token：tiktoken 编码器进程级缓存，不可用时按中英文字符估算；同一文本的计数也做缓存
+- 去重：精确去重 + SimHash（64 位，海明距离 <= CONTEXT_SIMHASH_DISTANCE 视为近重复）
+- 排序：以问题为查询，在候选 chunks 上算 BM25 相关性
+- 装箱：按相关性贪心填满 token 预算；同一来源每多选一段，后续得分打折，保证来源多样性
+
+用法：
+    packed = pack_context(chunks, query=question, sources=chunk_sources)
+    packed.chunks  # 送进 prompt 的分块（按选择顺序）
+    packed.duplicate_chunks  # 作为（近）重复被丢弃的分块：其内容已由选中的分块代表
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import math
+import hashlib
+import logging
+from collections import Counter
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))     # 送入综合 prompt 的分块 token 上限
+CONTEXT_SIMHASH_DISTANCE = int(os.getenv("CONTEXT_SIMHASH_DISTANCE", "6"))  # 近重复判定的海明距离（无关文本约 32）
+CONTEXT_SOURCE_PENALTY = float(os.getenv("CONTEXT_SOURCE_PENALTY", "0.5"))  # 同源每多一段，得分乘以 1/(1+penalty*n)
+CONTEXT_ENCODING = os.getenv("CONTEXT_ENCODING", "cl100k_base")
+
+_SEPARATOR_TOKENS = 4  # 分块之间 "\n\n---\n\n" 的开销
+_TERM_RE = re.compile(r"[\u4e00-\u9fff]|[a-z0-9]+")
+_CJK_RE = re.compile(r"[\u4e00-\u9fff\u3040-\u30ff\uac00-\ud7af]")
+
+
+# ---------------- token 计数 ----------------
+@lru_cache(maxsize=4)
+def get_tokenizer(encoding: str = CONTEXT_ENCODING) -> Callable[[str], int]:
+    """返回 text -> token 数 的函数；tiktoken 不可用（未安装/无法下载词表）时按字符估算。"""
+    try:
+        import tiktoken
+
+        enc = tiktoken.get_encoding(encoding)
+        return lambda text: len(enc.encode(text, disallowed_special=()))
+    except Exception as e:
+        logger.info(f"tiktoken 不可用，按字符估算 token 数: {e}")
+
+        def estimate(text: str) -> int:
+            cjk = len(_CJK_RE.findall(text))
+            return cjk + math.ceil((len(text) - cjk) / 4)
+
+        return estimate
+
+
+@lru_cache(maxsize=8192)
+def count_tokens(text: str) -> int:
+    return get_tokenizer()(text)
+
+
+# ---------------- 近重复检测 ----------------
+def _terms(text: str) -> List[str]:
+    # 英文按词、中文按字切分（足够用于去重与相关性，不引入分词器）
+    return _TERM_RE.findall(text.lower())
+
+
+def simhash(text: str, ngram: int = 3) -> int:
+    """64 位 SimHash：特征为 ngram 个连续词（中文为字）组成的 shingle。"""
+    terms = _terms(text)
+    shingles = [" ".join(terms[i:i + ngram]) for i in range(max(1, len(terms) - ngram + 1))]
+    weights = [0] * 64
+    for sh, n in Counter(shingles).items():
+        h = int.from_bytes(hashlib.blake2b(sh.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(64):
+            weights[bit] += n if (h >> bit) & 1 else -n
+    return sum(1 << bit for bit in range(64) if weights[bit] > 0)
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+# ---------------- 相关性 ----------------
+def _bm25_scores(query: str, docs: Sequence[str], k1: float = 1.5, b: float = 0.75) -> List[float]:
+    q_terms = set(_terms(query))
+    doc_terms = [Counter(_terms(d)) for d in docs]
+    if not q_terms or not docs:
+        return [0.0] * len(docs)
+    avg_len = sum(sum(tf.values()) for tf in doc_terms) / len(docs) or 1.0
+    df = {t: sum(1 for tf in doc_terms if t in tf) for t in q_terms}
+    scores: List[float] = []
+    for tf in doc_terms:
+        length = sum(tf.values())
+        s = 0.0
+        for t in q_terms:
+            if t not in tf:
+                continue
+            idf = math.log(1 + (len(docs) - df[t] + 0.5) / (df[t] + 0.5))
+            s += idf * tf[t] * (k1 + 1) / (tf[t] + k1 * (1 - b + b * length / avg_len))
+        scores.append(s)
+    return scores
+
+
+# ---------------- 打包 ----------------
+@dataclass
+class PackedContext:
+    chunks: List[str] = field(default_factory=list)
+    sources: List[Optional[str]] = field(default_factory=list)  # 与 chunks 对齐
+    tokens: int = 0
+    dropped_duplicates: int = 0
+    dropped_budget: int = 0
+    duplicate_chunks: List[str] = field(default_factory=list)  # 精确/近重复而被丢弃的分块（原文）
+
+
+def pack_context(
+    chunks: Sequence[str],
+    query: str = "",
+    sources: Optional[Sequence[Optional[str]]] = None,
+    budget: Optional[int] = None,
+) -> PackedContext:
+    """
+    在 token 预算内挑选与 query 最相关、互不重复、来源尽量分散的分块。
+
+    Args:
+        chunks: 候选分块（原始顺序作为同分时的次序）
+        query: 用于排序的问题/主题；为空时保持原始顺序
+        sources: 与 chunks 对齐的来源（URL 等），用于多样性；缺省视为同一来源
+        budget: token 预算，默认 CONTEXT_TOKEN_BUDGET
+    """
+    budget = CONTEXT_TOKEN_BUDGET if budget is None else budget
+    srcs = list(sources) if sources is not None else []
+    srcs += [None] * (len(chunks) - len(srcs))
+
+    # 1) 去掉空块与完全相同的块
+    seen_text: set = set()
+    cand_text: List[str] = []
+    cand_src: List[Optional[str]] = []
+    packed = PackedContext()
+    for text, src in zip(chunks, srcs):
+        key = " ".join(str(text).split())
+        if not key:
+            continue
+        if key in seen_text:
+            packed.duplicate_chunks.append(str(text))
+            continue
+        seen_text.add(key)
+        cand_text.append(str(text))
+        cand_src.append(src)
+    packed.dropped_duplicates = len(packed.duplicate_chunks)
+    if not cand_text:
+        return packed
+
+    scores = _bm25_scores(query, cand_text) if query else [0.0] * len(cand_text)
+    # 加一点按原始顺序递减的先验：同分（或无 query）时先来的优先，且得分恒为正，来源折扣始终生效
+    n = len(cand_text)
+    base = [s + 0.01 * (1 - i / n) for i, s in enumerate(scores)]
+    hashes = [simhash(t) for t in cand_text]
+    tokens = [count_tokens(t) + _SEPARATOR_TOKENS for t in cand_text]
+
+    # 2) 贪心：每步挑来源折扣后得分最高、且放得下的块；近重复直接淘汰
+    remaining = set(range(len(cand_text)))
+    picked_hashes: List[int] = []
+    per_source: Dict[Optional[str], int] = {}
+    used = 0
+    while remaining:
+        best = max(remaining, key=lambda i: base[i] / (1 + CONTEXT_SOURCE_PENALTY * per_source.get(cand_src[i], 0)))
+        remaining.discard(best)
+        if any(hamming(hashes[best], h) <= CONTEXT_SIMHASH_DISTANCE for h in picked_hashes):
+            packed.dropped_duplicates += 1
+            packed.duplicate_chunks.append(cand_text[best])
+            continue
+        if used + tokens[best] > budget:
+            packed.dropped_budget += 1
+            continue
+        used += tokens[best]
+        picked_hashes.append(hashes[best])
+        per_source[cand_src[best]] = per_source.get(cand_src[best], 0) + 1
+        packed.chunks.append(cand_text[best])
+        packed.sources.append(cand_src[best])
+
+    packed.tokens = used
+    logger.info(
+        f"Context packed: {len(packed.chunks)}/{len(cand_text)} chunks, {used}/{budget} tokens "
+        f"(dup {packed.dropped_duplicates}, over budget {packed.dropped_budget})"
+    )
+    return packed
@@ -2,27 +2,38 @@
 """
 文档读取 + 切分 + 摘要（支持 PDF / HTML）
 - read_pdf(path): 读取 PDF -> 切分 -> 返回 Document 列表
-- read_html(url): 抓取 HTML -> 纯文本提取 -> 切分 -> 返回 Document 列表
-- summarize_docs(docs, summary_words, chunk_words): 用 LangChain 的 map_reduce 摘要链生成摘要，支持长度控制
+- iter_pdf(path): 逐页惰性加载并切分，产出分块（大 PDF 不必整本载入内存）
+- read_html(url): 抓取 HTML -> 纯文本提取 -> 切分 -> 返回 Document 列表（带磁盘缓存与条件请求）
+- read_html_many(urls): 并发抓取多个 URL（共享连接池），结果与输入顺序一致
+- summarize_docs(docs, summary_words, chunk_words): 原生 map-reduce 摘要，支持长度控制
+    * map 阶段异步并发（SUMMARY_MAP_CONCURRENCY 上限），分块摘要按内容哈希缓存
+      —— 同一份 PDF 换 summary_words 重新摘要时只重跑 reduce
+    * reduce 输入超过 token 预算（SUMMARY_COLLAPSE_TOKENS）时先分组递归折叠
+- asummarize_docs(...): 异步版本；astream_summary(...): 流式产出分块摘要与最终摘要增量
 - summarize_pdf(path, summary_words, chunk_words): PDF 一步到位生成摘要
 - summarize_html(url, summary_words, chunk_words): HTML 一步到位生成摘要
 """
 
 import os
-import re
-import requests
-from typing import List, Optional
+import asyncio
+import hashlib
+import threading
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Union
 from dotenv import load_dotenv
 
 from langchain_community.document_loaders import PyPDFLoader
 from langchain_core.documents import Document
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.chains.summarize import load_summarize_chain
-from langchain_openai import ChatOpenAI
 from langchain_core.tools import tool
 from langchain_core.prompts import PromptTemplate
 from pydantic import BaseModel, Field
 
+from tools.fetch import afetch, afetch_many, fetch, fetch_many
+from tools.html_extract import extract_main_text
+from tools.page_cache import CachedPage, get_page_cache
+from tools.cache import TTLCache, get_stats
+from configs.llm import get_chat_model
+
 # ------------no logging history---------------
 # import logging
 # logging.getLogger("httpx").setLevel(logging.WARNING)
@@ -34,91 +45,332 @@ _TEXT_SPLITTER = RecursiveCharacterTextSplitter(
     chunk_size=800, chunk_overlap=100, separators=["\n\n", "\n", "。", "！", "？", "；", "，", " "]
 )
 
-def _llm(max_tokens: Optional[int] = None):
-    """DeepSeek 的 Chat LLM（兼容 OpenAI 协议）。"""
-    return ChatOpenAI(
-        model="deepseek-chat",
-        api_key=os.getenv("DEEPSEEK_API_KEY"),
-        base_url="https://api.deepseek.com",
-        temperature=0.2,
-        # 辅助限长：可选 max_tokens（不同版本也可能叫 max_completion_tokens）
-        max_tokens=max_tokens,
-    )
+def _llm(max_tokens: Optional[int] = None, cache: bool = True):
+    """DeepSeek 的 Chat LLM（兼容 OpenAI 协议）；进程级复用，cache=False 时不走响应缓存。"""
+    # 辅助限长：可选 max_tokens（不同版本也可能叫 max_completion_tokens）
+    return get_chat_model("deepseek", temperature=0.2, max_tokens=max_tokens, cache=cache)
 
 # --------- 读取 PDF ----------
+def iter_pdf(path: str) -> Iterator[Document]:
+    """逐页加载并切分（与整本切分结果一致：切分本来就按页进行）。"""
+    for page in PyPDFLoader(path).lazy_load():
+        yield from _TEXT_SPLITTER.split_documents([page])
+
 def read_pdf(path: str) -> List[Document]:
-    loader = PyPDFLoader(path)
-    docs = loader.load()
-    return _TEXT_SPLITTER.split_documents(docs)
+    return list(iter_pdf(path))
 
 # --------- 读取 HTML ----------
-_HTML_TAG_RE = re.compile(r"<[^>]+>")
+# 提取 + 切分流水线的版本号：改动 _html_to_text 或 _TEXT_SPLITTER 时递增，旧缓存会从原始 HTML 重新提取
+_PIPELINE_VERSION = "density-v1/rcts-800-100"
 
 def _html_to_text(html: str) -> str:
-    # 粗粒度去标签 + 压缩空白（不额外引入 bs4，够用）
-    text = _HTML_TAG_RE.sub(" ", html)
-    text = re.sub(r"\s+", " ", text)
-    return text.strip()
-
-def read_html(url: str) -> List[Document]:
-    resp = requests.get(url, timeout=20)
-    resp.raise_for_status()
-    text = _html_to_text(resp.text)
+    # 正文提取：丢弃 script/style/导航等模板，按文本密度保留正文块与标题（见 tools/html_extract.py）
+    return extract_main_text(html)
+
+def _split_text(url: str, text: str) -> List[Document]:
     docs = [Document(page_content=text, metadata={"source": url})]
     return _TEXT_SPLITTER.split_documents(docs)
 
+def _docs_from_cache(page: CachedPage) -> List[Document]:
+    """从缓存条目还原 Document；流水线版本变化时用原始 HTML 重新提取（不访问网络）。"""
+    get_stats("pages").hit()
+    if page.chunks is None:
+        text = _html_to_text(page.html)
+        docs = _split_text(page.url, text)
+        get_page_cache().update_derived(page, text, [d.page_content for d in docs], _PIPELINE_VERSION)
+        return docs
+    return [Document(page_content=c, metadata={"source": page.url}) for c in page.chunks]
+
+def read_html(url: str, use_cache: bool = True) -> List[Document]:
+    """
+    抓取网页 -> 提取纯文本 -> 切分。
+    use_cache=True 时：TTL 内直接读缓存；过期则发条件请求（304 续期）；网络失败时退回旧缓存。
+    """
+    if not use_cache:
+        return _split_text(url, _html_to_text(fetch(url).text))
+
+    cache = get_page_cache()
+    page = cache.get(url, _PIPELINE_VERSION)
+    if page is not None and page.is_fresh():
+        return _docs_from_cache(page)
+
+    try:
+        resp = fetch(url, headers=page.conditional_headers() if page else None)  # 共享连接池 + 字节上限 + 截止时间
+    except Exception as e:
+        if page is not None:
+            # 过期缓存也比没有强：网络失败时兜底
+            return _docs_from_cache(page)
+        raise e
+
+    return _docs_from_response(url, resp, page)
+
+async def aread_html(url: str, use_cache: bool = True) -> List[Document]:
+    """read_html 的异步版本（afetch 抓取；缓存读写与文本提取都是毫秒级，直接在事件循环里做）。"""
+    if not use_cache:
+        return _split_text(url, _html_to_text((await afetch(url)).text))
+
+    page = get_page_cache().get(url, _PIPELINE_VERSION)
+    if page is not None and page.is_fresh():
+        return _docs_from_cache(page)
+
+    try:
+        resp = await afetch(url, headers=page.conditional_headers() if page else None)
+    except Exception as e:
+        if page is not None:
+            return _docs_from_cache(page)
+        raise e
+    return _docs_from_response(url, resp, page)
+
+def _docs_from_response(url: str, resp, page) -> List[Document]:
+    """处理抓取结果：304 续期旧缓存；否则提取、切分并写入缓存。"""
+    cache = get_page_cache()
+    if resp.status == 304 and page is not None:
+        cache.revalidated(url)
+        return _docs_from_cache(page)
+
+    get_stats("pages").miss()
+    text = _html_to_text(resp.text)
+    docs = _split_text(url, text)
+    try:
+        cache.put(
+            url,
+            html=resp.text,
+            text=text,
+            chunks=[d.page_content for d in docs],
+            version=_PIPELINE_VERSION,
+            etag=resp.headers.get("ETag"),
+            last_modified=resp.headers.get("Last-Modified"),
+        )
+    except Exception:
+        pass  # 缓存写失败不影响主流程
+    return docs
+
+def read_html_many(urls: List[str]) -> List[Union[List[Document], Exception]]:
+    """并发 read_html；失败的位置返回异常对象，由调用方决定如何兜底。"""
+    return fetch_many(urls, fetch_fn=read_html)
+
+async def aread_html_many(urls: List[str]) -> List[Union[List[Document], Exception]]:
+    """read_html_many 的异步版本。"""
+    return await afetch_many(urls, fetch_fn=aread_html)
+
 # --------- 摘要（带字数控制） ----------
+SUMMARY_MAP_CONCURRENCY = int(os.getenv("SUMMARY_MAP_CONCURRENCY", "8"))    # map 阶段并发请求上限
+SUMMARY_COLLAPSE_TOKENS = int(os.getenv("SUMMARY_COLLAPSE_TOKENS", "3000"))  # reduce 输入的 token 预算
+SUMMARY_MAP_CACHE_TTL = float(os.getenv("SUMMARY_MAP_CACHE_TTL", str(30 * 24 * 3600)))
+
+# map 阶段提示词：对每个分块做短摘要
+_MAP_PROMPT = PromptTemplate.from_template(
+    "请针对下列内容生成要点摘要，使用中文，"
+    "长度最多 {chunk_words} 字，省略赘述，保留关键信息与数字。\n\n"
+    "文本：\n{text}\n\n"
+    "要求：\n- 不要扩写或发挥\n- 不要加入未出现的信息\n- 直接给出摘要"
+)
+
+# collapse 阶段提示词：分块摘要太多时，先分组合并为中间摘要
+_COLLAPSE_PROMPT = PromptTemplate.from_template(
+    "下面是多个分块摘要，请合并为一段中间摘要，使用中文：\n\n"
+    "{text}\n\n"
+    "要求：\n- 长度最多 {summary_words} 字\n- 保留核心结论与数字\n- 去重并合并同类项\n- 不要加入原文没有的信息"
+)
+
+# reduce 阶段提示词：合并多个分块摘要为一个整体摘要
+_COMBINE_PROMPT = PromptTemplate.from_template(
+    "下面是多个分块摘要，请合并为一个整体摘要，使用中文：\n\n"
+    "{text}\n\n"
+    "要求：\n- 长度最多 {summary_words} 字\n- 保留核心结论与数字\n- 去重并合并同类项\n- 不要加入原文没有的信息\n\n"
+    "现在给出最终摘要："
+)
+
+# 调用点标记（chains/instrumentation.py 按 call_site 汇总 token）
+_LLM_CONFIG = {"metadata": {"call_site": "summarize_docs"}}
+
+_MAP_CACHE: Optional[TTLCache] = None
+
+def _map_cache() -> TTLCache:
+    global _MAP_CACHE
+    if _MAP_CACHE is None:
+        _MAP_CACHE = TTLCache("summary_map", ttl=SUMMARY_MAP_CACHE_TTL)
+    return _MAP_CACHE
+
+def _map_key(llm, text: str, chunk_words: int) -> str:
+    """分块摘要的缓存键：模型参数 + chunk_words + 分块内容（与 summary_words 无关）。"""
+    ident = f"{llm.model_name}|{llm.temperature}|{llm.max_tokens}|{chunk_words}"
+    return hashlib.sha256(f"{ident}\x00{text}".encode("utf-8")).hexdigest()
+
+def _num_tokens(llm, text: str) -> int:
+    try:
+        return llm.get_num_tokens(text)
+    except Exception:
+        return len(text)  # 无法加载分词器时按字符数保守估计（中文约 1 字 1 token）
+
+async def _amap_one(llm, sem: asyncio.Semaphore, text: str, chunk_words: int, use_cache: bool) -> str:
+    key = _map_key(llm, text, chunk_words)
+    if use_cache:
+        cached = _map_cache().get(key)
+        if cached is not None:
+            return cached
+    async with sem:
+        msg = await llm.ainvoke(_MAP_PROMPT.format(text=text, chunk_words=chunk_words), config=_LLM_CONFIG)
+    out = (msg.content or "").strip()
+    if use_cache and out:
+        _map_cache().set(key, out)
+    return out
+
+async def _amap(
+    llm,
+    docs: List[Document],
+    chunk_words: int,
+    use_cache: bool,
+    on_partial: Optional[Callable[[int, str], None]] = None,
+) -> List[str]:
+    """并发执行 map；on_partial(i, 摘要) 在每个分块完成时回调（完成顺序）。结果按原顺序返回。"""
+    sem = asyncio.Semaphore(SUMMARY_MAP_CONCURRENCY)
+    results: List[str] = [""] * len(docs)
+
+    async def one(i: int, doc: Document):
+        return i, await _amap_one(llm, sem, doc.page_content, chunk_words, use_cache)
+
+    for fut in asyncio.as_completed([one(i, d) for i, d in enumerate(docs)]):
+        i, text = await fut
+        results[i] = text
+        if on_partial:
+            on_partial(i, text)
+    return [r for r in results if r]
+
+async def _acollapse(llm, summaries: List[str], summary_words: int) -> List[str]:
+    """
+    递归折叠：总 token 超过预算时，按预算贪心分组、每组合并为一条中间摘要，直到进入预算。
+    """
+    sem = asyncio.Semaphore(SUMMARY_MAP_CONCURRENCY)
+
+    async def merge(group: List[str]) -> str:
+        if len(group) == 1:
+            return group[0]
+        async with sem:
+            msg = await llm.ainvoke(
+                _COLLAPSE_PROMPT.format(text="\n\n".join(group), summary_words=summary_words), config=_LLM_CONFIG
+            )
+        return (msg.content or "").strip()
+
+    while len(summaries) > 1:
+        tokens = [_num_tokens(llm, t) for t in summaries]
+        if sum(tokens) <= SUMMARY_COLLAPSE_TOKENS:
+            break
+        groups: List[List[str]] = []
+        current: List[str] = []
+        current_tokens = 0
+        for text, n in zip(summaries, tokens):
+            if current and current_tokens + n > SUMMARY_COLLAPSE_TOKENS:
+                groups.append(current)
+                current, current_tokens = [], 0
+            current.append(text)
+            current_tokens += n
+        groups.append(current)
+        if len(groups) == len(summaries):
+            # 单条就超预算：两两合并，保证每轮都在收缩
+            groups = [summaries[i:i + 2] for i in range(0, len(summaries), 2)]
+        summaries = list(await asyncio.gather(*(merge(g) for g in groups)))
+    return summaries
+
+async def asummarize_docs(
+    docs: List[Document],
+    summary_words: int = 150,
+    chunk_words: int = 60,
+    llm_max_tokens: Optional[int] = None,
+    use_cache: bool = True,
+    on_partial: Optional[Callable[[int, str], None]] = None,
+) -> str:
+    """summarize_docs 的异步版本；on_partial 可接收每个分块摘要（用于展示进度）。"""
+    if not docs:
+        return ""
+    llm = _llm(max_tokens=llm_max_tokens, cache=use_cache)
+    summaries = await _amap(llm, docs, chunk_words, use_cache, on_partial)
+    summaries = await _acollapse(llm, summaries, summary_words)
+    msg = await llm.ainvoke(
+        _COMBINE_PROMPT.format(text="\n\n".join(summaries), summary_words=summary_words), config=_LLM_CONFIG
+    )
+    return (msg.content or "").strip()
+
+async def astream_summary(
+    docs: List[Document],
+    summary_words: int = 150,
+    chunk_words: int = 60,
+    llm_max_tokens: Optional[int] = None,
+    use_cache: bool = True,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    流式摘要，依次产出事件：
+    - {"type": "map", "index": i, "text": 分块摘要}（按完成顺序）
+    - {"type": "collapse", "count": n}（发生折叠时）
+    - {"type": "reduce", "delta": 最终摘要的增量文本}
+    - {"type": "final", "text": 最终摘要}
+    """
+    if not docs:
+        yield {"type": "final", "text": ""}
+        return
+    llm = _llm(max_tokens=llm_max_tokens, cache=use_cache)
+    queue: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue()
+    map_task = asyncio.ensure_future(
+        _amap(llm, docs, chunk_words, use_cache, lambda i, t: queue.put_nowait({"type": "map", "index": i, "text": t}))
+    )
+    while not (map_task.done() and queue.empty()):
+        getter = asyncio.ensure_future(queue.get())
+        await asyncio.wait({getter, map_task}, return_when=asyncio.FIRST_COMPLETED)
+        if getter.done():
+            yield getter.result()
+        else:
+            getter.cancel()
+    summaries = map_task.result()
+
+    collapsed = await _acollapse(llm, summaries, summary_words)
+    if len(collapsed) < len(summaries):
+        yield {"type": "collapse", "count": len(collapsed)}
+
+    parts: List[str] = []
+    prompt = _COMBINE_PROMPT.format(text="\n\n".join(collapsed), summary_words=summary_words)
+    async for chunk in llm.astream(prompt, config=_LLM_CONFIG):
+        if chunk.content:
+            parts.append(chunk.content)
+            yield {"type": "reduce", "delta": chunk.content}
+    yield {"type": "final", "text": "".join(parts).strip()}
+
+# 同步调用共用一个常驻事件循环：LLM 的异步连接池按事件循环各建一份（configs/llm.py），
+# 常驻循环让多次同步调用复用同一个池，而不是每次 asyncio.run 都重新建连
+_LOOP: Optional[asyncio.AbstractEventLoop] = None
+_LOOP_LOCK = threading.Lock()
+
+def _run_sync(coro):
+    global _LOOP
+    with _LOOP_LOCK:
+        if _LOOP is None:
+            _LOOP = asyncio.new_event_loop()
+            threading.Thread(target=_LOOP.run_forever, name="docsum-loop", daemon=True).start()
+    return asyncio.run_coroutine_threadsafe(coro, _LOOP).result()
+
 def summarize_docs(
     docs: List[Document],
     summary_words: int = 150,
     chunk_words: int = 60,
     llm_max_tokens: Optional[int] = None,
+    use_cache: bool = True,
 ) -> str:
     """
-    使用 map_reduce 方式做长文摘要（LangChain 0.2+ 标准调用），支持字数控制。
+    使用 map_reduce 方式做长文摘要（原生实现：并发 map + token 预算内递归折叠 + reduce），支持字数控制。
 
     Args:
         docs: Document 列表（已切分）
         summary_words: 最终摘要字数上限（中文“字数”）
         chunk_words: 每个分块摘要字数上限
         llm_max_tokens: 可选，硬限制生成 token（兜底防溢出）
+        use_cache: 是否使用 LLM 响应缓存与分块摘要缓存
     """
-    llm = _llm(max_tokens=llm_max_tokens)
-
-    # map 阶段提示词：对每个分块做短摘要
-    map_prompt = PromptTemplate.from_template(
-        "请针对下列内容生成要点摘要，使用中文，"
-        "长度最多 {chunk_words} 字，省略赘述，保留关键信息与数字。\n\n"
-        "文本：\n{text}\n\n"
-        "要求：\n- 不要扩写或发挥\n- 不要加入未出现的信息\n- 直接给出摘要"
-    )
-
-    # reduce 阶段提示词：合并多个分块摘要为一个整体摘要
-    combine_prompt = PromptTemplate.from_template(
-        "下面是多个分块摘要，请合并为一个整体摘要，使用中文：\n\n"
-        "{text}\n\n"
-        "要求：\n- 长度最多 {summary_words} 字\n- 保留核心结论与数字\n- 去重并合并同类项\n- 不要加入原文没有的信息\n\n"
-        "现在给出最终摘要："
-    )
-
-    chain = load_summarize_chain(
-        llm,
-        chain_type="map_reduce",
-        map_prompt=map_prompt,
-        combine_prompt=combine_prompt,
-        verbose=False,
-    )
-
-    # 新写法：invoke，并显式传入 input_documents + 自定义变量
-    result = chain.invoke({
-        "input_documents": docs,
-        "chunk_words": chunk_words,
-        "summary_words": summary_words,
-    })
-
-    if isinstance(result, str):
-        return result.strip()
-    return (result.get("output_text") or result.get("text") or str(result)).strip()
+    return _run_sync(asummarize_docs(
+        docs,
+        summary_words=summary_words,
+        chunk_words=chunk_words,
+        llm_max_tokens=llm_max_tokens,
+        use_cache=use_cache,
+    ))
 
 # ------ 封装为 Tool：一步到位（加入可调字数参数） -------
 class SummarizePDFArgs(BaseModel):
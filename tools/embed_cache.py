@@ -0,0 +1,214 @@
+# tools/embed_cache.py
+"""
+Embedding 缓存（供 local_rag 使用）
+- 以文本内容的 sha256 为键，向量以 float32 追加写入单个数组文件（可 mmap 读取）
+- 行号索引存在 SQLite 中；不同 Embedding 模型使用不同的命名空间目录
+- embed_documents：先去重、查缓存，只对未命中的文本按 EMBED_BATCH_SIZE 分批调用底层模型
+- embed_query 同样缓存（包括 _get_embeddings 的连通性探测）
+
+目录结构：
+    <CACHE_DIR>/embeddings/<namespace>/vectors.f32   # 行优先 float32，形状 (rows, dim)
+    <CACHE_DIR>/embeddings/<namespace>/index.sqlite  # key -> row，以及 dim 和已提交行数 rows
+    <CACHE_DIR>/embeddings/<namespace>/vectors.lock  # 跨进程排他锁（fcntl.flock）
+
+多个进程可共享同一缓存目录（批处理、交互式 CLI、后台索引刷新）：查找、追加、读取都在
+vectors.lock 的排他锁内进行，并以锁内重新读取的 SQLite 已提交行数为准。
+- 文件比已提交行数长（中断写入留下的半行或未登记的行）：截断到已提交行数
+- 文件比已提交行数短（文件丢失或被截断）：清空行号索引重新开始，绝不补零
+新行号与行数在同一事务中提交，行号因此始终指向正确的向量。
+"""
+
+from __future__ import annotations
+
+import os
+import hashlib
+import threading
+import logging
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from tools.cache import cache_path, connect, get_stats
+
+try:  # POSIX；没有 fcntl 的平台只有进程内的线程锁
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))  # 每次调用底层模型的文本数
+
+
+def _text_key(text: str, kind: str) -> str:
+    # 文档与查询分开缓存：部分模型对两者使用不同的前缀/指令
+    return hashlib.sha256(f"{kind}\x00{text}".encode("utf-8")).hexdigest()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    包装任意 LangChain Embeddings，加上磁盘向量缓存与去重批处理。
+
+    Args:
+        underlying: 真实的 Embedding 模型
+        namespace: 缓存命名空间（通常是模型标识），模型不同缓存互不影响
+        batch_size: 未命中文本的分批大小
+    """
+
+    def __init__(self, underlying: Embeddings, namespace: str, batch_size: int = EMBED_BATCH_SIZE):
+        self.underlying = underlying
+        self.namespace = namespace
+        self.batch_size = max(1, batch_size)
+        self.stats = get_stats("embeddings")
+
+        ns = hashlib.sha256(namespace.encode("utf-8")).hexdigest()[:16]
+        self._vectors_path = cache_path("embeddings", ns, "vectors.f32")
+        self._lock_path = cache_path("embeddings", ns, "vectors.lock")
+        self._lock = threading.Lock()
+        self._conn = connect(cache_path("embeddings", ns, "index.sqlite"))
+        self._conn.execute("CREATE TABLE IF NOT EXISTS rows (key TEXT PRIMARY KEY, row INTEGER NOT NULL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.commit()
+        row = self._conn.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+        self._dim: Optional[int] = int(row[0]) if row else None
+        self._view: Optional[np.ndarray] = None
+
+    # ---------- 跨进程锁 / 一致性修复 ----------
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        """跨进程排他锁：持锁期间没有其他进程追加或截断数组文件。"""
+        if fcntl is None:
+            yield
+            return
+        with open(self._lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _repair_locked(self) -> None:
+        """让数组文件与已提交行数一致（调用方持有 _file_lock）。"""
+        if self._dim is None:
+            row = self._conn.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+            self._dim = int(row[0]) if row else None
+        if self._dim is None:
+            return
+        committed = self._committed_rows()
+        size = os.path.getsize(self._vectors_path) if os.path.exists(self._vectors_path) else 0
+        expected = committed * 4 * self._dim
+        if size < expected:
+            logger.warning(f"Embedding 向量文件缺失或被截断（{size} < {expected} 字节），清空缓存索引: {self._vectors_path}")
+            self._conn.execute("DELETE FROM rows")
+            self._conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('rows', '0')")
+            self._conn.commit()
+            if size:
+                os.truncate(self._vectors_path, 0)
+            self._view = None
+        elif size > expected:
+            logger.warning(f"Embedding 向量文件有未登记的尾部数据，截断到 {committed} 行: {self._vectors_path}")
+            os.truncate(self._vectors_path, expected)
+            self._view = None
+
+    # ---------- 数组文件 ----------
+    def _rows_on_disk(self) -> int:
+        """文件中的完整行数（不含末尾的半行）。"""
+        if self._dim is None or not os.path.exists(self._vectors_path):
+            return 0
+        return os.path.getsize(self._vectors_path) // (4 * self._dim)
+
+    def _committed_rows(self) -> int:
+        """SQLite 中登记的行数；旧版缓存没有该记录时按文件中的完整行数计。"""
+        row = self._conn.execute("SELECT value FROM meta WHERE name = 'rows'").fetchone()
+        return int(row[0]) if row else self._rows_on_disk()
+
+    def _matrix(self) -> np.ndarray:
+        """只读 mmap 视图（只含已提交的行）；行数变化后重新映射。"""
+        rows = min(self._committed_rows(), self._rows_on_disk())
+        if self._view is None or self._view.shape[0] != rows:
+            if rows == 0:
+                self._view = np.zeros((0, self._dim or 0), dtype=np.float32)
+            else:
+                self._view = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(rows, self._dim))
+        return self._view
+
+    def _lookup(self, keys: List[str]) -> Dict[str, int]:
+        found: Dict[str, int] = {}
+        # SQLite 单条语句的参数个数有限，分批查询
+        for i in range(0, len(keys), 500):
+            part = keys[i:i + 500]
+            marks = ",".join("?" * len(part))
+            for key, row in self._conn.execute(f"SELECT key, row FROM rows WHERE key IN ({marks})", part):
+                found[key] = row
+        return found
+
+    def _append(self, keys: List[str], vectors: List[List[float]]) -> None:
+        arr = np.asarray(vectors, dtype=np.float32)
+        with self._file_lock():
+            self._repair_locked()
+            if self._dim is None:
+                self._dim = int(arr.shape[1])
+                self._conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('dim', ?)", (str(self._dim),))
+            start = self._committed_rows()
+            with open(self._vectors_path, "ab") as f:
+                f.write(arr.tobytes())
+            rows = [(key, start + i) for i, key in enumerate(keys)]
+            self._conn.executemany("INSERT OR REPLACE INTO rows (key, row) VALUES (?, ?)", rows)
+            self._conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('rows', ?)", (str(start + len(keys)),))
+            self._conn.commit()
+
+    # ---------- 核心：去重 + 查缓存 + 分批嵌入 ----------
+    def _embed_raw(self, texts: List[str], kind: str) -> List[List[float]]:
+        if kind == "query":
+            return [self.underlying.embed_query(t) for t in texts]
+        return self.underlying.embed_documents(texts)
+
+    def _embed(self, texts: List[str], kind: str) -> List[List[float]]:
+        # 另一进程在本次调用期间清空了缓存时，已查到的行号失效：重来一次，仍失败则不走缓存
+        for _ in range(2):
+            result = self._embed_cached(texts, kind)
+            if result is not None:
+                return result
+        logger.warning("Embedding 缓存在调用期间被重置，本次直接调用底层模型")
+        return self._embed_raw(texts, kind)
+
+    def _embed_cached(self, texts: List[str], kind: str) -> Optional[List[List[float]]]:
+        keys = [_text_key(t, kind) for t in texts]
+        unique = list(dict.fromkeys(keys))
+        with self._lock:
+            with self._file_lock():
+                self._repair_locked()
+                rows = self._lookup(unique)
+            missing: Dict[str, str] = {}
+            for key, text in zip(keys, texts):
+                if key not in rows and key not in missing:
+                    missing[key] = text
+
+            self.stats.hit(len(keys) - len(missing))
+            self.stats.miss(len(missing))
+
+            if missing:
+                miss_keys = list(missing)
+                logger.info(f"Embedding 缓存未命中 {len(miss_keys)}/{len(keys)}，分批嵌入（batch={self.batch_size}）")
+                for i in range(0, len(miss_keys), self.batch_size):
+                    batch_keys = miss_keys[i:i + self.batch_size]
+                    self._append(batch_keys, self._embed_raw([missing[k] for k in batch_keys], kind))
+
+            # 行号以锁内的 SQLite 为准重新读取（其他进程可能同时写入了相同的键）
+            with self._file_lock():
+                self._repair_locked()
+                rows = self._lookup(unique)
+                if len(rows) < len(unique):
+                    return None
+                matrix = self._matrix()
+                return [matrix[rows[key]].tolist() for key in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        return self._embed(list(texts), "doc")
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text], "query")[0]
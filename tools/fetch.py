@@ -0,0 +1,311 @@
+# tools/fetch.py
+"""
+网页抓取引擎（供 docsum.read_html 与 research_graph.read 使用）
+- 进程级共享的 requests.Session：连接池 + keep-alive
+- 按 host 限制并发（同一站点不会被打爆）
+- 流式读取响应体，超过字节上限即截断
+- 总时长截止：慢站点超过 FETCH_DEADLINE 秒直接放弃
+- fetch_many(urls): 并发抓取多个 URL，结果与输入顺序一致
+- afetch / afetch_many: 异步版本（httpx.AsyncClient，每个事件循环一个连接池），供异步图使用
+
+可用环境变量调整：FETCH_MAX_WORKERS / FETCH_PER_HOST / FETCH_MAX_BYTES /
+FETCH_CONNECT_TIMEOUT / FETCH_READ_TIMEOUT / FETCH_DEADLINE
+"""
+
+from __future__ import annotations
+
+import os
+import time
+import asyncio
+import threading
+import logging
+import weakref
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Dict, List, Mapping, Optional, Union
+from urllib.parse import urlparse
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from configs.telemetry import emit
+
+logger = logging.getLogger(__name__)
+
+FETCH_MAX_WORKERS = int(os.getenv("FETCH_MAX_WORKERS", "8"))      # 全局并发抓取数
+FETCH_PER_HOST = int(os.getenv("FETCH_PER_HOST", "2"))            # 单 host 并发上限
+FETCH_MAX_BYTES = int(os.getenv("FETCH_MAX_BYTES", str(2 * 1024 * 1024)))  # 响应体上限（字节）
+FETCH_CONNECT_TIMEOUT = float(os.getenv("FETCH_CONNECT_TIMEOUT", "5"))
+FETCH_READ_TIMEOUT = float(os.getenv("FETCH_READ_TIMEOUT", "10"))
+FETCH_DEADLINE = float(os.getenv("FETCH_DEADLINE", "15"))         # 单个 URL 的总时长上限（秒）
+
+_USER_AGENT = "Mozilla/5.0 (compatible; ResearchCopilot/0.1)"
+_CHUNK_SIZE = 64 * 1024
+
+
+class FetchError(RuntimeError):
+    """抓取失败（超时 / 超过截止时间 / HTTP 错误）。"""
+
+
+@dataclass
+class FetchResult:
+    url: str
+    status: int
+    text: str
+    headers: Mapping[str, str] = field(default_factory=dict)  # 大小写不敏感（requests / httpx 的 headers）
+    truncated: bool = False   # 是否因字节上限被截断
+    nbytes: int = 0
+
+
+# -------------------- 共享连接池 --------------------
+_SESSION: Optional[requests.Session] = None
+_SESSION_LOCK = threading.Lock()
+_HOST_SEMAPHORES: Dict[str, threading.BoundedSemaphore] = {}
+_HOST_LOCK = threading.Lock()
+
+
+def _session() -> requests.Session:
+    """懒加载进程级 Session；连接池大小与全局并发数对齐。"""
+    global _SESSION
+    if _SESSION is None:
+        with _SESSION_LOCK:
+            if _SESSION is None:
+                s = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=FETCH_MAX_WORKERS,
+                    pool_maxsize=FETCH_MAX_WORKERS,
+                    max_retries=0,
+                )
+                s.mount("http://", adapter)
+                s.mount("https://", adapter)
+                s.headers.update({"User-Agent": _USER_AGENT})
+                _SESSION = s
+    return _SESSION
+
+
+def _host_semaphore(url: str) -> threading.BoundedSemaphore:
+    host = urlparse(url).netloc.lower()
+    with _HOST_LOCK:
+        sem = _HOST_SEMAPHORES.get(host)
+        if sem is None:
+            sem = threading.BoundedSemaphore(FETCH_PER_HOST)
+            _HOST_SEMAPHORES[host] = sem
+        return sem
+
+
+# -------------------- 单个 URL --------------------
+def fetch(url: str, headers: Optional[Dict[str, str]] = None, max_bytes: Optional[int] = None) -> FetchResult:
+    """
+    抓取单个 URL（流式读取 + 字节上限 + 总时长截止）。
+
+    Args:
+        url: 目标地址
+        headers: 额外请求头（如条件请求的 If-None-Match）
+        max_bytes: 响应体上限，默认 FETCH_MAX_BYTES
+
+    Returns:
+        FetchResult；304 时 text 为空串。
+
+    Raises:
+        FetchError / requests.HTTPError
+    """
+    limit = max_bytes or FETCH_MAX_BYTES
+    deadline = time.monotonic() + FETCH_DEADLINE
+    sem = _host_semaphore(url)
+
+    # 同 host 排队也计入截止时间，避免在慢站点后面无限等待
+    if not sem.acquire(timeout=FETCH_DEADLINE):
+        raise FetchError(f"per-host queue timeout: {url}")
+    try:
+        resp = _session().get(
+            url,
+            headers=headers or {},
+            timeout=(FETCH_CONNECT_TIMEOUT, FETCH_READ_TIMEOUT),
+            stream=True,
+        )
+        try:
+            if resp.status_code == 304:
+                return FetchResult(url=url, status=304, text="", headers=resp.headers)
+            resp.raise_for_status()
+
+            buf = bytearray()
+            truncated = False
+            for chunk in resp.iter_content(chunk_size=_CHUNK_SIZE):
+                if time.monotonic() > deadline:
+                    raise FetchError(f"deadline exceeded ({FETCH_DEADLINE}s): {url}")
+                buf.extend(chunk)
+                if len(buf) >= limit:
+                    del buf[limit:]
+                    truncated = True
+                    break
+
+            emit("fetch_bytes", urlparse(url).netloc.lower(), len(buf))
+            encoding = resp.encoding or resp.apparent_encoding or "utf-8"
+            text = bytes(buf).decode(encoding, errors="replace")
+            return FetchResult(
+                url=url,
+                status=resp.status_code,
+                text=text,
+                headers=resp.headers,
+                truncated=truncated,
+                nbytes=len(buf),
+            )
+        finally:
+            resp.close()
+    finally:
+        sem.release()
+
+
+# -------------------- 批量并发 --------------------
+def fetch_many(
+    urls: List[str],
+    max_workers: Optional[int] = None,
+    fetch_fn=None,
+) -> List[Union[FetchResult, Exception]]:
+    """
+    并发抓取多个 URL；返回列表与 urls 顺序一致，失败位置为异常对象。
+    超过整体截止时间仍未完成的任务会被放弃（线程不可强杀，结果忽略）。
+
+    fetch_fn: 可替换单 URL 的抓取函数（如带缓存的 read_html），默认 fetch
+    """
+    if not urls:
+        return []
+    fn = fetch_fn or fetch
+    workers = max(1, min(max_workers or FETCH_MAX_WORKERS, len(urls)))
+    results: List[Union[FetchResult, Exception]] = [FetchError("not started") for _ in urls]
+
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fetch")
+    try:
+        # 复制调用方的 contextvars（运行级观测等）到工作线程
+        futures = {pool.submit(contextvars.copy_context().run, fn, u): i for i, u in enumerate(urls)}
+        # 单个任务已自带截止时间；这里再加一道整体兜底（排队 + 执行）
+        done, not_done = wait(futures, timeout=FETCH_DEADLINE * 2)
+        for f in not_done:
+            f.cancel()
+            i = futures[f]
+            results[i] = FetchError(f"deadline exceeded: {urls[i]}")
+            logger.warning(f"Fetch abandoned (slow host): {urls[i]}")
+        for f in done:
+            i = futures[f]
+            try:
+                results[i] = f.result()
+            except Exception as e:
+                results[i] = e
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    return results
+
+
+# -------------------- 异步版本 --------------------
+# httpx.AsyncClient 与 asyncio.Semaphore 都绑定在创建它们的事件循环上，按循环各建一份
+_ASYNC_CLIENTS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+_ASYNC_HOST_SEMAPHORES: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _async_client() -> httpx.AsyncClient:
+    """当前事件循环的共享 AsyncClient；连接池大小与全局并发数对齐。"""
+    loop = asyncio.get_running_loop()
+    client = _ASYNC_CLIENTS.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            headers={"User-Agent": _USER_AGENT},
+            limits=httpx.Limits(max_connections=FETCH_MAX_WORKERS, max_keepalive_connections=FETCH_MAX_WORKERS),
+            timeout=httpx.Timeout(FETCH_READ_TIMEOUT, connect=FETCH_CONNECT_TIMEOUT),
+            follow_redirects=True,
+        )
+        _ASYNC_CLIENTS[loop] = client
+    return client
+
+
+def _async_host_semaphore(url: str) -> asyncio.Semaphore:
+    per_loop = _ASYNC_HOST_SEMAPHORES.setdefault(asyncio.get_running_loop(), {})
+    host = urlparse(url).netloc.lower()
+    sem = per_loop.get(host)
+    if sem is None:
+        sem = per_loop[host] = asyncio.Semaphore(FETCH_PER_HOST)
+    return sem
+
+
+async def afetch(url: str, headers: Optional[Dict[str, str]] = None, max_bytes: Optional[int] = None) -> FetchResult:
+    """
+    fetch 的异步版本：语义相同（按 host 限并发、字节上限、总时长截止）。
+
+    Raises:
+        FetchError / httpx.HTTPStatusError
+    """
+    limit = max_bytes or FETCH_MAX_BYTES
+    deadline = time.monotonic() + FETCH_DEADLINE
+    sem = _async_host_semaphore(url)
+
+    # 同 host 排队也计入截止时间
+    try:
+        await asyncio.wait_for(sem.acquire(), timeout=FETCH_DEADLINE)
+    except asyncio.TimeoutError:
+        raise FetchError(f"per-host queue timeout: {url}") from None
+    try:
+        return await asyncio.wait_for(
+            _afetch_body(url, headers, limit), timeout=max(0.0, deadline - time.monotonic())
+        )
+    except asyncio.TimeoutError:
+        raise FetchError(f"deadline exceeded ({FETCH_DEADLINE}s): {url}") from None
+    finally:
+        sem.release()
+
+
+async def _afetch_body(url: str, headers: Optional[Dict[str, str]], limit: int) -> FetchResult:
+    async with _async_client().stream("GET", url, headers=headers or {}) as resp:
+        if resp.status_code == 304:
+            return FetchResult(url=url, status=304, text="", headers=resp.headers)
+        resp.raise_for_status()
+
+        buf = bytearray()
+        truncated = False
+        async for chunk in resp.aiter_bytes(chunk_size=_CHUNK_SIZE):
+            buf.extend(chunk)
+            if len(buf) >= limit:
+                del buf[limit:]
+                truncated = True
+                break
+
+        emit("fetch_bytes", urlparse(url).netloc.lower(), len(buf))
+        encoding = resp.charset_encoding or "utf-8"
+        text = bytes(buf).decode(encoding, errors="replace")
+        return FetchResult(
+            url=url,
+            status=resp.status_code,
+            text=text,
+            headers=resp.headers,
+            truncated=truncated,
+            nbytes=len(buf),
+        )
+
+
+async def afetch_many(
+    urls: List[str],
+    max_workers: Optional[int] = None,
+    fetch_fn=None,
+) -> List[Union[FetchResult, Exception]]:
+    """
+    fetch_many 的异步版本：同一事件循环内并发，返回列表与 urls 顺序一致，失败位置为异常对象。
+    单个任务自带截止时间，超时的协程会被真正取消（不像线程只能放弃）。
+
+    fetch_fn: 可替换单 URL 的异步抓取函数（如 aread_html），默认 afetch
+    """
+    if not urls:
+        return []
+    fn = fetch_fn or afetch
+    sem = asyncio.Semaphore(max(1, max_workers or FETCH_MAX_WORKERS))
+
+    async def _one(u: str):
+        async with sem:
+            return await fn(u)
+
+    results = await asyncio.gather(*(_one(u) for u in urls), return_exceptions=True)
+    for u, r in zip(urls, results):
+        if isinstance(r, FetchError):
+            logger.warning(f"Fetch failed: {u}: {r}")
+    return list(results)
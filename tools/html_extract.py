@@ -0,0 +1,274 @@
+# tools/html_extract.py
+"""
+HTML 正文提取（供 docsum._html_to_text 使用，只依赖标准库）
+- 基于 html.parser 的流式解析：可以一次喂完整 HTML，也可以按块喂
+- 整棵丢弃 script / style / nav / header / footer / aside / form 等子树；
+  class / id 像导航、侧栏、广告、评论区的容器只做标记（外层包裹容器也可能命中，不能直接丢）
+- 按块（p / li / td / pre / div 里的直接文本 ...）聚合文本，记录链接文字占比
+- 按文本密度打分：长文本、低链接占比的块保留；短块看上下文（夹在正文之间的保留）
+- 有 <article> / <main> 且其中正文足够时只取其中的块
+- 标题保留为 Markdown 风格（"## 标题"），没有正文跟随的标题丢弃
+- 提取结果过短时先忽略 class / id 标记重试，仍过短则退回“全部可见文本”
+
+用法：
+    text = extract_main_text(html)
+"""
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from html.parser import HTMLParser
+from typing import Iterable, List, Optional, Tuple, Union
+
+# 整棵子树丢弃的标签
+_SKIP_TAGS = {
+    "script", "style", "noscript", "template", "svg", "canvas", "iframe", "object", "title",
+    "nav", "header", "footer", "aside", "form", "button", "select", "textarea", "menu", "dialog",
+}
+# 块级标签：遇到开始/结束时切分文本块
+_BLOCK_TAGS = {
+    "p", "div", "section", "article", "main", "li", "ul", "ol", "dl", "dt", "dd", "td", "th", "tr",
+    "table", "pre", "blockquote", "figure", "figcaption", "br", "hr", "body", "center", "address",
+    "h1", "h2", "h3", "h4", "h5", "h6",
+}
+_HEADINGS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+_VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source", "track", "wbr"}
+_CONTENT_ROOTS = {"article", "main"}
+
+# class / id 命中这些词的容器视为模板（其中的块默认不取）
+_BOILERPLATE_RE = re.compile(
+    r"(^|[\s_-])(nav|navbar|menu|breadcrumbs?|sidebar|side-bar|footer|site-header|masthead|cookie|consent|banner|"
+    r"advert|ads?|sponsor|promo|share|social|related|recommend|comments?|subscribe|newsletter|popup|modal)($|[\s_-])",
+    re.I,
+)
+# 同时带有这些词的 class（如 "wy-nav-content"）可能是正文外壳，不算模板
+_CONTENT_HINT_RE = re.compile(r"content|main|article|body|post|entry|story|document", re.I)
+_WS_RE = re.compile(r"\s+")
+_INLINE_WS_RE = re.compile(r"[ \t\r\f\v]+")
+_SENTENCE_RE = re.compile(r"[.!?。！？；;]")
+
+# 打分阈值（字符数；中文每字信息量大，按字符计天然偏保守）
+_MIN_LONG = 80            # 长块：直接视为正文候选
+_MIN_SHORT = 25           # 短于此的块只在上下文是正文时保留
+_MAX_LINK_DENSITY = 0.33  # 链接文字占比超过此值视为导航/目录
+_FALLBACK_MIN_CHARS = 200  # 提取结果短于此且全文明显更长时，退回全部可见文本
+
+
+@dataclass
+class _Block:
+    text: str
+    link_chars: int
+    heading: int        # 0 = 正文；1..6 = 标题级别
+    in_root: bool       # 是否位于 <article> / <main> 内
+    boiler: bool        # 是否位于 class / id 像模板的容器内
+    label: str = ""     # good / bad / short / heading
+
+    @property
+    def link_density(self) -> float:
+        return self.link_chars / max(1, len(self.text))
+
+
+class _BlockParser(HTMLParser):
+    """把 HTML 流切成文本块；丢弃的子树在解析时直接跳过，不保留 DOM。"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.blocks: List[_Block] = []
+        self._stack: List[Tuple[str, bool, bool]] = []  # 打开的非空标签 (tag, 是否正文根, 是否模板容器)
+        self._skip_depth = 0             # >0 表示处在被丢弃的子树里
+        self._skip_tag: Optional[str] = None
+        self._root_depth = 0             # 处在几层 article/main 里
+        self._boiler_depth = 0           # 处在几层模板容器里
+        self._link_depth = 0
+        self._pre_depth = 0              # <pre> 内保留换行
+        self._heading = 0
+        self._parts: List[str] = []
+        self._link_chars = 0
+
+    # ---------- 块边界 ----------
+    def _flush(self) -> None:
+        raw = "".join(self._parts)
+        if self._pre_depth:
+            text = "\n".join(_INLINE_WS_RE.sub(" ", line).rstrip() for line in raw.strip("\n").splitlines()).strip()
+        else:
+            text = _WS_RE.sub(" ", raw).strip()
+        if text:
+            self.blocks.append(_Block(
+                text, min(self._link_chars, len(text)), self._heading, self._root_depth > 0, self._boiler_depth > 0
+            ))
+        self._parts = []
+        self._link_chars = 0
+
+    def _should_skip(self, tag: str, attrs) -> bool:
+        if tag in ("html", "body", "article", "main"):
+            return False
+        # article/main 内的 <header> 通常是正文标题区，保留
+        if tag == "header" and self._root_depth:
+            return False
+        if tag in _SKIP_TAGS:
+            return True
+        for key, value in attrs:
+            if key == "role" and value in ("navigation", "banner", "contentinfo", "complementary", "search"):
+                return True
+            if key in ("hidden", "aria-hidden") and (value is None or value == "true"):
+                return True
+        return False
+
+    @staticmethod
+    def _looks_boilerplate(attrs) -> bool:
+        for key, value in attrs:
+            if key in ("class", "id") and value:
+                for token in value.split():
+                    if _BOILERPLATE_RE.search(token) and not _CONTENT_HINT_RE.search(token):
+                        return True
+        return False
+
+    # ---------- 解析回调 ----------
+    def handle_starttag(self, tag, attrs):
+        if tag in _VOID_TAGS:
+            if tag in ("br", "hr") and not self._skip_depth:
+                self._flush()
+            return
+        if self._skip_depth:
+            if tag == self._skip_tag:
+                self._skip_depth += 1
+            return
+        if self._should_skip(tag, attrs):
+            self._flush()
+            self._skip_depth, self._skip_tag = 1, tag
+            return
+
+        is_root = tag in _CONTENT_ROOTS or dict(attrs).get("role") == "main"
+        is_boiler = self._looks_boilerplate(attrs)
+        self._stack.append((tag, is_root, is_boiler))
+        if tag in _BLOCK_TAGS or is_boiler:
+            self._flush()
+        if is_root:
+            self._root_depth += 1
+        if is_boiler:
+            self._boiler_depth += 1
+        if tag in _HEADINGS:
+            self._heading = _HEADINGS[tag]
+        elif tag == "pre":
+            self._pre_depth += 1
+        elif tag == "a":
+            self._link_depth += 1
+
+    def handle_endtag(self, tag):
+        if self._skip_depth:
+            if tag == self._skip_tag:
+                self._skip_depth -= 1
+                if not self._skip_depth:
+                    self._skip_tag = None
+            return
+        if not any(entry[0] == tag for entry in self._stack):
+            return  # 多余的结束标签
+        # 容错：关闭中间未闭合的标签
+        while self._stack:
+            open_tag, is_root, is_boiler = self._stack.pop()
+            if open_tag in _BLOCK_TAGS or is_boiler:
+                self._flush()
+            if is_root:
+                self._root_depth = max(0, self._root_depth - 1)
+            if is_boiler:
+                self._boiler_depth = max(0, self._boiler_depth - 1)
+            if open_tag in _HEADINGS:
+                self._heading = 0
+            elif open_tag == "pre":
+                self._pre_depth = max(0, self._pre_depth - 1)
+            elif open_tag == "a":
+                self._link_depth = max(0, self._link_depth - 1)
+            if open_tag == tag:
+                break
+
+    def handle_data(self, data):
+        if self._skip_depth:
+            return
+        self._parts.append(data)
+        if self._link_depth:
+            self._link_chars += len(data.strip())
+
+    def close(self):
+        super().close()
+        self._flush()
+
+
+def _classify(blocks: List[_Block], use_hints: bool = True) -> None:
+    """按文本密度给块打标签，再用上下文修正短块（jusText 思路的简化版）。"""
+    for b in blocks:
+        if use_hints and b.boiler:
+            b.label = "bad"
+        elif b.heading:
+            b.label = "heading"
+        elif b.link_density > _MAX_LINK_DENSITY:
+            b.label = "bad"
+        elif len(b.text) >= _MIN_LONG or (len(b.text) >= _MIN_SHORT and _SENTENCE_RE.search(b.text)):
+            b.label = "good"
+        elif len(b.text) >= _MIN_SHORT:
+            b.label = "short"
+        else:
+            b.label = "short" if b.link_chars == 0 else "bad"
+
+    # 短块：前后最近的非短块都是正文才保留
+    def neighbour(i: int, step: int) -> str:
+        j = i + step
+        while 0 <= j < len(blocks):
+            if blocks[j].label in ("good", "bad"):
+                return blocks[j].label
+            j += step
+        return "bad"
+
+    resolved = [
+        "good" if b.label == "short" and neighbour(i, -1) == "good" and neighbour(i, 1) == "good" else b.label
+        for i, b in enumerate(blocks)
+    ]
+    for b, label in zip(blocks, resolved):
+        b.label = "bad" if label == "short" else label
+
+
+def _render(blocks: List[_Block]) -> str:
+    """正文块用空行分隔；标题只在其后（下一个同级或更高级标题之前）有正文时保留。"""
+    out: List[str] = []
+    for i, b in enumerate(blocks):
+        if b.label == "good":
+            out.append(b.text)
+        elif b.label == "heading":
+            for nxt in blocks[i + 1:]:
+                if nxt.label == "heading" and nxt.heading <= b.heading:
+                    break
+                if nxt.label == "good":
+                    out.append("#" * b.heading + " " + b.text)
+                    break
+    return "\n\n".join(out)
+
+
+def extract_main_text(html: Union[str, Iterable[str]]) -> str:
+    """
+    提取正文纯文本。
+
+    Args:
+        html: 完整 HTML 字符串，或按顺序产出 HTML 片段的可迭代对象（流式解析）
+
+    Returns:
+        段落之间以空行分隔的纯文本；标题以 "#" 前缀保留层级
+    """
+    parser = _BlockParser()
+    for piece in ([html] if isinstance(html, str) else html):
+        parser.feed(piece)
+    parser.close()
+    blocks = parser.blocks
+
+    # 有 article/main 且其中正文足够时，只在其中取块
+    rooted = [b for b in blocks if b.in_root]
+    if sum(len(b.text) for b in rooted if not b.heading) >= _FALLBACK_MIN_CHARS:
+        blocks = rooted
+
+    text = ""
+    for use_hints in (True, False):
+        _classify(blocks, use_hints)
+        text = _render(blocks)
+        if len(text) >= _FALLBACK_MIN_CHARS:
+            return text
+    visible = "\n\n".join(b.text for b in parser.blocks)
+    return visible if len(visible) > 2 * max(len(text), 1) else text
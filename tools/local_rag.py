@@ -3,8 +3,16 @@
 基于 FAISS 的本地文档检索工具。
 - 启动时从 data/ 目录加载文本/PDF（可扩展）
 - 使用 RecursiveCharacterTextSplitter 切块
-- 存入 FAISS 向量库
+- 存入 FAISS 向量库，并持久化到 .cache/rag/（索引 + docstore + 文件清单）
+- 文件清单记录每个文件的 mtime/size/sha256 与其 chunk id：
+  刷新时只对新增/修改/删除的文件做增量 upsert/remove，未变化时直接内存映射加载
+- 流式摄取：PDF 按页惰性加载、按页区间分发到进程池切块，分批嵌入写入索引，峰值内存与语料大小无关
+- Embedding 结果按文本哈希缓存在磁盘（tools/embed_cache.py），未变化的语料重建时不做任何嵌入
+- 可选近似最近邻索引（RAG_INDEX_TYPE）：flat（默认，暴力检索）/ ivf_flat / hnsw / ivf_pq / hnsw_pq，
+  在样本上训练，nprobe / efSearch 可调；召回-延迟对比见 eval/ann_report.py
+- 后台线程负责刷新（定时 / data/ 文件变化），构建完成后原子替换索引快照，查询不被阻塞
 - 提供 retriever 工具：local_search(query, k=4)
+- local_hits(query, k)：结构化命中（文本 + file:// 引用 + 距离），供研究图的本地优先分支使用
 
 支持多种Embedding选项：
 1. OpenAI Embedding (需要OPENAI_API_KEY)
@@ -13,8 +21,16 @@
 """
 
 import os
+import json
 import time
-from typing import List, Optional
+import pickle
+import shutil
+import hashlib
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
 from dotenv import load_dotenv
 from langchain_community.document_loaders import TextLoader, PyPDFLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
@@ -23,6 +39,13 @@ from langchain_community.vectorstores import FAISS
 from langchain_openai import OpenAIEmbeddings
 from langchain_core.tools import tool
 import logging
+from pathlib import Path
+
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+
+from tools.cache import cache_path
+from tools.embed_cache import CachedEmbeddings
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -30,52 +53,262 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
-_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
+_DATA_DIR = os.getenv("RAG_DATA_DIR") or os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
 _INDEX = None  # type: Optional[FAISS]
+_EMBEDDINGS = None  # type: Optional[CachedEmbeddings]
 _LAST_INDEX_TIME = 0
 _INDEX_REFRESH_INTERVAL = 300  # 5分钟索引刷新间隔
+_WATCH_DATA_DIR = os.getenv("RAG_WATCH", "1") != "0"  # 是否监听 data/ 变化（需要 watchdog）
+_WATCH_DEBOUNCE = 2.0  # 文件事件合并窗口（秒），避免拷贝大文件时反复重建
 
-def _load_documents() -> List[Document]:
-    """从 data/ 目录加载 .txt 与 .pdf 文档。"""
-    docs: List[Document] = []
+_BUILD_LOCK = threading.Lock()        # 同一时刻只允许一个构建（冷启动 / 后台刷新）
+_REFRESH_EVENT = threading.Event()    # 刷新请求（refresh_index / 文件监听）
+_REFRESHER = None  # type: Optional[threading.Thread]
+_REFRESHER_LOCK = threading.Lock()
+
+# 持久化位置：<CACHE_DIR>/rag/{index.faiss, index.pkl, manifest.json}
+_INDEX_DIR = os.path.dirname(cache_path("rag", "manifest.json"))
+_MANIFEST_PATH = os.path.join(_INDEX_DIR, "manifest.json")
+_SUPPORTED_EXTENSIONS = ('.txt', '.pdf')
+_PLACEHOLDER_ID = "__placeholder__"  # 空语料时的兜底文档 id
+
+# -------------------- 索引类型（近似最近邻） --------------------
+RAG_INDEX_TYPE = os.getenv("RAG_INDEX_TYPE", "flat")       # flat | ivf_flat | hnsw | ivf_pq | hnsw_pq
+RAG_IVF_NLIST = int(os.getenv("RAG_IVF_NLIST", "0"))        # IVF 聚类中心数；0 = 按 4*sqrt(N) 自动选择
+RAG_PQ_M = int(os.getenv("RAG_PQ_M", "16"))                 # PQ 子向量数（自动调整为维度的约数）
+RAG_PQ_NBITS = int(os.getenv("RAG_PQ_NBITS", "8"))          # 每个子向量的编码位数
+RAG_HNSW_M = int(os.getenv("RAG_HNSW_M", "32"))             # HNSW 每个节点的邻居数
+RAG_NPROBE = int(os.getenv("RAG_NPROBE", "16"))             # IVF 检索时探查的聚类数（越大召回越高、越慢）
+RAG_EF_SEARCH = int(os.getenv("RAG_EF_SEARCH", "64"))       # HNSW 检索宽度（越大召回越高、越慢）
+RAG_TRAIN_SAMPLE = int(os.getenv("RAG_TRAIN_SAMPLE", "50000"))  # 训练样本上限
+_ANN_MIN_VECTORS = 1000  # 向量太少时训练无意义，退回 flat
+
+# -------------------- 流式摄取 --------------------
+RAG_INGEST_WORKERS = int(os.getenv("RAG_INGEST_WORKERS", str(os.cpu_count() or 1)))  # 切块进程数上限；1 = 当前进程内
+RAG_INGEST_MIN_PAGES = int(os.getenv("RAG_INGEST_MIN_PAGES", "200"))  # 总页数低于此值时在当前进程内切块（子进程启动更慢）
+RAG_PAGES_PER_TASK = int(os.getenv("RAG_PAGES_PER_TASK", "16"))   # 每个子任务处理的 PDF 页数
+RAG_INGEST_BATCH = int(os.getenv("RAG_INGEST_BATCH", "256"))      # 每批嵌入并写入索引的块数
+RAG_EMBEDDINGS = os.getenv("RAG_EMBEDDINGS", "auto")                # auto（按下面的顺序探测）| fake（确定性伪向量，离线基准/CI 用）
+
+_TXT_PAGE_BYTES = 4096  # 估算 txt 页数用：约一页文字的字节数
+
+_TEXT_SPLITTER = RecursiveCharacterTextSplitter(
+    chunk_size=800,
+    chunk_overlap=80,
+    separators=["\n\n", "\n", "。", "！", "？", "．", "!", "?", " ", ""]
+)
+
+def _iter_file(path: str) -> Iterator[Document]:
+    """惰性加载单个文件：PDF 逐页产出，txt 整体产出。"""
+    if path.lower().endswith(".txt"):
+        yield from TextLoader(path, autodetect_encoding=True).lazy_load()
+    else:
+        yield from PyPDFLoader(path).lazy_load()
+
+def _iter_documents() -> Iterator[Document]:
+    """从 data/ 目录惰性加载 .txt 与 .pdf 文档（逐页）。"""
     if not os.path.isdir(_DATA_DIR):
         logger.warning(f"数据目录不存在: {_DATA_DIR}")
-        return docs
+        return
 
-    supported_extensions = ('.txt', '.pdf')
-    file_count = 0
-    
-    for name in os.listdir(_DATA_DIR):
+    for name in sorted(os.listdir(_DATA_DIR)):
         path = os.path.join(_DATA_DIR, name)
-        if os.path.isfile(path) and name.lower().endswith(supported_extensions):
+        if os.path.isfile(path) and name.lower().endswith(_SUPPORTED_EXTENSIONS):
             try:
-                if name.lower().endswith(".txt"):
-                    loader = TextLoader(path, autodetect_encoding=True)
-                    file_docs = loader.load()
-                    docs.extend(file_docs)
-                    file_count += 1
-                    logger.info(f"成功加载文本文件: {name}")
-                elif name.lower().endswith(".pdf"):
-                    loader = PyPDFLoader(path)
-                    file_docs = loader.load()
-                    docs.extend(file_docs)
-                    file_count += 1
-                    logger.info(f"成功加载PDF文件: {name}")
+                yield from _iter_file(path)
+                logger.info(f"成功加载文件: {name}")
             except Exception as e:
                 logger.error(f"加载文件失败 {name}: {e}")
-    
-    logger.info(f"共加载 {file_count} 个文档，{len(docs)} 个文档片段")
+
+def _load_documents() -> List[Document]:
+    """从 data/ 目录加载 .txt 与 .pdf 文档（一次性加载；大语料请用 _iter_documents）。"""
+    docs = list(_iter_documents())
+    logger.info(f"共加载 {len(docs)} 个文档片段")
     return docs
 
+# -------------------- 文件清单（增量更新的依据） --------------------
+def _file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def _scan_data_dir() -> Dict[str, Dict[str, Any]]:
+    """扫描 data/，返回 {文件名: {path, mtime, size}}（只看 stat，不读内容）。"""
+    found: Dict[str, Dict[str, Any]] = {}
+    if not os.path.isdir(_DATA_DIR):
+        return found
+    for name in sorted(os.listdir(_DATA_DIR)):
+        path = os.path.join(_DATA_DIR, name)
+        if os.path.isfile(path) and name.lower().endswith(_SUPPORTED_EXTENSIONS):
+            st = os.stat(path)
+            found[name] = {"path": path, "mtime": st.st_mtime, "size": st.st_size}
+    return found
+
+def _diff_manifest(
+    manifest: Dict[str, Any], scan: Dict[str, Dict[str, Any]]
+) -> Tuple[List[str], List[str], Dict[str, Dict[str, Any]]]:
+    """
+    对比清单与当前目录：
+    返回 (需要（重新）嵌入的文件, 需要移除的文件, 新清单条目)。
+    mtime/size 变化但内容哈希相同的文件只更新清单，不重新嵌入。
+    """
+    old_files = manifest.get("files", {})
+    upsert: List[str] = []
+    entries: Dict[str, Dict[str, Any]] = {}
+
+    for name, st in scan.items():
+        old = old_files.get(name)
+        if old and old["mtime"] == st["mtime"] and old["size"] == st["size"]:
+            entries[name] = old
+            continue
+        digest = _file_sha256(st["path"])
+        if old and old.get("sha256") == digest:
+            entries[name] = {**old, "mtime": st["mtime"], "size": st["size"]}
+            continue
+        entries[name] = {"mtime": st["mtime"], "size": st["size"], "sha256": digest, "ids": []}
+        upsert.append(name)
+
+    removed = [name for name in old_files if name not in scan or name in upsert]
+    return upsert, removed, entries
+
+def _ingest_units(name: str, digest: str) -> List[Tuple[str, str, str, int, int]]:
+    """把一个文件拆成子任务 (name, path, digest, 起始页, 结束页)；txt 只有一个子任务。"""
+    path = os.path.join(_DATA_DIR, name)
+    if path.lower().endswith(".txt"):
+        return [(name, path, digest, 0, 1)]
+    from pypdf import PdfReader
+
+    pages = len(PdfReader(path).pages)  # 只解析交叉引用表，不提取文本
+    return [
+        (name, path, digest, start, min(start + RAG_PAGES_PER_TASK, pages))
+        for start in range(0, pages, RAG_PAGES_PER_TASK)
+    ]
+
+def _unit_pages(unit: Tuple[str, str, str, int, int]) -> int:
+    """子任务的工作量（页）：PDF 为页区间长度，txt 按文件大小估算。"""
+    _, path, _, start, end = unit
+    if path.lower().endswith(".txt"):
+        try:
+            return max(1, os.path.getsize(path) // _TXT_PAGE_BYTES)
+        except OSError:
+            return 1
+    return end - start
+
+def _ingest_unit(name: str, path: str, digest: str, start: int, end: int) -> List[Tuple[str, str, Dict[str, Any]]]:
+    """
+    （可在子进程中执行）加载 [start, end) 页并逐页切分，返回 (chunk_id, 文本, metadata)。
+    chunk id = <文件名>:<sha256>:<页>:<序号>：带文件名避免同内容文件撞 id，内容不变则 id 不变。
+    """
+    if path.lower().endswith(".txt"):
+        pages = [(0, d) for d in TextLoader(path, autodetect_encoding=True).lazy_load()]
+    else:
+        from pypdf import PdfReader
+
+        reader = PdfReader(path)
+        # 与 PyPDFLoader 的 metadata 保持一致：source + page
+        pages = (
+            (i, Document(page_content=reader.pages[i].extract_text() or "", metadata={"source": path, "page": i}))
+            for i in range(start, end)
+        )
+    out: List[Tuple[str, str, Dict[str, Any]]] = []
+    for page_no, page in pages:
+        for j, split in enumerate(_TEXT_SPLITTER.split_documents([page])):
+            out.append((f"{name}:{digest}:{page_no}:{j}", split.page_content, split.metadata))
+    return out
+
+def _iter_chunk_batches(
+    files: List[Tuple[str, str]], failed: Set[str]
+) -> Iterator[List[Tuple[str, str, Document]]]:
+    """
+    流式切块：按页区间把子任务分发到进程池（同时在途的任务数有上限），
+    进程数不超过子任务数；总页数低于 RAG_INGEST_MIN_PAGES 时直接在当前进程内切块。
+    按提交顺序收集结果，每凑够 RAG_INGEST_BATCH 个块产出一批 (文件名, chunk_id, Document)。
+    失败的文件名记入 failed，其后续结果被丢弃。
+    """
+    units: List[Tuple[str, str, str, int, int]] = []
+    for name, digest in files:
+        try:
+            units.extend(_ingest_units(name, digest))
+        except Exception as e:
+            logger.error(f"加载文件失败 {name}: {e}")
+            failed.add(name)
+
+    workers = min(RAG_INGEST_WORKERS, len(units))
+    if workers > 1 and sum(_unit_pages(u) for u in units) < RAG_INGEST_MIN_PAGES:
+        workers = 1
+
+    def results():
+        if workers <= 1:
+            for unit in units:
+                try:
+                    yield unit, _ingest_unit(*unit)
+                except Exception as e:
+                    yield unit, e
+            return
+        # spawn：刷新可能发生在后台线程里，fork 带锁的进程不安全
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+            pending: deque = deque()
+            queued = iter(units)
+            for unit in queued:
+                pending.append((unit, pool.submit(_ingest_unit, *unit)))
+                if len(pending) >= workers * 2:
+                    break
+            while pending:
+                unit, fut = pending.popleft()
+                try:
+                    res = fut.result()
+                except Exception as e:
+                    res = e
+                nxt = next(queued, None)
+                if nxt is not None:
+                    pending.append((nxt, pool.submit(_ingest_unit, *nxt)))
+                yield unit, res
+
+    batch: List[Tuple[str, str, Document]] = []
+    for unit, res in results():
+        name = unit[0]
+        if isinstance(res, Exception):
+            logger.error(f"加载文件失败 {name}: {res}")
+            failed.add(name)
+            continue
+        if name in failed:
+            continue
+        batch.extend((name, cid, Document(page_content=text, metadata=meta)) for cid, text, meta in res)
+        if len(batch) >= RAG_INGEST_BATCH:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
 def _get_embeddings():
-    """获取Embedding模型，支持多种选项，优先使用本地模型"""
+    """获取Embedding模型（进程内只初始化一次；外面包一层磁盘向量缓存）"""
+    global _EMBEDDINGS
+    if _EMBEDDINGS is None:
+        _EMBEDDINGS = _create_embeddings()
+    return _EMBEDDINGS
+
+def _cached(embeddings) -> CachedEmbeddings:
+    return CachedEmbeddings(embeddings, namespace=_embeddings_id(embeddings))
+
+def _create_embeddings() -> CachedEmbeddings:
+    """创建Embedding模型，支持多种选项，优先使用本地模型"""
+    # 离线模式：按文本哈希生成确定性向量，不下载模型、不联网（检索结果无语义，只用于测性能）
+    if RAG_EMBEDDINGS == "fake":
+        from langchain_community.embeddings import DeterministicFakeEmbedding
+
+        logger.info("使用确定性伪 Embedding（RAG_EMBEDDINGS=fake）")
+        return _cached(DeterministicFakeEmbedding(size=384))
+
     # 选项1: 优先使用HuggingFace本地模型 (无需API密钥)
     try:
         from langchain_community.embeddings import HuggingFaceEmbeddings
         
         # 使用轻量级模型
         model_name = "sentence-transformers/all-MiniLM-L6-v2"
-        embeddings = HuggingFaceEmbeddings(model_name=model_name)
+        embeddings = _cached(HuggingFaceEmbeddings(model_name=model_name))
         logger.info(f"使用HuggingFace本地模型: {model_name}")
         return embeddings
     except ImportError:
@@ -87,8 +320,8 @@ def _get_embeddings():
     openai_api_key = os.getenv("OPENAI_API_KEY")
     if openai_api_key:
         try:
-            embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
-            # 测试embedding连接
+            embeddings = _cached(OpenAIEmbeddings(model="text-embedding-3-small"))
+            # 测试embedding连接（探测结果也走缓存，之后的进程不再重复调用）
             test_embedding = embeddings.embed_query("test")
             if not test_embedding or len(test_embedding) == 0:
                 raise ValueError("OpenAI Embedding测试失败")
@@ -102,11 +335,11 @@ def _get_embeddings():
     other_base_url = os.getenv("OTHER_EMBEDDING_BASE_URL")
     if other_api_key and other_base_url:
         try:
-            embeddings = OpenAIEmbeddings(
+            embeddings = _cached(OpenAIEmbeddings(
                 model="text-embedding-ada-002",  # 或其他模型名
                 api_key=other_api_key,
                 base_url=other_base_url,
-            )
+            ))
             test_embedding = embeddings.embed_query("test")
             if not test_embedding or len(test_embedding) == 0:
                 raise ValueError("其他Embedding服务测试失败")
@@ -118,42 +351,311 @@ def _get_embeddings():
     # 所有选项都失败
     raise RuntimeError("没有可用的Embedding服务，请配置至少一种Embedding选项")
 
-def _build_index() -> FAISS:
-    """加载+切块文档并构建 FAISS 索引（内存级）。"""
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=800, 
-        chunk_overlap=80,
-        separators=["\n\n", "\n", "。", "！", "？", "．", "!", "?", " ", ""]
+# -------------------- 近似最近邻索引 --------------------
+def _ann_factory(index_type: str, n: int, dim: int) -> Optional[str]:
+    """索引类型 -> faiss.index_factory 描述串；flat 或样本不足时返回 None。"""
+    if index_type == "flat" or n < _ANN_MIN_VECTORS:
+        return None
+    nlist = RAG_IVF_NLIST or max(16, int(4 * np.sqrt(n)))
+    nlist = min(nlist, n // 39 or 1)  # faiss 建议每个聚类至少 39 个训练点
+    pq_m = max(m for m in range(1, min(RAG_PQ_M, dim) + 1) if dim % m == 0)
+    factories = {
+        "ivf_flat": f"IVF{nlist},Flat",
+        "hnsw": f"HNSW{RAG_HNSW_M}",
+        "ivf_pq": f"IVF{nlist},PQ{pq_m}x{RAG_PQ_NBITS}",
+        "hnsw_pq": f"HNSW{RAG_HNSW_M}_PQ{pq_m}x{RAG_PQ_NBITS}",
+    }
+    if index_type not in factories:
+        raise ValueError(f"Unsupported RAG_INDEX_TYPE: {index_type}")
+    if index_type.endswith("_pq") and n < 39 * (1 << RAG_PQ_NBITS):
+        # PQ 码本训练点不足，退回不压缩的同类索引
+        index_type = index_type[: -len("_pq")] if index_type == "hnsw_pq" else "ivf_flat"
+    return factories[index_type]
+
+def _apply_search_params(raw_index, nprobe: int = RAG_NPROBE, ef_search: int = RAG_EF_SEARCH) -> None:
+    """设置检索期参数（对不支持该参数的索引类型忽略）。"""
+    import faiss
+
+    params = faiss.ParameterSpace()
+    for name, value in (("nprobe", nprobe), ("efSearch", ef_search)):
+        try:
+            params.set_index_parameter(raw_index, name, value)
+        except RuntimeError:
+            pass
+
+def _make_ann_index(vectors: np.ndarray, index_type: str = RAG_INDEX_TYPE):
+    """按类型创建索引，在随机样本上训练并加入全部向量。"""
+    import faiss
+
+    n, dim = vectors.shape
+    factory = _ann_factory(index_type, n, dim)
+    if factory is None:
+        if index_type != "flat":
+            logger.info(f"向量数 {n} < {_ANN_MIN_VECTORS}，{index_type} 退回 flat")
+        raw_index = faiss.IndexFlatL2(dim)
+    else:
+        raw_index = faiss.index_factory(dim, factory)
+        if not raw_index.is_trained:
+            rng = np.random.default_rng(0)
+            sample = vectors[rng.choice(n, size=min(n, RAG_TRAIN_SAMPLE), replace=False)]
+            logger.info(f"训练 {factory} 索引（样本 {len(sample)}）")
+            raw_index.train(sample)
+        _apply_search_params(raw_index)
+    raw_index.add(vectors)
+    return raw_index
+
+def _is_flat(raw_index) -> bool:
+    import faiss
+
+    return isinstance(raw_index, faiss.IndexFlat)
+
+def _from_vectors(ids: List[str], docs: List[Document], vectors: np.ndarray, embeddings) -> FAISS:
+    """用已有向量直接组装 LangChain FAISS（不再调用 Embedding）。"""
+    return FAISS(
+        embedding_function=embeddings,
+        index=_make_ann_index(vectors),
+        docstore=InMemoryDocstore(dict(zip(ids, docs))),
+        index_to_docstore_id=dict(enumerate(ids)),
     )
-    docs = _load_documents()
-    
-    if not docs:
-        # 构造一个兜底文档，避免空索引
-        logger.warning("未找到任何文档，创建默认文档")
-        docs = [Document(page_content="No local documents found in data/.")]
-    
-    splits = text_splitter.split_documents(docs)
-    logger.info(f"文档分割为 {len(splits)} 个块")
 
-    # 获取Embedding模型
+def _create_index(ids: List[str], docs: List[Document], embeddings) -> FAISS:
+    """全量创建索引：flat 走 LangChain 默认路径；ANN 类型先嵌入（命中缓存）再训练。"""
+    if RAG_INDEX_TYPE == "flat":
+        return FAISS.from_documents(docs, embeddings, ids=ids)
+    vectors = np.asarray(embeddings.embed_documents([d.page_content for d in docs]), dtype=np.float32)
+    return _from_vectors(ids, docs, vectors, embeddings)
+
+def _delete_ids(index: FAISS, ids: List[str], embeddings) -> FAISS:
+    """
+    删除 chunk。flat 索引原地删除；IVF/HNSW 的 remove_ids 不会重排位置（HNSW 甚至不支持），
+    与 LangChain 的位置映射不兼容，因此用剩余 chunk 重建（向量来自 Embedding 缓存，无需重新嵌入）。
+    """
+    if _is_flat(index.index):
+        index.delete(ids)
+        return index
+    drop = set(ids)
+    keep_ids = [cid for _, cid in sorted(index.index_to_docstore_id.items()) if cid not in drop]
+    if not keep_ids:
+        # 全部删除：交给调用方补兜底文档
+        return FAISS.from_documents(
+            [Document(page_content="No local documents found in data/.")], embeddings, ids=[_PLACEHOLDER_ID]
+        )
+    keep_docs = [index.docstore.search(cid) for cid in keep_ids]
+    return _create_index(keep_ids, keep_docs, embeddings)
+
+def _embeddings_id(embeddings) -> str:
+    """Embedding 模型标识；模型变化时持久化索引作废。"""
+    embeddings = getattr(embeddings, "underlying", embeddings)
+    model = getattr(embeddings, "model_name", None) or getattr(embeddings, "model", None) or ""
+    return f"{type(embeddings).__name__}:{model}"
+
+def _read_manifest() -> Dict[str, Any]:
+    try:
+        with open(_MANIFEST_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_index(index: FAISS, manifest: Dict[str, Any]) -> None:
+    """
+    先写索引再原子替换清单；清单里的 ntotal 用来发现“写了一半”的索引。
+    索引文件写到临时目录后 os.replace：旧快照可能正被内存映射读取，不能原地覆盖。
+    """
+    tmp_dir = os.path.join(_INDEX_DIR, ".tmp")
+    index.save_local(tmp_dir)
+    for name in ("index.faiss", "index.pkl"):
+        os.replace(os.path.join(tmp_dir, name), os.path.join(_INDEX_DIR, name))
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    manifest["ntotal"] = index.index.ntotal
+    tmp = _MANIFEST_PATH + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp, _MANIFEST_PATH)
+
+def _load_persisted(embeddings, mmap: bool) -> Optional[FAISS]:
+    """
+    从磁盘加载索引。mmap=True 时以只读内存映射方式打开（语料未变化的常见路径），
+    需要增量写入时用普通方式加载。
+    """
+    index_path = os.path.join(_INDEX_DIR, "index.faiss")
+    pkl_path = os.path.join(_INDEX_DIR, "index.pkl")
+    if not (os.path.exists(index_path) and os.path.exists(pkl_path)):
+        return None
+    try:
+        import faiss
+
+        flags = (faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY) if mmap else 0
+        raw_index = faiss.read_index(index_path, flags)
+        _apply_search_params(raw_index)
+        # index.pkl 由 FAISS.save_local 写出：(docstore, index_to_docstore_id)
+        with open(pkl_path, "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        return FAISS(
+            embedding_function=embeddings,
+            index=raw_index,
+            docstore=docstore,
+            index_to_docstore_id=index_to_docstore_id,
+        )
+    except Exception as e:
+        logger.error(f"加载持久化索引失败，将重建: {e}")
+        return None
+
+def _build_index(current: Optional[FAISS] = None) -> FAISS:
+    """
+    返回与 data/ 同步的 FAISS 索引：
+    - 语料未变化：沿用内存中的 current；没有则从磁盘（内存映射）加载，不做任何嵌入
+    - 有变化：只对新增/修改的文件切块嵌入并 upsert，删除/修改文件的旧 chunk 被移除
+    - 没有可用的持久化索引（或 Embedding 模型 / 索引类型变了）：全量构建
+    """
     embeddings = _get_embeddings()
-    
-    return FAISS.from_documents(splits, embeddings)
+    manifest = _read_manifest()
+    if manifest.get("embeddings") != _embeddings_id(embeddings) or manifest.get("index_type") != RAG_INDEX_TYPE:
+        manifest = {}
 
-def _get_index() -> FAISS:
-    """懒加载索引（首次调用时构建），支持定期刷新。"""
+    scan = _scan_data_dir()
+    upsert, removed, entries = _diff_manifest(manifest, scan)
+    changed = bool(upsert or removed)
+    if not changed and current is not None and manifest:
+        return current
+
+    index = _load_persisted(embeddings, mmap=not changed) if manifest else None
+    if index is not None and index.index.ntotal != manifest.get("ntotal"):
+        logger.warning("持久化索引与清单不一致，将全量重建")
+        index = None
+    if index is None:
+        # 全量：所有文件都需要嵌入
+        upsert, removed = list(scan), []
+        entries = {name: {**entries[name], "ids": []} for name in scan}
+        changed = True
+
+    if not changed:
+        logger.info(f"语料未变化，复用持久化索引（{index.index.ntotal} 个向量）")
+        return index
+
+    # 1) 移除被删除/修改文件的旧 chunk
+    old_files = manifest.get("files", {})
+    stale_ids = [cid for name in removed for cid in old_files.get(name, {}).get("ids", [])]
+    if index is not None and stale_ids:
+        index = _delete_ids(index, stale_ids, embeddings)
+
+    # 2) 流式切块新增/修改的文件，分批嵌入并写入索引
+    placeholder_only = index is not None and _PLACEHOLDER_ID in index.index_to_docstore_id.values()
+    build_fresh = index is None or placeholder_only  # 首次出现真实文档时按配置的索引类型全量创建
+    deferred_ids: List[str] = []
+    deferred_docs: List[Document] = []  # ANN 全量构建需要全部向量一起训练
+    added: Dict[str, List[str]] = {name: [] for name in upsert}
+    failed: Set[str] = set()
+    n_new = 0
+
+    for batch in _iter_chunk_batches([(name, entries[name]["sha256"]) for name in upsert], failed):
+        ids = [cid for _, cid, _ in batch]
+        docs = [doc for _, _, doc in batch]
+        for name, cid, _ in batch:
+            added[name].append(cid)
+        n_new += len(batch)
+        if build_fresh and RAG_INDEX_TYPE != "flat":
+            embeddings.embed_documents([d.page_content for d in docs])  # 分批嵌入（写入 Embedding 缓存）
+            deferred_ids.extend(ids)
+            deferred_docs.extend(docs)
+        elif build_fresh:
+            index = _create_index(ids, docs, embeddings)
+            build_fresh = False
+        else:
+            index.add_documents(docs, ids=ids)
+    if deferred_docs:
+        index = _create_index(deferred_ids, deferred_docs, embeddings)
+        build_fresh = False
+
+    # 失败的文件：撤回已写入的部分 chunk，下次刷新再试
+    partial = [cid for name in failed for cid in added.get(name, [])]
+    if partial and index is not None:
+        index = _delete_ids(index, partial, embeddings)
+    for name in upsert:
+        if name in failed:
+            entries.pop(name, None)
+        else:
+            entries[name]["ids"] = added[name]
+    logger.info(f"增量更新：嵌入 {n_new - len(partial)} 个块，移除 {len(stale_ids)} 个块（{len(upsert)} 个文件变化）")
+
+    # 3) 空语料时保留一个兜底文档，避免空索引
+    has_real_docs = any(e.get("ids") for e in entries.values())
+    if index is None:
+        logger.warning("未找到任何文档，创建默认文档")
+        index = FAISS.from_documents(
+            [Document(page_content="No local documents found in data/.")], embeddings, ids=[_PLACEHOLDER_ID]
+        )
+    elif not has_real_docs and index.index.ntotal == 0:
+        index.add_documents([Document(page_content="No local documents found in data/.")], ids=[_PLACEHOLDER_ID])
+
+    _save_index(index, {"embeddings": _embeddings_id(embeddings), "index_type": RAG_INDEX_TYPE, "files": entries})
+    return index
+
+def _swap_index(new_index: FAISS) -> None:
+    """原子替换快照：正在检索的请求继续使用旧对象，新请求拿到新对象。"""
     global _INDEX, _LAST_INDEX_TIME
-    
-    current_time = time.time()
-    
-    # 检查是否需要刷新索引（首次加载或超过刷新间隔）
-    if _INDEX is None or (current_time - _LAST_INDEX_TIME > _INDEX_REFRESH_INTERVAL):
-        logger.info("构建或刷新FAISS索引")
-        _INDEX = _build_index()
-        _LAST_INDEX_TIME = current_time
-    else:
-        logger.info("使用现有FAISS索引")
-    
+    _INDEX = new_index
+    _LAST_INDEX_TIME = time.time()
+
+def _refresh_loop() -> None:
+    """后台刷新线程：等待刷新请求或刷新间隔到期，然后在请求路径之外增量构建。"""
+    while True:
+        requested = _REFRESH_EVENT.wait(timeout=_INDEX_REFRESH_INTERVAL)
+        if requested:
+            time.sleep(_WATCH_DEBOUNCE)  # 合并短时间内的多次请求
+        _REFRESH_EVENT.clear()
+        try:
+            with _BUILD_LOCK:
+                new_index = _build_index(current=_INDEX)
+            if new_index is not _INDEX:
+                logger.info("后台刷新完成，已切换到新索引")
+            _swap_index(new_index)
+        except Exception as e:
+            logger.error(f"后台刷新索引失败，继续使用旧索引: {e}")
+
+def _start_watcher() -> None:
+    """data/ 有文件变化时发出刷新请求；未安装 watchdog 时只按时间间隔刷新。"""
+    if not (_WATCH_DATA_DIR and os.path.isdir(_DATA_DIR)):
+        return
+    try:
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+    except ImportError:
+        logger.info("未安装 watchdog，仅按时间间隔刷新索引（pip install watchdog 可开启文件监听）")
+        return
+
+    class _DataDirHandler(FileSystemEventHandler):
+        def on_any_event(self, event):
+            if not event.is_directory:
+                _REFRESH_EVENT.set()
+
+    observer = Observer()
+    observer.daemon = True
+    observer.schedule(_DataDirHandler(), _DATA_DIR, recursive=False)
+    observer.start()
+    logger.info(f"已开启 data/ 文件监听: {_DATA_DIR}")
+
+def _ensure_refresher() -> None:
+    """启动（一次）后台刷新线程与文件监听。"""
+    global _REFRESHER
+    if _REFRESHER is not None:
+        return
+    with _REFRESHER_LOCK:
+        if _REFRESHER is None:
+            _REFRESHER = threading.Thread(target=_refresh_loop, name="rag-refresher", daemon=True)
+            _REFRESHER.start()
+            _start_watcher()
+
+def _get_index() -> FAISS:
+    """
+    返回当前索引快照。
+    只有冷启动（进程内还没有索引）时同步加载；之后的刷新都在后台线程完成。
+    """
+    if _INDEX is None:
+        with _BUILD_LOCK:
+            if _INDEX is None:
+                logger.info("加载FAISS索引（冷启动）")
+                _swap_index(_build_index())
+    _ensure_refresher()
     return _INDEX
 
 @tool("local_search", return_direct=False)
@@ -195,13 +697,44 @@ def local_search(query: str, k: int = 4) -> List[str]:
         logger.error(f"检索过程中发生错误: {e}")
         return [f"检索失败: {str(e)}"]
 
+def _citation(metadata: Dict[str, Any]) -> str:
+    """chunk 的引用链接：file://<绝对路径>，PDF 追加 #page=<页码（从 1 开始）>"""
+    source = metadata.get("source") or ""
+    if not source:
+        return ""
+    url = Path(os.path.abspath(source)).as_uri()
+    page = metadata.get("page")
+    return f"{url}#page={int(page) + 1}" if isinstance(page, int) and source.lower().endswith(".pdf") else url
+
+def local_hits(query: str, k: int = 4) -> List[Dict[str, Any]]:
+    """
+    结构化的本地检索结果（不截断文本，不含占位文档）。
+
+    Returns:
+        List[Dict]: [{"text", "source"(file:// 引用), "score"(向量距离，越小越近)}]，按相似度排序；
+        检索失败时返回空列表。
+    """
+    try:
+        index = _get_index()
+        if set(index.index_to_docstore_id.values()) == {_PLACEHOLDER_ID}:
+            return []
+        pairs = index.similarity_search_with_score(query, k=k)
+    except Exception as e:
+        logger.error(f"本地检索失败: {e}")
+        return []
+    hits = []
+    for doc, score in pairs:
+        source = _citation(doc.metadata or {})
+        if source:
+            hits.append({"text": doc.page_content, "source": source, "score": float(score)})
+    return hits
+
 def get_tools():
     """返回可挂载到 Agent/Graph 的工具列表。"""
     return [local_search]
 
 def refresh_index():
-    """强制刷新索引（当数据目录有更新时调用）"""
-    global _INDEX, _LAST_INDEX_TIME
-    _INDEX = None
-    _LAST_INDEX_TIME = 0
-    logger.info("索引刷新已安排，将在下次查询时重建")
\ No newline at end of file
+    """请求刷新索引（非阻塞）：后台线程增量构建后切换，期间查询继续使用旧索引。"""
+    _REFRESH_EVENT.set()
+    _ensure_refresher()
+    logger.info("索引刷新已安排，将在后台完成")
\ No newline at end of file
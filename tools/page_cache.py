@@ -0,0 +1,230 @@
+# tools/page_cache.py
+"""
+网页持久化缓存（挂在 docsum.read_html 前面）
+- 以 URL 为键的索引（SQLite），正文按内容哈希存储（相同页面只存一份）
+- 同时保存原始 HTML、提取后的纯文本、切分后的 chunks
+- TTL 内直接命中，不访问网络；过期后用 ETag / Last-Modified 做条件请求，304 即续期
+- 总大小超过上限时按最近访问时间（LRU）淘汰
+
+目录结构：
+    <CACHE_DIR>/pages/index.sqlite
+    <CACHE_DIR>/pages/blobs/<sha256>/raw.html
+    <CACHE_DIR>/pages/blobs/<sha256>/derived.json   # {"version", "text", "chunks"}
+"""
+
+from __future__ import annotations
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from tools.cache import cache_path, connect
+
+logger = logging.getLogger(__name__)
+
+PAGE_CACHE_TTL = float(os.getenv("PAGE_CACHE_TTL", str(7 * 24 * 3600)))            # 新鲜期（秒）
+PAGE_CACHE_MAX_BYTES = int(os.getenv("PAGE_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))  # 总大小上限
+
+
+@dataclass
+class CachedPage:
+    url: str
+    content_hash: str
+    html: str
+    text: Optional[str]           # 版本不匹配时为 None，需要从 html 重新提取
+    chunks: Optional[List[str]]
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fetched_at: float
+
+    def is_fresh(self, ttl: float = PAGE_CACHE_TTL) -> bool:
+        return (time.time() - self.fetched_at) < ttl
+
+    def conditional_headers(self) -> Dict[str, str]:
+        """构造条件请求头（没有校验信息时为空）。"""
+        headers: Dict[str, str] = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class PageCache:
+    """URL -> 页面内容 的磁盘缓存；线程安全。"""
+
+    def __init__(self, root: Optional[str] = None, max_bytes: int = PAGE_CACHE_MAX_BYTES):
+        index_path = os.path.join(root, "index.sqlite") if root else cache_path("pages", "index.sqlite")
+        self._root = os.path.dirname(index_path)
+        self._blobs = os.path.join(self._root, "blobs")
+        os.makedirs(self._blobs, exist_ok=True)
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = connect(index_path)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                content_hash TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS blobs (content_hash TEXT PRIMARY KEY, size INTEGER NOT NULL)"
+        )
+        self._conn.commit()
+
+    # ---------- 读 ----------
+    def get(self, url: str, version: str) -> Optional[CachedPage]:
+        """
+        读取缓存条目并刷新访问时间；blob 丢失时视为未命中。
+        version: 提取/切分流水线的版本号；不一致时只返回 html，text/chunks 为 None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content_hash, etag, last_modified, fetched_at FROM pages WHERE url = ?", (url,)
+            ).fetchone()
+            if row is None:
+                return None
+            content_hash, etag, last_modified, fetched_at = row
+            blob_dir = os.path.join(self._blobs, content_hash)
+            try:
+                with open(os.path.join(blob_dir, "raw.html"), "r", encoding="utf-8") as f:
+                    html = f.read()
+            except OSError:
+                self._conn.execute("DELETE FROM pages WHERE url = ?", (url,))
+                self._conn.commit()
+                return None
+
+            text = chunks = None
+            try:
+                with open(os.path.join(blob_dir, "derived.json"), "r", encoding="utf-8") as f:
+                    derived = json.load(f)
+                if derived.get("version") == version:
+                    text, chunks = derived.get("text"), derived.get("chunks")
+            except (OSError, ValueError):
+                pass
+
+            self._conn.execute("UPDATE pages SET accessed_at = ? WHERE url = ?", (time.time(), url))
+            self._conn.commit()
+
+        return CachedPage(
+            url=url,
+            content_hash=content_hash,
+            html=html,
+            text=text,
+            chunks=chunks,
+            etag=etag,
+            last_modified=last_modified,
+            fetched_at=fetched_at,
+        )
+
+    # ---------- 写 ----------
+    def put(
+        self,
+        url: str,
+        html: str,
+        text: str,
+        chunks: List[str],
+        version: str,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ) -> None:
+        """写入/覆盖一条缓存，并在超出容量时触发 LRU 淘汰。"""
+        raw = html.encode("utf-8")
+        content_hash = hashlib.sha256(raw).hexdigest()
+        blob_dir = os.path.join(self._blobs, content_hash)
+        now = time.time()
+
+        with self._lock:
+            os.makedirs(blob_dir, exist_ok=True)
+            with open(os.path.join(blob_dir, "raw.html"), "wb") as f:
+                f.write(raw)
+            derived = json.dumps({"version": version, "text": text, "chunks": chunks}, ensure_ascii=False)
+            with open(os.path.join(blob_dir, "derived.json"), "w", encoding="utf-8") as f:
+                f.write(derived)
+            size = len(raw) + len(derived.encode("utf-8"))
+
+            old = self._conn.execute("SELECT content_hash FROM pages WHERE url = ?", (url,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO blobs (content_hash, size) VALUES (?, ?)", (content_hash, size)
+            )
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO pages (url, content_hash, etag, last_modified, fetched_at, accessed_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (url, content_hash, etag, last_modified, now, now),
+            )
+            if old and old[0] != content_hash:
+                self._drop_blob_if_orphan(old[0])
+            self._conn.commit()
+            self._evict_locked()
+
+    def update_derived(self, page: CachedPage, text: str, chunks: List[str], version: str) -> None:
+        """流水线版本变化后，用新提取结果覆盖 derived.json（不需要重新下载）。"""
+        derived = json.dumps({"version": version, "text": text, "chunks": chunks}, ensure_ascii=False)
+        with self._lock:
+            with open(os.path.join(self._blobs, page.content_hash, "derived.json"), "w", encoding="utf-8") as f:
+                f.write(derived)
+
+    def revalidated(self, url: str) -> None:
+        """条件请求返回 304：续期新鲜度。"""
+        with self._lock:
+            self._conn.execute("UPDATE pages SET fetched_at = ? WHERE url = ?", (time.time(), url))
+            self._conn.commit()
+
+    # ---------- 淘汰 ----------
+    def _drop_blob_if_orphan(self, content_hash: str) -> bool:
+        """没有 URL 再引用该 blob 时删除之；返回是否删除。"""
+        still_used = self._conn.execute(
+            "SELECT 1 FROM pages WHERE content_hash = ? LIMIT 1", (content_hash,)
+        ).fetchone()
+        if still_used:
+            return False
+        self._conn.execute("DELETE FROM blobs WHERE content_hash = ?", (content_hash,))
+        shutil.rmtree(os.path.join(self._blobs, content_hash), ignore_errors=True)
+        return True
+
+    def _evict_locked(self) -> None:
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+        if total <= self._max_bytes:
+            return
+        rows = self._conn.execute(
+            """
+            SELECT p.url, p.content_hash, b.size FROM pages p JOIN blobs b USING (content_hash)
+            ORDER BY p.accessed_at ASC
+            """
+        ).fetchall()
+        for url, content_hash, size in rows:
+            if total <= self._max_bytes:
+                break
+            self._conn.execute("DELETE FROM pages WHERE url = ?", (url,))
+            if self._drop_blob_if_orphan(content_hash):
+                total -= size
+            logger.info(f"Page cache evicted: {url}")
+        self._conn.commit()
+
+
+_PAGE_CACHE: Optional[PageCache] = None
+_PAGE_CACHE_LOCK = threading.Lock()
+
+
+def get_page_cache() -> PageCache:
+    """进程级单例。"""
+    global _PAGE_CACHE
+    if _PAGE_CACHE is None:
+        with _PAGE_CACHE_LOCK:
+            if _PAGE_CACHE is None:
+                _PAGE_CACHE = PageCache()
+    return _PAGE_CACHE
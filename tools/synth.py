@@ -3,26 +3,39 @@
 将若干 chunks（文本分块）与 sources（来源 URL）综合为结构化笔记 Notes(JSON)：
 - 字段：summary, key_points[], claims[{text, evidence_urls[]}], open_questions[]
 - 使用 PydanticOutputParser 做强约束输出，自动校验 claims.evidence_urls 非空
-- 提供 Tool：synth_notes
+- 增量模式：传入上一轮的 Notes，只把新读到的 chunks 交给模型，模型返回增量（NotesDelta），
+  再按规范化文本合并去重（claims 合并 evidence_urls），证据跨轮累积而不是每轮重写
+- chunks 先经 context_pack 去重、按与主题的相关性排序并装入 token 预算（不再固定截取前 N 段）；
+  调用方已经打包过（例如 research_graph 按来源打包）时传 pack=False，原样送入
+- 提供 Tool：synth_notes；异步调用用 asynthesize_notes
 """
 
 from __future__ import annotations
 
 import os
+import re
 import json
-from typing import List, Optional
+import logging
+import unicodedata
+from typing import Any, Callable, Dict, List, Optional, Union
 
 from dotenv import load_dotenv
 from pydantic import BaseModel, Field, AnyUrl, model_validator
 
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import PydanticOutputParser
-from langchain_openai import ChatOpenAI
+from langchain_core.exceptions import OutputParserException
 from langchain_core.documents import Document
 from langchain_core.tools import tool
 
+from configs.llm import get_chat_model
+from configs.llm_cache import evict_response
+from tools.context_pack import pack_context
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # ---------------- Pydantic 模型（强约束） ----------------
 
 class Claim(BaseModel):
@@ -42,19 +55,22 @@ class Notes(BaseModel):
     claims: List[Claim] = Field(..., description="带有可验证引用的陈述列表")
     open_questions: List[str] = Field(..., description="仍未解决/需要进一步研究的问题")
 
+
+class NotesDelta(BaseModel):
+    """增量综合的输出：只包含相对已有笔记的新增/变化部分。"""
+    summary: str = Field(..., description="结合新材料更新后的完整 summary")
+    key_points: List[str] = Field(default_factory=list, description="新增的要点（已有要点不要重复）")
+    claims: List[Claim] = Field(default_factory=list, description="新增的陈述；已有陈述获得新证据时，原文照抄并给出新的 evidence_urls")
+    open_questions: List[str] = Field(default_factory=list, description="更新后的完整未解决问题列表（已解决的删除）")
+
 # 方便外部做类型提示
 NotesDict = dict
 
 # ---------------- LLM 工厂（DeepSeek） ----------------
 
-def _llm(max_tokens: Optional[int] = 512):
-    return ChatOpenAI(
-        model="deepseek-chat",
-        api_key=os.getenv("DEEPSEEK_API_KEY"),
-        base_url="https://api.deepseek.com",
-        temperature=0.2,
-        max_tokens=max_tokens,  # 兜底限长
-    )
+def _llm(max_tokens: Optional[int] = 512, cache: bool = True):
+    # 进程级复用的客户端（共享连接池）；max_tokens 兜底限长；cache=False 关闭响应缓存
+    return get_chat_model("deepseek", temperature=0.2, max_tokens=max_tokens, cache=cache)
 
 # ---------------- 综合链（Prompt + Parser） ----------------
 
@@ -97,44 +113,200 @@ def _build_prompt(parser: PydanticOutputParser) -> ChatPromptTemplate:
 
     return prompt
 
-def synthesize_notes(
+def _build_delta_prompt(parser: PydanticOutputParser) -> ChatPromptTemplate:
+    """
+    增量综合：已有笔记只给出紧凑文本（summary / key_points / claims 原文），只附本轮新材料。
+    输入变量：topic、previous、chunks、sources、target_words、format_instructions
+    """
+    fi_escaped = parser.get_format_instructions().replace("{", "{{").replace("}", "}}")
+
+    system = (
+        "你是一位严谨的研究助理。你已经有一份研究笔记，现在拿到了新的文本分块（chunks）和来源（sources）。"
+        "只输出相对已有笔记的增量，严格遵守格式约束与事实，不要编造引用。"
+    )
+    human = (
+        "主题（可选）：{topic}\n\n"
+        "【已有笔记】：\n{previous}\n\n"
+        "【新材料 - chunks】（可能被截断，需去重、合并同类项）：\n{chunks}\n\n"
+        "【来源 - sources】（可选，用于引用）：\n{sources}\n\n"
+        "请完成：\n"
+        "- summary：结合新材料改写后的完整 summary，最多约 {target_words} 字\n"
+        "- key_points：只列新增要点；claims：只列新增陈述，或已有陈述（原文照抄）的新证据，每条至少 1 个 evidence_urls\n"
+        "- open_questions：更新后的完整列表（删除已被新材料回答的问题）\n"
+        "- 只使用给定 sources 或 chunks 中可推断的链接作为 evidence，不要虚构\n\n"
+        "必须严格输出以下格式：\n"
+        "{format_instructions}"
+    )
+    return ChatPromptTemplate.from_messages(
+        [("system", system), ("human", human)]
+    ).partial(format_instructions=fi_escaped)
+
+# ---------------- 增量合并 ----------------
+
+def _normalize_text(text: str) -> str:
+    """用于去重的规范化：NFKC、小写、去掉标点与空白。"""
+    return re.sub(r"[\W_]+", "", unicodedata.normalize("NFKC", text).lower())
+
+def _as_notes(notes: Union[Notes, Dict[str, Any]]) -> Notes:
+    return notes if isinstance(notes, Notes) else Notes.model_validate(notes)
+
+def _render_previous(notes: Notes) -> str:
+    lines = [f"summary: {notes.summary}", "key_points:"]
+    lines += [f"- {p}" for p in notes.key_points]
+    lines.append("claims:")
+    lines += [f"- {c.text}" for c in notes.claims]
+    lines.append("open_questions:")
+    lines += [f"- {q}" for q in notes.open_questions]
+    return "\n".join(lines)
+
+def merge_notes(previous: Union[Notes, Dict[str, Any]], delta: NotesDelta) -> Notes:
+    """
+    把增量合并进已有笔记：
+    - claims 按规范化文本去重；同一陈述的 evidence_urls 取并集（保持先后顺序）
+    - key_points 按规范化文本去重追加
+    - summary / open_questions 以增量为准（增量为空时保留原值）
+    """
+    prev = _as_notes(previous)
+
+    claims: Dict[str, Claim] = {}
+    for c in list(prev.claims) + list(delta.claims):
+        key = _normalize_text(c.text)
+        if not key:
+            continue
+        if key in claims:
+            known = {str(u) for u in claims[key].evidence_urls}
+            extra = [u for u in c.evidence_urls if str(u) not in known]
+            claims[key] = Claim(text=claims[key].text, evidence_urls=list(claims[key].evidence_urls) + extra)
+        else:
+            claims[key] = c
+
+    key_points: List[str] = []
+    seen_points = set()
+    for p in list(prev.key_points) + list(delta.key_points):
+        key = _normalize_text(p)
+        if key and key not in seen_points:
+            seen_points.add(key)
+            key_points.append(p)
+
+    return Notes(
+        summary=delta.summary or prev.summary,
+        key_points=key_points,
+        claims=list(claims.values()),
+        open_questions=delta.open_questions or prev.open_questions,
+    )
+
+def _synthesis_chain(
     chunks: List[str] | List[Document],
-    sources: List[str] | None = None,
-    topic: str | None = None,
-    target_words: int = 200,
-) -> Notes:
+    sources: List[str] | None,
+    topic: str | None,
+    target_words: int,
+    use_cache: bool,
+    token_budget: Optional[int],
+    previous_notes: Union[Notes, Dict[str, Any], None],
+    pack: bool = True,
+):
     """
-    综合 chunks + sources，返回 Notes（Pydantic 对象）。
-    - chunks: 文本分块（str 或 Document 均可）
-    - sources: URL 列表
-    - topic: 主题（可选）
-    - target_words: summary 最大字数（建议 150~300）
+    同步/异步共用：打包上下文并组装链，返回 (chain, inputs, previous, evict)；previous 非空时链输出 NotesDelta。
+    evict() 删除本次请求的 LLM 缓存条目（响应在解析前就已写入缓存，解析失败时用它清掉坏结果）。
     """
-    # 统一把 Document 转为字符串
+    # 统一把 Document 转为字符串（Document 的 source 用于来源多样性）
     _chunks: List[str] = []
+    _chunk_sources: List[Optional[str]] = []
     for c in chunks:
         if isinstance(c, Document):
             _chunks.append(c.page_content)
+            _chunk_sources.append(c.metadata.get("source"))
         else:
             _chunks.append(str(c))
+            _chunk_sources.append(None)
+    if pack:
+        _chunks = pack_context(_chunks, query=topic or "", sources=_chunk_sources, budget=token_budget).chunks
 
     _sources = sources or []
+    model = _llm(cache=use_cache)
+    llm = model.with_config(metadata={"call_site": "synthesize"})  # 供 chains/instrumentation 归类 token
+    inputs: Dict[str, Any] = {
+        "topic": topic or "",
+        "chunks": "\n\n---\n\n".join(_chunks),
+        "sources": "\n".join(_sources[:30]),
+        "target_words": target_words,
+    }
+
+    previous = None
+    if previous_notes:
+        previous = _as_notes(previous_notes)
+        parser = PydanticOutputParser(pydantic_object=NotesDelta)
+        inputs["previous"] = _render_previous(previous)
+        prompt = _build_delta_prompt(parser)
+    else:
+        parser = PydanticOutputParser(pydantic_object=Notes)
+        prompt = _build_prompt(parser)
 
-    parser = PydanticOutputParser(pydantic_object=Notes)
-    prompt = _build_prompt(parser)
-    llm = _llm()
+    def evict() -> None:
+        evict_response(model, prompt.invoke(inputs).to_messages())
 
-    chain = prompt | llm | parser  # LCEL：提示 -> 模型 -> 结构化解析
+    return prompt | llm | parser, inputs, previous, evict  # LCEL：提示 -> 模型 -> 结构化解析
+
+def _parse_failed(attempt: int, evict: Callable[[], None], e: OutputParserException) -> None:
+    """解析失败：清掉缓存里的坏响应；第一次失败重试一次，否则抛出。"""
+    evict()
+    if attempt:
+        raise e
+    logger.warning(f"综合输出解析失败，已清除对应的 LLM 缓存并重试一次: {e}")
+
+def synthesize_notes(
+    chunks: List[str] | List[Document],
+    sources: List[str] | None = None,
+    topic: str | None = None,
+    target_words: int = 200,
+    use_cache: bool = True,
+    token_budget: Optional[int] = None,
+    previous_notes: Union[Notes, Dict[str, Any], None] = None,
+    pack: bool = True,
+) -> Notes:
+    """
+    综合 chunks + sources，返回 Notes（Pydantic 对象）。
+    - chunks: 文本分块（str 或 Document 均可）
+    - sources: URL 列表
+    - topic: 主题（可选）
+    - target_words: summary 最大字数（建议 150~300）
+    - use_cache: 是否使用 LLM 响应缓存
+    - token_budget: 分块部分的 token 上限（默认 CONTEXT_TOKEN_BUDGET）
+    - previous_notes: 上一轮的 Notes；给出时走增量模式，chunks 只需包含新读到的材料
+    - pack: False 表示 chunks 已经打包（去重/排序/预算）过，原样送入，token_budget 不再生效
+    """
+    chain, inputs, previous, evict = _synthesis_chain(
+        chunks, sources, topic, target_words, use_cache, token_budget, previous_notes, pack
+    )
+    for attempt in range(2):
+        try:
+            result = chain.invoke(inputs)
+            break
+        except OutputParserException as e:
+            _parse_failed(attempt, evict, e)
+    return merge_notes(previous, result) if previous is not None else result
 
-    result: Notes = chain.invoke(
-        {
-            "topic": topic or "",
-            "chunks": "\n\n---\n\n".join(_chunks[:30]),  # 防止一次性喂太多
-            "sources": "\n".join(_sources[:30]),
-            "target_words": target_words,
-        }
+async def asynthesize_notes(
+    chunks: List[str] | List[Document],
+    sources: List[str] | None = None,
+    topic: str | None = None,
+    target_words: int = 200,
+    use_cache: bool = True,
+    token_budget: Optional[int] = None,
+    previous_notes: Union[Notes, Dict[str, Any], None] = None,
+    pack: bool = True,
+) -> Notes:
+    """synthesize_notes 的异步版本（chain.ainvoke），参数含义相同。"""
+    chain, inputs, previous, evict = _synthesis_chain(
+        chunks, sources, topic, target_words, use_cache, token_budget, previous_notes, pack
     )
-    return result
+    for attempt in range(2):
+        try:
+            result = await chain.ainvoke(inputs)
+            break
+        except OutputParserException as e:
+            _parse_failed(attempt, evict, e)
+    return merge_notes(previous, result) if previous is not None else result
 
 # ---------------- Tool 封装（可在 Graph/Agent 中直接用） ----------------
 
@@ -143,6 +315,8 @@ class SynthArgs(BaseModel):
     sources: List[str] = Field(default_factory=list, description="可选：引用 URL 列表")
     topic: str | None = Field(default=None, description="可选：主题说明")
     target_words: int = Field(200, ge=80, le=600, description="summary 目标最大字数")
+    previous_notes: Optional[Dict[str, Any]] = Field(default=None, description="可选：上一轮的 Notes(JSON 对象)，给出时做增量综合")
+    pack: bool = Field(True, description="是否在工具内打包 chunks；已打包过时传 False，原样送入")
 
 def _convert_anyurl_to_str(obj):
     """递归转换对象中的 AnyUrl 为字符串，以便 JSON 序列化"""
@@ -159,15 +333,28 @@ def _convert_anyurl_to_str(obj):
         return obj
 
 @tool("synth_notes", args_schema=SynthArgs)
-def synth_notes_tool(chunks: List[str], sources: List[str] | None = None, topic: str | None = None, target_words: int = 200) -> str:
+def synth_notes_tool(
+    chunks: List[str],
+    sources: List[str] | None = None,
+    topic: str | None = None,
+    target_words: int = 200,
+    previous_notes: Optional[Dict[str, Any]] = None,
+    pack: bool = True,
+) -> str:
     """
     综合输出 Notes(JSON 字符串)。用于在 Agent/Graph 中作为工具调用。
     """
-    notes = synthesize_notes(chunks=chunks, sources=sources or [], topic=topic, target_words=target_words)
-    
+    notes = synthesize_notes(
+        chunks=chunks, sources=sources or [], topic=topic, target_words=target_words,
+        previous_notes=previous_notes, pack=pack,
+    )
+    return notes_to_json(notes)
+
+def notes_to_json(notes: Notes) -> str:
+    """Notes -> JSON 字符串（与 synth_notes 工具的输出一致）"""
     # 转换 AnyUrl 为字符串以便 JSON 序列化
     notes_dict = _convert_anyurl_to_str(notes)
-    
+
     return json.dumps(notes_dict, indent=2, ensure_ascii=False)
 
 def get_tools():
@@ -4,6 +4,16 @@ Web 搜索工具（DuckDuckGo），无需 API Key。
 提供两个函数：
 - web_search(query, max_results=5): 返回若干条搜索结果（title, href, snippet）
 - get_tools(): 返回 LangChain Tool 列表，供 Agent/Graph 挂载
+- search_cache_stats(): 搜索缓存的命中/未命中计数
+
+搜索结果按“规范化查询”缓存在 SQLite 中（大小写、空白、普通词词序不同的查询共用一条；符号、运算符、引号短语保留），
+SEARCH_CACHE_TTL 秒内重复查询不再访问 DuckDuckGo；SEARCH_CACHE_TTL=0 关闭缓存。
+
+SEARCH_BACKEND 可替换搜索后端：默认 "ddg"；也可写 "模块:函数"（签名同 _ddg_search，
+返回 [{"title","href","snippet"}]），例如离线基准用的 "eval.fakes:fake_search"。
+
+限流与重试：每次访问后端都先取全局 "search" 令牌（configs/ratelimit.py，按调用方优先级排队）；
+DuckDuckGo 限流/超时按抖动指数退避重试（RATE_RETRY_ATTEMPTS 次），限流时整桶暂停，所有并发运行一起退让。
 
 依赖：
     pip install duckduckgo-search
@@ -22,10 +32,85 @@ get_tools()：返回符合 LangChain Tool 接口的封装，用于在 Agent/Grap
 场景：当 Agent 需要联网查资料时调用。
 """
 
-from typing import List, Dict
+import os
+import re
+import importlib
+import unicodedata
+from typing import Any, Callable, Dict, List, Optional
 from duckduckgo_search import DDGS
+from duckduckgo_search.exceptions import RatelimitException, TimeoutException
 from langchain_core.tools import tool
 
+from tools.cache import TTLCache
+from configs.ratelimit import call_with_retry
+
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", str(24 * 3600)))  # 搜索缓存有效期（秒）
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "ddg")                       # "ddg" 或 "模块:函数"
+
+_TOKEN_RE = re.compile(r'"[^"]*"|\S+')
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_SEARCH_CACHE: Optional[TTLCache] = None
+
+
+def _normalize_query(query: str) -> str:
+    """
+    规范化查询作为缓存键：只做 NFKC、小写和空白折叠。
+    纯单词（只含字母/数字/下划线）去重后按字母排序，其余词元原样按原顺序保留：
+    符号（c++、c#）、运算符（-x、site:、filetype:）和引号短语（"new york"）都会改变搜索结果。
+    例如 "Tutorial LangGraph" 与 "langgraph  tutorial" 得到同一个键，"c++ tutorial" 与 "c tutorial" 不同。
+    """
+    text = unicodedata.normalize("NFKC", query).lower()
+    words, specials = set(), []
+    for token in _TOKEN_RE.findall(text):
+        if _WORD_RE.fullmatch(token):
+            words.add(token)
+        else:
+            specials.append(" ".join(token.split()))
+    return " ".join(sorted(words)) + "\t" + " ".join(specials)
+
+
+def _search_cache() -> Optional[TTLCache]:
+    global _SEARCH_CACHE
+    if SEARCH_CACHE_TTL <= 0:
+        return None
+    if _SEARCH_CACHE is None:
+        _SEARCH_CACHE = TTLCache("search", ttl=SEARCH_CACHE_TTL)
+    return _SEARCH_CACHE
+
+
+def _ddg_search(query: str, max_results: int) -> List[Dict[str, str]]:
+    """实际访问 DuckDuckGo。"""
+    results: List[Dict[str, str]] = []
+    with DDGS() as ddgs:
+        for r in ddgs.text(query, max_results=max_results):
+            results.append({
+                "title": r.get("title", ""),
+                "href": r.get("href", ""),
+                "snippet": r.get("body", ""),
+            })
+    return results
+
+
+_BACKEND: Optional[Callable[[str, int], List[Dict[str, str]]]] = None
+
+
+def _search_backend() -> Callable[[str, int], List[Dict[str, str]]]:
+    """按 SEARCH_BACKEND 解析搜索后端（首次调用时导入）。"""
+    global _BACKEND
+    if _BACKEND is None:
+        if SEARCH_BACKEND == "ddg":
+            _BACKEND = _ddg_search
+        else:
+            module, _, attr = SEARCH_BACKEND.partition(":")
+            _BACKEND = getattr(importlib.import_module(module), attr)
+    return _BACKEND
+
+
+def search_cache_stats() -> Dict[str, Any]:
+    """搜索缓存命中统计：{hits, misses, hit_rate}"""
+    cache = _search_cache()
+    return cache.stats.snapshot() if cache else {"hits": 0, "misses": 0, "hit_rate": 0.0}
+
 
 @tool("web_search", return_direct=False)
 def web_search(query: str, max_results: int = 5) -> List[Dict[str, str]]:
@@ -39,14 +124,22 @@ def web_search(query: str, max_results: int = 5) -> List[Dict[str, str]]:
     Returns:
         List[Dict[str, str]]: 每条包含 {"title","href","snippet"}。
     """
-    results: List[Dict[str, str]] = []
-    with DDGS() as ddgs:
-        for r in ddgs.text(query, max_results=max_results):
-            results.append({
-                "title": r.get("title", ""),
-                "href": r.get("href", ""),
-                "snippet": r.get("body", ""),
-            })
+    cache = _search_cache()
+    key = f"{_normalize_query(query)}|{max_results}"
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    # 受全局 "search" 限速约束（见 configs/ratelimit.py），缓存命中不限速；限流/超时退避重试
+    results = call_with_retry(
+        "search", _search_backend(), query, max_results,
+        retry_on=(TimeoutException, TimeoutError, ConnectionError),
+        rate_limited=(RatelimitException,),
+    )
+    # 空结果多半是限流/网络抖动，不缓存
+    if cache is not None and results:
+        cache.set(key, results)
     return results
 
 